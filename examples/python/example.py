@@ -4,6 +4,7 @@
 """
 
 import config
+from pijaz.exceptions import PijazError
 from pijaz.server_manager import PijazServerManager
 from pijaz.product import PijazProduct
 
@@ -40,13 +41,17 @@ productOptions = {
   'message': 'world',
   'color': 'black',
 }
-url = product.generateUrl(productOptions)
+try:
+  url = product.generateUrl(productOptions)
+except PijazError as e:
+  url = None
+  print(e)
 message = ''
 if url:
   message = "URL: " + url
 else:
   message = "URL generation error"
-print "\n" + message + "\n";
+print("\n" + message + "\n")
 
 
 # The saveToFile method provides a convenient way to save a product to a file.
@@ -54,11 +59,15 @@ fileProductOptions = {
   'message': 'world file',
   'color': 'yellow',
 }
-result = product.saveToFile(config.IMAGE_FILEPATH, fileProductOptions);
+try:
+  result = product.saveToFile(config.IMAGE_FILEPATH, fileProductOptions)
+except PijazError as e:
+  result = None
+  print(e)
 message = ''
 if result:
   message = "Product file saved to: " + config.IMAGE_FILEPATH
 else:
   message = "Product file save error"
-print "\n" + message + "\n";
+print("\n" + message + "\n")
 
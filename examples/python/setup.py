@@ -14,6 +14,7 @@ setuptools.setup(name='pijaz-sdk-example',
   long_description=README,
   classifiers=[
     "Programming Language :: Python",
+    "Programming Language :: Python :: 3",
     "Intended Audience :: Developers",
     "License :: OSI Approved :: MIT License",
     "Topic :: Artistic Software",
@@ -30,5 +31,6 @@ setuptools.setup(name='pijaz-sdk-example',
   include_package_data=True,
   zip_safe=False,
   install_requires=requires,
+  python_requires='>=3.7',
 )
 
@@ -0,0 +1,249 @@
+"""
+
+  Benchmarks for the Pijaz Python SDK hot paths, run against a local stub
+  API/rendering server:
+
+    url-*: generateUrl() throughput, with memoized and unique parameters, and
+      generateUrls() throughput.
+    token-*: buildRenderCommand() latency with a warm and a cold token cache.
+    save-*: saveToFiles() throughput per image size and concurrency level.
+    memory-*: Peak Python heap allocated per request or product.
+
+  Usage:
+
+    python benchmarks/run_benchmarks.py [--quick] [--json results.json]
+      [--baseline baseline.json] [--tolerance 0.2]
+
+  When a baseline file from a previous --json run is supplied, the script
+  exits with status 1 if any benchmark regressed by more than the tolerance.
+
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from pijaz.product import PijazProduct
+from pijaz.server_manager import PijazServerManager
+from stub_server import PijazStubServer
+
+WORKFLOW_ID = 'benchmark-workflow'
+IMAGE_SIZES = [10 * 1024, 256 * 1024, 2 * 1024 * 1024]
+CONCURRENCY_LEVELS = [1, 4, 16]
+
+def buildProduct(stub, concurrency=1):
+  """
+    Create a server manager and product pointed at the stub server.
+  """
+  server = PijazServerManager({
+    'appId': 'benchmark',
+    'apiKey': 'benchmark',
+    'apiServer': stub.getUrl(),
+    'renderServer': stub.getUrl(),
+    'httpPoolMaxSize': max(concurrency, 10),
+  })
+  return PijazProduct({
+    'serverManager': server,
+    'workflowId': WORKFLOW_ID,
+    'renderParameters': {
+      'xml': 'http://example.com/benchmark.xml',
+    },
+  })
+
+def result(value, unit, higherIsBetter):
+  return {
+    'value': value,
+    'unit': unit,
+    'higherIsBetter': higherIsBetter,
+  }
+
+def benchmarkUrls(stub, iterations):
+  """
+    Measure generateUrl() and generateUrls() throughput.
+  """
+  results = {}
+  product = buildProduct(stub)
+  product.generateUrl()
+
+  start = time.perf_counter()
+  for i in range(iterations):
+    product.generateUrl({'message': 'hello'})
+  results['url-memoized'] = result(iterations / (time.perf_counter() - start), 'ops/s', True)
+
+  start = time.perf_counter()
+  for i in range(iterations):
+    product.generateUrl({'message': 'hello %d' % i})
+  results['url-unique'] = result(iterations / (time.perf_counter() - start), 'ops/s', True)
+
+  start = time.perf_counter()
+  for url in product.generateUrls({'message': 'hello %d' % i} for i in range(iterations)):
+    pass
+  results['url-bulk'] = result(iterations / (time.perf_counter() - start), 'ops/s', True)
+  return results
+
+def benchmarkTokens(stub, iterations):
+  """
+    Measure buildRenderCommand() latency with a warm and a cold token cache.
+  """
+  results = {}
+  product = buildProduct(stub)
+  server = product.serverManager
+  options = {
+    'product': product,
+    'renderParameters': {'workflow': WORKFLOW_ID},
+  }
+  server.buildRenderCommand(options)
+
+  start = time.perf_counter()
+  for i in range(iterations):
+    server.buildRenderCommand(options)
+  results['token-hit'] = result((time.perf_counter() - start) / iterations * 1e6, 'us', False)
+
+  missIterations = max(iterations // 100, 10)
+  start = time.perf_counter()
+  for i in range(missIterations):
+    server.getTokenCache().clear()
+    server.buildRenderCommand(options)
+  results['token-miss'] = result((time.perf_counter() - start) / missIterations * 1e6, 'us', False)
+  return results
+
+def benchmarkDownloads(stub, count, sizes, levels):
+  """
+    Measure saveToFiles() throughput per image size and concurrency level.
+  """
+  results = {}
+  directory = tempfile.mkdtemp(prefix='pijaz-benchmark-')
+  try:
+    for size in sizes:
+      for concurrency in levels:
+        product = buildProduct(stub, concurrency)
+        product.generateUrl()
+        items = [(os.path.join(directory, '%d.jpg' % i), {'size': size, 'message': str(i)})
+          for i in range(count)]
+        start = time.perf_counter()
+        saved = product.saveToFiles(items, concurrency)
+        elapsed = time.perf_counter() - start
+        failures = [item for item in saved if not item['success']]
+        if failures:
+          raise RuntimeError("Download benchmark failed: %s" % failures[0])
+        name = 'save-%dk-c%d' % (size // 1024, concurrency)
+        results[name] = result(count / elapsed, 'files/s', True)
+        results[name + '-mbps'] = result(count * size / elapsed / (1024 * 1024), 'MiB/s', True)
+  finally:
+    shutil.rmtree(directory)
+  return results
+
+def benchmarkMemory(stub, count):
+  """
+    Measure the peak Python heap allocated per request or product.
+  """
+  results = {}
+  directory = tempfile.mkdtemp(prefix='pijaz-benchmark-')
+  try:
+    product = buildProduct(stub)
+    product.generateUrl()
+
+    tracemalloc.start()
+    products = [PijazProduct({'template': product}) for i in range(count)]
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del products
+    results['memory-product'] = result(peak / float(count), 'bytes/product', False)
+
+    tracemalloc.start()
+    for i in range(count):
+      product.generateUrl({'message': 'memory %d' % i})
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    results['memory-url'] = result(peak / float(count), 'bytes/req', False)
+
+    size = IMAGE_SIZES[-1]
+    # tracemalloc traces the in-process stub server too, build its payload
+    # before tracing so that only the SDK's allocations are measured.
+    stub.payload(size)
+    tracemalloc.start()
+    for i in range(count // 10 or 1):
+      product.saveToFile(os.path.join(directory, 'memory.jpg'), {'size': size, 'message': str(i)})
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    results['memory-save-%dk' % (size // 1024)] = result(peak, 'bytes peak', False)
+  finally:
+    shutil.rmtree(directory)
+  return results
+
+def compare(results, baseline, tolerance):
+  """
+    Compare results to a baseline.
+
+    Returns:
+      A list of regression descriptions.
+  """
+  regressions = []
+  for name in sorted(results):
+    if name not in baseline:
+      continue
+    current = results[name]['value']
+    previous = baseline[name]['value']
+    if not previous:
+      continue
+    if results[name]['higherIsBetter']:
+      change = (previous - current) / previous
+    else:
+      change = (current - previous) / previous
+    if change > tolerance:
+      regressions.append("%s: %.2f %s (baseline %.2f, %.0f%% worse)"
+        % (name, current, results[name]['unit'], previous, change * 100))
+  return regressions
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark the Pijaz Python SDK against a local stub server.')
+  parser.add_argument('--quick', action='store_true', help='Run fewer iterations.')
+  parser.add_argument('--json', help='Write the results to this JSON file.')
+  parser.add_argument('--baseline', help='Compare the results to this JSON file from a previous run.')
+  parser.add_argument('--tolerance', type=float, default=0.2,
+    help='Allowed fractional regression against the baseline. Default: 0.2')
+  args = parser.parse_args()
+
+  iterations = 2000 if args.quick else 20000
+  downloads = 20 if args.quick else 100
+  sizes = IMAGE_SIZES[:2] if args.quick else IMAGE_SIZES
+
+  stub = PijazStubServer().start()
+  try:
+    results = {}
+    results.update(benchmarkUrls(stub, iterations))
+    results.update(benchmarkTokens(stub, iterations))
+    results.update(benchmarkDownloads(stub, downloads, sizes, CONCURRENCY_LEVELS))
+    results.update(benchmarkMemory(stub, downloads * 10))
+  finally:
+    stub.stop()
+
+  for name in sorted(results):
+    print("%-24s %14.2f %s" % (name, results[name]['value'], results[name]['unit']))
+
+  if args.json:
+    with open(args.json, 'w') as f:
+      json.dump(results, f, indent=2, sort_keys=True)
+
+  if args.baseline:
+    with open(args.baseline) as f:
+      baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+      print("\nRegressions:")
+      for regression in regressions:
+        print("  " + regression)
+      return 1
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
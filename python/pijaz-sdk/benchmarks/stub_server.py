@@ -0,0 +1,198 @@
+"""
+
+  Local stand-in for the Pijaz API server and rendering server, used by the
+  benchmarks.
+
+  get-token: Returns a rendering access token with the usual result/info JSON
+    envelope, or refuses it with a non-zero result_num. The 'delay' query
+    parameter adds server-side latency in seconds.
+  render-image: Returns an image body of 'size' bytes (default 10000), with
+    an ETag if one is configured, or an empty 304 response to a conditional
+    request for the configured ETag. Configured error statuses are returned
+    first, one per request.
+
+  PUBLIC METHODS:
+
+  __init__(inParameters)
+  count(command)
+  getCounts()
+  getUrl()
+  nextRenderStatus()
+  payload(size)
+  start()
+  stop()
+
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+class _StubRequestHandler(BaseHTTPRequestHandler):
+  """
+    Request handler for the stub server.
+  """
+
+  protocol_version = 'HTTP/1.1'
+  # Headers and body are written separately, avoid delayed ACK stalls.
+  disable_nagle_algorithm = True
+
+  def log_message(self, format, *args):
+    pass
+
+  def do_GET(self):
+    url = urlparse(self.path)
+    query = dict(parse_qsl(url.query))
+    stub = self.server.stub
+    if url.path.endswith('/get-token'):
+      stub.count('get-token')
+      delay = float(query.get('delay', stub.tokenDelay))
+      if delay:
+        time.sleep(delay)
+      response = {
+        'result': {
+          'result_num': stub.tokenResultNum,
+          'result_text': stub.tokenResultText,
+        },
+      }
+      if stub.tokenResultNum == 0:
+        response['info'] = {
+          'lifetime': stub.tokenLifetime,
+          'token': 'stub-token-%d' % stub.getCounts()['get-token'],
+        }
+      body = json.dumps(response).encode('utf-8')
+      self.__respond(200, 'application/json', body)
+    elif url.path.endswith('/render-image'):
+      stub.count('render-image')
+      status = stub.nextRenderStatus()
+      if status is not None:
+        self.__respond(status, 'text/plain', b'Error')
+        return
+      headers = {'ETag': stub.renderEtag} if stub.renderEtag else {}
+      if stub.renderEtag and self.headers.get('If-None-Match', None) == stub.renderEtag:
+        stub.count('not-modified')
+        self.__respond(304, 'image/jpeg', b'', headers)
+      else:
+        self.__respond(200, 'image/jpeg', stub.payload(int(query.get('size', stub.DEFAULT_SIZE))), headers)
+    else:
+      self.__respond(404, 'text/plain', b'Not found')
+
+  def __respond(self, status, contentType, body, headers=None):
+    self.send_response(status)
+    self.send_header('Content-Type', contentType)
+    for name, value in (headers or {}).items():
+      self.send_header(name, value)
+    if status != 304:
+      self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+class PijazStubServer(object):
+  """
+    Threaded local HTTP server serving the get-token and render-image
+    endpoints.
+  """
+
+  DEFAULT_SIZE = 10000
+
+  # PUBLIC METHODS.
+
+  def __init__(self, inParameters=None):
+    """
+      Inits a StubServer object.
+
+      Args:
+
+        inParameters: Optional. A dictionary with the following key/value pairs.
+          renderEtag: Optional. The ETag of rendered products. Default: None
+          renderStatuses: Optional. A list of HTTP status codes returned to
+            the first render-image requests, one per request, before they
+            succeed. Default: []
+          tokenDelay: Optional. Seconds of simulated latency for get-token
+            requests. Default: 0
+          tokenLifetime: Optional. Lifetime in seconds of issued tokens.
+            Default: 3600
+          tokenResultNum: Optional. The result_num of get-token responses,
+            tokens are refused if it is not 0. Default: 0
+          tokenResultText: Optional. The result_text of get-token responses.
+            Default: 'OK'
+    """
+    params = inParameters or {}
+    self.renderEtag = params.get('renderEtag', None)
+    self.renderStatuses = list(params.get('renderStatuses', []))
+    self.tokenDelay = params.get('tokenDelay', 0)
+    self.tokenLifetime = params.get('tokenLifetime', 3600)
+    self.tokenResultNum = params.get('tokenResultNum', 0)
+    self.tokenResultText = params.get('tokenResultText', 'OK')
+    self.counts = {
+      'get-token': 0,
+      'render-image': 0,
+      'not-modified': 0,
+    }
+    self.payloads = {}
+    self.lock = threading.Lock()
+    self.server = None
+    self.thread = None
+
+  def count(self, command):
+    """
+      Record a request to an endpoint.
+    """
+    with self.lock:
+      self.counts[command] += 1
+
+  def getCounts(self):
+    """
+      Get the number of requests served per endpoint.
+
+      Returns:
+        A dictionary of endpoint name to request count.
+    """
+    with self.lock:
+      return dict(self.counts)
+
+  def getUrl(self):
+    """
+      Get the base URL of the server, with a trailing slash.
+    """
+    return 'http://%s:%d/' % self.server.server_address
+
+  def nextRenderStatus(self):
+    """
+      Take the next configured error status of render-image requests.
+
+      Returns:
+        The HTTP status code, or None once all of them were returned.
+    """
+    with self.lock:
+      return self.renderStatuses.pop(0) if self.renderStatuses else None
+
+  def payload(self, size):
+    """
+      Get a fake image body of the given size, built once per size.
+    """
+    with self.lock:
+      if size not in self.payloads:
+        self.payloads[size] = (b'\xff\xd8' + b'\x00' * size)[:size]
+      return self.payloads[size]
+
+  def start(self):
+    """
+      Start serving on a free local port, in a background thread.
+    """
+    self.server = ThreadingHTTPServer(('127.0.0.1', 0), _StubRequestHandler)
+    self.server.daemon_threads = True
+    self.server.stub = self
+    self.thread = threading.Thread(target=self.server.serve_forever)
+    self.thread.daemon = True
+    self.thread.start()
+    return self
+
+  def stop(self):
+    """
+      Stop the server.
+    """
+    self.server.shutdown()
+    self.server.server_close()
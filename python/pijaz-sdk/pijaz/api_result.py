@@ -0,0 +1,64 @@
+"""
+
+  PUBLIC METHODS:
+
+  __init__(success, data, statusCode)
+  get(key, default)
+  keys()
+
+"""
+
+class PijazApiResult(object):
+  """
+    Result of an API command.
+
+    The outcome is available as attributes. For compatibility with earlier
+    releases, which returned a dictionary, the result can also be read with
+    result['success'] and result['data'].
+
+    Attributes:
+      success: True if the command succeeded, False otherwise.
+      data: If the command succeeded, a dictionary containing the response
+        data, if not, a string containing the error message or the response
+        body.
+      statusCode: The HTTP status code of the response.
+  """
+
+  __slots__ = ('success', 'data', 'statusCode')
+
+  KEYS = ('success', 'data', 'statusCode')
+
+  # PUBLIC METHODS.
+
+  def __init__(self, success, data, statusCode=None):
+    """
+      Inits an ApiResult object.
+    """
+    self.success = success
+    self.data = data
+    self.statusCode = statusCode
+
+  def __contains__(self, key):
+    return key in self.KEYS
+
+  def __getitem__(self, key):
+    if key not in self.KEYS:
+      raise KeyError(key)
+    return getattr(self, key)
+
+  def __repr__(self):
+    return "PijazApiResult(success=%r, data=%r, statusCode=%r)" % (self.success, self.data, self.statusCode)
+
+  def get(self, key, default=None):
+    """
+      Get a field of the result by name, as for a dictionary.
+    """
+    if key not in self.KEYS:
+      return default
+    return getattr(self, key)
+
+  def keys(self):
+    """
+      Get the names of the fields of the result, as for a dictionary.
+    """
+    return list(self.KEYS)
@@ -0,0 +1,392 @@
+"""
+
+  Requires the aiohttp package, install with: pip install pijaz-sdk[async]
+
+  PUBLIC METHODS:
+
+  fetchBytes(additionalParams)
+  generateUrl(additionalParams)
+  generateUrls(additionalParamsList)
+  iterContent(additionalParams, chunkSize)
+  saveToFile(filepath,additionalParams)
+  saveToFileObject(fileobj, additionalParams)
+  saveToFiles(items, maxWorkers)
+
+  PROTECTED METHODS:
+
+  _getPropertyDefaults()
+  _loadPropertyDefaults()
+  _openRenderStream(additionalParams, headers)
+
+  PRIVATE METHODS:
+
+  __download(additionalParams)
+  __downloadToCache(renderCache, key, additionalParams)
+  __downloadToFile(filepath, additionalParams)
+  __fetchToCache(renderCache, key, additionalParams)
+  __iterChunks(response, download, chunkSize)
+  __openCached(renderCache, additionalParams)
+  __saveBatchItem(result, additionalParams)
+  __writeChunks(response, download, fileobj)
+
+"""
+
+import asyncio
+import contextlib
+import os
+import time
+
+import aiohttp
+
+from pijaz.exceptions import PijazFileError, PijazHttpError, PijazRenderError
+from pijaz.product import _NO_PARAMETERS, PijazProduct
+
+class AsyncPijazProduct(PijazProduct):
+
+  """
+    Manages a renderable product for asyncio applications.
+
+    Instantiated with the same parameters as PijazProduct, the serverManager
+    must be an instance of the AsyncPijazServerManager class.
+  """
+
+  __slots__ = ()
+
+  # PUBLIC METHODS.
+
+  async def fetchBytes(self, additionalParams=None):
+    """
+      Fetch a rendered product into memory.
+
+      See PijazProduct.fetchBytes() for the arguments and return value.
+    """
+    await self._loadPropertyDefaults()
+    renderCache = self.serverManager.getRenderCache()
+    if renderCache is not None:
+      cachedFile = await self.__openCached(renderCache, additionalParams)
+      if cachedFile is None:
+        return None
+      with cachedFile:
+        return cachedFile.read()
+    return await self.serverManager.coalesceDownload(self._downloadKey('bytes', additionalParams),
+      lambda: self.__download(additionalParams))
+
+  async def generateUrl(self, additionalParams=None):
+    """
+      Build a fully formed URL which can be used to make a request for the
+      product from a rendering server.
+
+      Args:
+        additionalParams: Optional. A dictionary of additional render parameters
+        to be used for this request only.
+
+      Returns:
+        A fully formed URL that can be used in a render server HTTP request.
+    """
+    await self._loadPropertyDefaults()
+    additionalParams = additionalParams or {}
+    finalParams = self._setFinalParams(additionalParams)
+    options = {
+      'product': self,
+      'renderParameters': finalParams,
+    }
+    return await self.serverManager.buildRenderUrl(options)
+
+  async def generateUrls(self, additionalParamsList):
+    """
+      Lazily build render request URLs for many variants of the product.
+
+      See PijazProduct.generateUrls() for the arguments. Returns an
+      asynchronous generator of URLs.
+    """
+    await self._loadPropertyDefaults()
+    options = {
+      'product': self,
+      'renderParameters': self._setFinalParams(),
+    }
+    async for url in self.serverManager.buildRenderUrls(options,
+        (self._normalizeParams(additionalParams) for additionalParams in additionalParamsList)):
+      yield url
+
+  async def iterContent(self, additionalParams=None, chunkSize=None):
+    """
+      Stream a product from the rendering server as chunks of bytes.
+
+      See PijazProduct.iterContent() for the arguments.
+
+      Returns:
+        An asynchronous generator of byte strings.
+    """
+    async with self._openRenderStream(additionalParams) as (r, download):
+      if r.status != 200:
+        raise PijazRenderError("Failed fetching image from %s, status: %s" % (download['url'], r.status))
+      async for chunk in self.__iterChunks(r, download, chunkSize):
+        yield chunk
+
+  async def saveToFile(self, filepath, additionalParams=None):
+    """
+      Convenience method for saving a product directly to a file.
+
+      This takes care of generating the render URL, making the request to the
+      render server for the product, and saving to a file. The product is
+      streamed to a temporary file in fixed-size chunks, which is renamed into
+      place once complete. If the server manager has a render cache, the
+      product is served from it when possible, and stored in it otherwise.
+
+      Concurrent saves of the same product share a single download, which is
+      saved to the file of the first caller, and copied from it to the files
+      of the others.
+
+      Args:
+        filepath: Required. The full file path.
+        additionalParams: Optional. A dictionary of additional render parameters to be
+        used for this request only.
+
+      Returns:
+        True on successful save of the file, False otherwise.
+    """
+    await self._loadPropertyDefaults()
+    renderCache = self.serverManager.getRenderCache()
+    if renderCache is not None:
+      cachedFile = await self.__openCached(renderCache, additionalParams)
+      if cachedFile is None:
+        return False
+      with cachedFile:
+        self._copyFile(cachedFile, filepath)
+      return True
+    savedPath = await self.serverManager.coalesceDownload(self._downloadKey('file', additionalParams),
+      lambda: self.__downloadToFile(filepath, additionalParams))
+    if savedPath is None:
+      return False
+    if savedPath != filepath:
+      self._copyFile(savedPath, filepath)
+    return True
+
+  async def saveToFileObject(self, fileobj, additionalParams=None):
+    """
+      Stream a product into a file-like object.
+
+      See PijazProduct.saveToFileObject() for the arguments and return value.
+    """
+    async with self._openRenderStream(additionalParams) as (r, download):
+      if r.status != 200:
+        return False
+      await self.__writeChunks(r, download, fileobj)
+      return True
+
+  async def saveToFiles(self, items, maxWorkers=None):
+    """
+      Save many variants of the product to files concurrently.
+
+      See PijazProduct.saveToFiles() for the arguments and return value.
+      Items are consumed lazily by maxWorkers tasks, so large batches can be
+      read from a generator.
+    """
+    items = iter(items)
+    results = []
+
+    async def work():
+      # Taking an item and adding its result happen in a single step, so
+      # results stay in input order.
+      for filepath, additionalParams in items:
+        result = {
+          'filepath': filepath,
+          'success': False,
+          'error': None,
+          'duration': None,
+        }
+        results.append(result)
+        await self.__saveBatchItem(result, additionalParams)
+
+    await asyncio.gather(*[work() for i in range(maxWorkers or self.BATCH_MAX_WORKERS)])
+    return results
+
+  # PROTECTED METHODS.
+
+  def _getPropertyDefaults(self):
+    """
+      Get the default values of the workflow's render parameters.
+
+      The coroutines of the product load the workflow definition with
+      _loadPropertyDefaults() before building a render request. Called from
+      the event loop before it is loaded, the definition is loaded in the
+      default executor, and render parameters are not normalized until then.
+    """
+    if self.productPropertyDefaults is not None:
+      return self.productPropertyDefaults
+    workflowDefaults = self.serverManager.getWorkflowDefaults()
+    if workflowDefaults is None:
+      return _NO_PARAMETERS
+    xml = self.renderParameters.get('xml', None)
+    try:
+      asyncio.get_running_loop()
+    except RuntimeError:
+      return workflowDefaults.get(self.workflowId, xml)
+    defaults = workflowDefaults.peek(self.workflowId, xml)
+    if defaults is None:
+      asyncio.get_event_loop().run_in_executor(None, workflowDefaults.get, self.workflowId, xml)
+      return _NO_PARAMETERS
+    return defaults
+
+  async def _loadPropertyDefaults(self):
+    """
+      Load the default values of the workflow's render parameters, if not
+      loaded yet, so that the first render request of a workflow is
+      normalized like the next ones.
+    """
+    if self.productPropertyDefaults is not None:
+      return
+    workflowDefaults = self.serverManager.getWorkflowDefaults()
+    if workflowDefaults is not None:
+      await workflowDefaults.getAsync(self.workflowId, self.renderParameters.get('xml', None))
+
+  @contextlib.asynccontextmanager
+  async def _openRenderStream(self, additionalParams=None, headers=None):
+    """
+      Request a product from the rendering server, without reading the body.
+      Yields the response and the download info, the response is released and
+      the download reported to the instrumentation on exit. The render
+      limiter of the server manager is respected.
+    """
+    url = await self.generateUrl(additionalParams)
+    if url is None:
+      raise PijazRenderError("Failed building a render URL for workflow %s, no valid rendering access token" % self.workflowId)
+    # Hold a render slot until the body is read, not just for the request.
+    async with self.serverManager.getRenderLimiter().limitAsync():
+      startTime = time.time()
+      try:
+        r = await self.serverManager.sendRenderRequest(url, headers)
+      except PijazHttpError as e:
+        raise PijazRenderError("Failed fetching image from %s" % url) from e
+      download = {
+        'url': url,
+        'statusCode': r.status,
+        'timeToFirstByte': time.time() - startTime,
+        'bytes': 0,
+      }
+      try:
+        yield r, download
+      finally:
+        r.release()
+        download['duration'] = time.time() - startTime
+        self.serverManager.getInstrumentation().onDownload(download)
+
+  # PRIVATE METHODS.
+
+  async def __download(self, additionalParams=None):
+    """
+      Download a product into memory.
+    """
+    async with self._openRenderStream(additionalParams) as (r, download):
+      if r.status == 200:
+        return b''.join([chunk async for chunk in self.__iterChunks(r, download)])
+    return None
+
+  async def __downloadToCache(self, renderCache, key, additionalParams=None):
+    """
+      Download a product into the render cache. Expired products with
+      validators are revalidated with a conditional request.
+    """
+    headers = self._conditionalHeaders(renderCache.getValidators(key))
+    cachedPath = None
+    notModified = False
+    async with self._openRenderStream(additionalParams, headers) as (r, download):
+      if r.status == 304 and headers is not None:
+        notModified = True
+        cachedPath = renderCache.revalidate(key)
+      elif r.status == 200:
+        # Written as it arrives, rather than held in memory until complete.
+        writer = renderCache.openWriter(key, self._responseValidators(r.headers),
+          r.headers.get('Content-Type', None))
+        try:
+          async for chunk in self.__iterChunks(r, download):
+            writer.write(chunk)
+        except BaseException:
+          writer.abort()
+          raise
+        cachedPath = writer.commit()
+    if notModified and cachedPath is None:
+      # Evicted while revalidating, fetch the product in full.
+      return await self.__downloadToCache(renderCache, key, additionalParams)
+    return cachedPath
+
+  async def __downloadToFile(self, filepath, additionalParams=None):
+    """
+      Stream a product to a temporary file, renamed into place once complete.
+    """
+    async with self._openRenderStream(additionalParams) as (r, download):
+      if r.status != 200:
+        return None
+      tempPath = self._tempFilePath(filepath)
+      try:
+        with open(tempPath, 'wb') as f:
+          await self.__writeChunks(r, download, f)
+        os.replace(tempPath, filepath)
+        return filepath
+      except (IOError, OSError) as e:
+        raise PijazFileError("Failed writing file %s" % filepath) from e
+      finally:
+        if os.path.exists(tempPath):
+          os.remove(tempPath)
+
+  async def __fetchToCache(self, renderCache, key, additionalParams=None):
+    """
+      Make sure a product is in the render cache, fetching it if needed.
+      Concurrent fetches of the same product share a single download.
+    """
+    cachedPath = renderCache.get(key)
+    if cachedPath is None:
+      cachedPath = await self.serverManager.coalesceDownload(('cache', key),
+        lambda: self.__downloadToCache(renderCache, key, additionalParams))
+    return cachedPath
+
+  async def __iterChunks(self, response, download, chunkSize=None):
+    """
+      Read a streamed response body in chunks, counting the bytes received.
+    """
+    try:
+      async for chunk in response.content.iter_chunked(chunkSize or self.DOWNLOAD_CHUNK_SIZE):
+        download['bytes'] += len(chunk)
+        yield chunk
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+      raise PijazRenderError("Failed fetching image from %s" % download['url']) from e
+
+  async def __openCached(self, renderCache, additionalParams=None):
+    """
+      Open the cached file of a product, fetching the product into the render
+      cache if needed. A file evicted between the lookup and the open is
+      fetched again.
+
+      Returns:
+        The file object, open for reading in binary mode, or None if the render
+        request failed.
+    """
+    key = renderCache.buildKey(self._setFinalParams(additionalParams))
+    for attempt in range(2):
+      cachedPath = await self.__fetchToCache(renderCache, key, additionalParams)
+      if cachedPath is None:
+        return None
+      try:
+        return open(cachedPath, 'rb')
+      except FileNotFoundError:
+        # Evicted since the lookup, or removed by another process.
+        renderCache.remove(key)
+    raise PijazFileError("Failed opening cached file %s" % cachedPath)
+
+  async def __saveBatchItem(self, result, additionalParams):
+    """
+      Save one item of a batch, recording the outcome in the result.
+    """
+    startTime = time.time()
+    try:
+      result['success'] = await self.saveToFile(result['filepath'], additionalParams)
+    except Exception as e:
+      result['error'] = e
+    result['duration'] = time.time() - startTime
+
+  async def __writeChunks(self, response, download, fileobj):
+    """
+      Copy a streamed response body into a file-like object.
+    """
+    async for chunk in self.__iterChunks(response, download):
+      fileobj.write(chunk)
@@ -0,0 +1,464 @@
+"""
+
+  Requires the aiohttp package, install with: pip install pijaz-sdk[async]
+
+  PUBLIC METHODS:
+
+  __init__(inParameters)
+  buildRenderCommand(inParameters)
+  buildRenderUrl(inParameters)
+  buildRenderUrls(inParameters, additionalParamsList)
+  close()
+  coalesceDownload(key, downloadFunction)
+  getHttpSession()
+  prewarmTokens(workflows, pin)
+  sendApiCommand(inParameters)
+  sendRenderRequest(url, headers)
+  unpinTokens(workflows)
+
+  PRIVATE METHODS:
+
+  __fetchAccessInfo(key, workflow, xml)
+  __finishAccessInfoRequest(key, task)
+  __getAccessInfo(renderParameters)
+  __httpRequest(url, method, data)
+  __refreshPinnedTokens()
+  __requestAccessInfo(key, workflow, xml)
+  __requestNewAccessInfo(key, workflow, xml)
+  __sendApiCommand(params)
+
+"""
+
+import asyncio
+import time
+
+import aiohttp
+
+from pijaz.exceptions import PijazApiError, PijazHttpError
+from pijaz.server_manager import PijazServerManager
+
+class AsyncPijazServerManager(PijazServerManager):
+  """
+    Server manager class for asyncio applications, makes non-blocking calls
+    to a Pijaz API service and/or rendering service.
+  """
+
+  ASYNC_HTTP_POOL_MAXSIZE = 100
+
+  # PUBLIC METHODS.
+
+  def __init__(self, inParameters):
+    """
+      Inits an AsyncServerManager object.
+
+      Args:
+
+        inParameters: A dictionary with the same key/value pairs as
+          PijazServerManager, with the following differences.
+          httpSession: Optional. An aiohttp.ClientSession instance used for all
+            requests to the API and rendering servers. If not supplied, a
+            session is created on first use, from within the running event
+            loop.
+          httpPoolMaxSize: Optional. Maximum number of connections to keep open
+            per host in the created session. Default: 100
+    """
+    params = dict(inParameters)
+    clientSession = params.pop('httpSession', None)
+    PijazServerManager.__init__(self, params)
+    self.clientSession = clientSession
+    self.httpPoolMaxSize = params.get('httpPoolMaxSize', self.ASYNC_HTTP_POOL_MAXSIZE)
+    self.pendingAccessInfo = {}
+    self.pinnedTokens = {}
+    self.pinTask = None
+    self.pinEvent = None
+
+  async def buildRenderCommand(self, inParameters):
+    """
+      Build the set of query parameters for a render request.
+
+      Args:
+        inParameters: A dictionary with the following key/value pairs:
+          product: An instance of the AsyncPijazProduct class.
+          renderParameters: A dictionary of all params sent to the render request.
+
+      Returns:
+        If successful, a mapping of query parameters to pass to the rendering
+        server. These can be converted into a full URL by calling
+        buildRenderServerUrlRequest(params).
+    """
+    params = inParameters
+    startTime = time.time()
+    accessInfo = await self.__getAccessInfo(params['renderParameters'])
+    allowed = self._isRenderRequestAllowed(accessInfo)
+    queryParams = None
+    if allowed:
+      queryParams = self._buildRenderServerQueryParams(params, accessInfo)
+    self._instrumentRenderCommand(params['renderParameters']['workflow'], startTime, allowed)
+    return queryParams
+
+  async def buildRenderUrl(self, inParameters):
+    """
+      Build a fully qualified render request URL for a product.
+
+      See PijazServerManager.buildRenderUrl() for the arguments and return
+      value.
+    """
+    params = inParameters
+    startTime = time.time()
+    accessInfo = await self.__getAccessInfo(params['renderParameters'])
+    allowed = self._isRenderRequestAllowed(accessInfo)
+    url = None
+    if allowed:
+      url = self._buildMemoizedRenderUrl(params, accessInfo)
+    self._instrumentRenderCommand(params['renderParameters']['workflow'], startTime, allowed)
+    return url
+
+  async def buildRenderUrls(self, inParameters, additionalParamsList):
+    """
+      Lazily build render request URLs for many variants of a product.
+
+      See PijazServerManager.buildRenderUrls() for the arguments. Returns an
+      asynchronous generator of URLs.
+    """
+    params = inParameters
+    workflow = params['renderParameters']['workflow']
+    encodedPairs = None
+    refreshAt = None
+    for additionalParams in additionalParamsList:
+      if refreshAt is None or time.time() > refreshAt:
+        startTime = time.time()
+        accessInfo = await self.__getAccessInfo(params['renderParameters'])
+        allowed = self._isRenderRequestAllowed(accessInfo)
+        if allowed:
+          encodedPairs = self._encodeQueryPairs(self._buildRenderServerQueryParams(params, accessInfo))
+          refreshAt = self.tokenCache.refreshTimestamp(accessInfo)
+        else:
+          encodedPairs = None
+          refreshAt = None
+        self._instrumentRenderCommand(workflow, startTime, allowed)
+      if encodedPairs is None:
+        yield None
+      else:
+        yield self._buildRenderUrlFromPairs(encodedPairs, additionalParams, params['renderParameters'])
+
+  async def close(self):
+    """
+      Close the HTTP session and release its pooled connections, and stop
+      refreshing pinned tokens.
+    """
+    if self.pinTask is not None:
+      self.pinTask.cancel()
+      self.pinTask = None
+      self.pinEvent = None
+    if self.clientSession is not None:
+      await self.clientSession.close()
+      self.clientSession = None
+
+  async def coalesceDownload(self, key, downloadFunction):
+    """
+      Run a product download, unless an identical download is already in
+      flight, in which case await its result instead.
+
+      See PijazServerManager.coalesceDownload() for the arguments, the
+      downloadFunction being a coroutine function.
+    """
+    if self.downloadFlight is None:
+      return await downloadFunction()
+    return await self.downloadFlight.doAsync(key, downloadFunction)
+
+  def getHttpSession(self):
+    """
+      Get the HTTP session used for requests to the API and rendering servers.
+      Must be called from within the running event loop.
+
+      Returns:
+        The aiohttp.ClientSession instance.
+    """
+    if self.clientSession is None:
+      connector = aiohttp.TCPConnector(limit=0, limit_per_host=self.httpPoolMaxSize)
+      timeout = aiohttp.ClientTimeout(connect=self.httpTimeout[0], sock_read=self.httpTimeout[1])
+      self.clientSession = aiohttp.ClientSession(connector=connector, timeout=timeout)
+    return self.clientSession
+
+  async def prewarmTokens(self, workflows, pin=True):
+    """
+      Fetch rendering access tokens for a set of workflows concurrently, so
+      that first render requests do not wait on the API server.
+
+      See PijazServerManager.prewarmTokens() for the arguments and return
+      value. Pinned tokens are refreshed by a task on the running event loop,
+      until close() is called.
+    """
+    targets = self._tokenTargets(workflows)
+    keys = [self.tokenCache.buildKey(workflow, xml) for workflow, xml in targets]
+    awaitables = []
+    for key, (workflow, xml) in zip(keys, targets):
+      if pin:
+        self.tokenCache.pin(key, None)
+      accessInfo = self.tokenCache.get(key)
+      if accessInfo is None:
+        awaitables.append(self.__fetchAccessInfo(key, workflow, xml))
+      else:
+        awaitables.append(asyncio.sleep(0, accessInfo))
+    fetched = await asyncio.gather(*awaitables, return_exceptions=True)
+    results = []
+    for key, (workflow, xml), accessInfo in zip(keys, targets, fetched):
+      error = accessInfo if isinstance(accessInfo, Exception) else None
+      results.append({
+        'workflow': workflow,
+        'xml': xml,
+        'success': error is None and accessInfo is not None,
+        'error': error,
+      })
+      if pin:
+        self.pinnedTokens[key] = (workflow, xml)
+    if pin and self.pinnedTokens:
+      if self.pinTask is None:
+        self.pinEvent = asyncio.Event()
+        self.pinTask = asyncio.ensure_future(self.__refreshPinnedTokens())
+      else:
+        # Have the running task schedule the new keys.
+        self.pinEvent.set()
+    return results
+
+  async def sendApiCommand(self, inParameters):
+    """
+      Send a command to the API server.
+
+      See PijazServerManager.sendApiCommand() for the supported parameters and
+      return value.
+    """
+    return await self.__sendApiCommand(inParameters)
+
+  async def sendRenderRequest(self, url, headers=None):
+    """
+      Send a request to the rendering server over the pooled HTTP session.
+      Transport errors and retryable status codes are retried according to the
+      retry policy. A URL pinned to a rendering server that has since been
+      ejected is sent to another server.
+
+      Args:
+        url: Required. A fully qualified render request URL, as returned by
+          buildRenderServerUrlRequest().
+        headers: Optional. A dictionary of additional request headers.
+
+      Returns:
+        The aiohttp.ClientResponse of the last attempt, with its body not yet
+        read. Call release() on it once done.
+
+      Raises:
+        PijazHttpError: The request failed at the transport level.
+    """
+    url = self.renderServers.reroute(url)
+
+    async def sendAttempt(attempt):
+      try:
+        with self.renderServers.track(url) as request:
+          r = await self.getHttpSession().get(url, headers=headers)
+          request.success = r.status < 500
+          return r
+      except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise PijazHttpError("HTTP request error, method: GET, url: %s" % url) from e
+
+    return await self.retryPolicy.executeAsync(url, sendAttempt,
+      lambda r: r.status,
+      lambda r: r.headers.get('Retry-After', None),
+      lambda r: r.close())
+
+  def unpinTokens(self, workflows):
+    """
+      Stop keeping the tokens of workflows pinned by prewarmTokens() refreshed
+      in the background.
+
+      Args:
+        workflows: Required. An iterable of workflow IDs or dictionaries, as
+          passed to prewarmTokens().
+    """
+    for workflow, xml in self._tokenTargets(workflows):
+      key = self.tokenCache.buildKey(workflow, xml)
+      self.tokenCache.unpin(key)
+      self.pinnedTokens.pop(key, None)
+    if self.pinEvent is not None:
+      self.pinEvent.set()
+
+  # PRIVATE METHODS.
+
+  def __fetchAccessInfo(self, key, workflow, xml):
+    """
+      Start a get-token request for a cache key, unless one is already in
+      flight, and return an awaitable for its result.
+    """
+    task = self.pendingAccessInfo.get(key, None)
+    if task is None:
+      task = asyncio.ensure_future(self.__requestAccessInfo(key, workflow, xml))
+      self.pendingAccessInfo[key] = task
+      task.add_done_callback(lambda t: self.__finishAccessInfoRequest(key, t))
+    return asyncio.shield(task)
+
+  def __finishAccessInfoRequest(self, key, task):
+    """
+      Clean up after a get-token request completes.
+    """
+    if self.pendingAccessInfo.get(key, None) is task:
+      del self.pendingAccessInfo[key]
+    # Background refreshes have no waiter, so retrieve the exception here to
+    # keep the event loop from logging it as unhandled.
+    if task.cancelled() or task.exception() is not None:
+      return
+    if key in self.pinnedTokens and self.pinEvent is not None:
+      # Schedule the next refresh from the new token, failed refreshes are
+      # retried after PIN_RETRY_SECONDS instead.
+      self.pinEvent.set()
+
+  async def __getAccessInfo(self, renderParameters):
+    """
+      Get the access info for a render request from the token cache,
+      requesting a new token from the API server if needed.
+    """
+    workflow = renderParameters['workflow']
+    xml = renderParameters.get('xml', None)
+    key = self.tokenCache.buildKey(workflow, xml)
+    tokenEvent = {
+      'workflow': workflow,
+      'xml': xml,
+    }
+    accessInfo = self.tokenCache.get(key)
+    if accessInfo is None:
+      self.instrumentation.onTokenCache(dict(tokenEvent, event='miss'))
+      accessInfo = await self.__fetchAccessInfo(key, workflow, xml)
+    else:
+      self.instrumentation.onTokenCache(dict(tokenEvent, event='hit'))
+      if self.tokenCache.needsRefresh(accessInfo) and key not in self.pendingAccessInfo:
+        self.instrumentation.onTokenCache(dict(tokenEvent, event='refresh'))
+        self.__fetchAccessInfo(key, workflow, xml)
+    return accessInfo
+
+  async def __httpRequest(self, url, method='GET', data=None):
+    """
+      Perform a non-blocking HTTP request.
+
+      See PijazServerManager.__httpRequest() for the arguments and return
+      value.
+    """
+    method = method.upper()
+    data = data or {}
+    if method not in ('GET', 'POST'):
+      raise ValueError("Unsupported HTTP method: %s" % method)
+
+    response = {}
+    try:
+      session = self.getHttpSession()
+      async with self.apiLimiter.limitAsync():
+        if method == 'GET':
+          r = session.get(url, params=data)
+        else:
+          r = session.post(url, data=data)
+        async with r as resp:
+          response['statusCode'] = resp.status
+          response['retryAfter'] = resp.headers.get('Retry-After', None)
+          response['data'] = await resp.read()
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+      raise PijazHttpError("HTTP request error, method: %s, url: %s, data: %s" % (method, url, data)) from e
+    return response
+
+  async def __refreshPinnedTokens(self):
+    """
+      Background task refreshing pinned tokens before they expire. The delay
+      until the next refresh is recomputed whenever tokens are pinned,
+      unpinned or refreshed.
+    """
+    event = self.pinEvent
+    # Stops once every token is unpinned, or once close() is called.
+    while self.pinnedTokens and self.pinEvent is event:
+      event.clear()
+      now = time.time()
+      delay = None
+      for key, (workflow, xml) in list(self.pinnedTokens.items()):
+        accessInfo = self.tokenCache.get(key)
+        if accessInfo is None or self.tokenCache.needsRefresh(accessInfo, now):
+          if key not in self.pendingAccessInfo:
+            self.instrumentation.onTokenCache({
+              'event': 'refresh',
+              'workflow': workflow,
+              'xml': xml,
+            })
+            self.__fetchAccessInfo(key, workflow, xml)
+          # Checked again after a short delay, in case the refresh fails.
+          due = self.tokenCache.PIN_RETRY_SECONDS
+        else:
+          due = self.tokenCache.refreshTimestamp(accessInfo) - now
+        delay = due if delay is None else min(delay, due)
+      try:
+        await asyncio.wait_for(event.wait(), delay)
+      except asyncio.TimeoutError:
+        pass
+    if self.pinEvent is event:
+      self.pinTask = None
+
+  async def __requestAccessInfo(self, key, workflow, xml=None):
+    """
+      Requests a new rendering access token for a workflow from the API server,
+      and stores it in the token cache. A usable token in the shared token
+      store, if any, is taken instead of requesting a new one, and requests
+      are serialized across processes through the store's lock for the key.
+      The blocking store calls are run in the default executor.
+    """
+    store = self.tokenCache.getStore()
+    if store is None:
+      return await self.__requestNewAccessInfo(key, workflow, xml)
+    loop = asyncio.get_event_loop()
+    accessInfo = await loop.run_in_executor(None, self.tokenCache.getShared, key)
+    if accessInfo is not None:
+      return accessInfo
+    lock = store.lock(key)
+    await loop.run_in_executor(None, lock.__enter__)
+    try:
+      # Another process may have fetched it while we waited for the lock.
+      accessInfo = await loop.run_in_executor(None, self.tokenCache.getShared, key)
+      if accessInfo is None:
+        accessInfo = await self.__requestNewAccessInfo(key, workflow, xml)
+    finally:
+      await asyncio.shield(loop.run_in_executor(None, lock.__exit__, None, None, None))
+    return accessInfo
+
+  async def __requestNewAccessInfo(self, key, workflow, xml=None):
+    """
+      Requests a new rendering access token for a workflow from the API server,
+      and stores it in the token cache, and in the shared token store if any.
+    """
+    result = await self.sendApiCommand(self._buildAccessTokenCommand(workflow, xml))
+    if not result.success:
+      raise PijazApiError("Failed getting a rendering access token for workflow %s: %s" % (workflow, result.data))
+    accessInfo = self._processAccessToken(result.data)
+    if self.tokenCache.getStore() is None:
+      self.tokenCache.set(key, accessInfo)
+    else:
+      await asyncio.get_event_loop().run_in_executor(None, self.tokenCache.set, key, accessInfo)
+    return accessInfo
+
+  async def __sendApiCommand(self, params):
+    """
+      Sends a command to the API server, retrying according to the retry
+      policy.
+    """
+    url, method, data = self._buildApiCommandRequest(params)
+
+    async def sendAttempt(attempt):
+      startTime = time.time()
+      try:
+        with self.apiServers.track(url) as request:
+          result = await self.__httpRequest(url, method, data)
+          request.success = result['statusCode'] < 500
+      except PijazHttpError as e:
+        self._instrumentApiCommand(params['command'], attempt, startTime, None, e)
+        raise
+      self._instrumentApiCommand(params['command'], attempt, startTime, result['statusCode'], None)
+      return result
+
+    try:
+      result = await self.retryPolicy.executeAsync(url, sendAttempt,
+        lambda result: result['statusCode'],
+        lambda result: result['retryAfter'])
+    except PijazHttpError as e:
+      raise PijazApiError("Error sending API command, path: %s, params: %s" % (url, data)) from e
+    return self._processApiResponse(result['statusCode'], result['data'])
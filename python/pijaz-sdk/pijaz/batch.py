@@ -0,0 +1,327 @@
+"""
+
+  Command-line batch renderer.
+
+  Renders every record of a CSV or JSONL file to a file, fanning the work out
+  over worker processes, each downloading with a pool of threads. Rendering
+  access tokens are requested once per workflow and shared by all processes.
+  Products are streamed to disk, and outputs that already exist are skipped,
+  so an interrupted run can be resumed by running it again.
+
+  Usage:
+
+    pijaz-batch items.csv --output-dir out --app-id APP_ID --api-key API_KEY
+      [--format csv|jsonl] [--workflow WORKFLOW] [--xml URL]
+      [--processes 4] [--threads 8] [--overwrite]
+      [--api-server URL] [--render-server URL]
+
+  The application ID and API key can also be given with the PIJAZ_APP_ID and
+  PIJAZ_API_KEY environment variables.
+
+  Each record has the following fields, use '-' as the input file to read
+  from standard input:
+
+    output: Required. The output file path, relative to the output directory.
+    workflow: Optional. The workflow ID. Default: the --workflow option.
+    xml: Optional. The workflow XML URL. Default: the --xml option.
+
+  All other fields are passed as render parameters. Empty CSV cells are left
+  out, so the workflow defaults apply. Invalid records are reported with
+  their line number and counted as failed, without stopping the run.
+
+"""
+
+import argparse
+import concurrent.futures
+import csv
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from pijaz.product import PijazProduct
+from pijaz.server_manager import PijazServerManager
+from pijaz.token_store import PijazSqliteTokenStore
+
+DEFAULT_PROCESSES = 1
+DEFAULT_THREADS = 8
+CHUNKS_PER_WORKER = 2
+RESERVED_FIELDS = ('output', 'workflow', 'xml')
+
+# Per process state of worker processes, set by initWorker().
+worker = {}
+
+def readRecords(path, format=None):
+  """
+    Lazily read render records from a CSV or JSONL file.
+
+    Args:
+      path: The file path, or '-' for standard input.
+      format: Optional. 'csv' or 'jsonl'. Default: guessed from the file
+        extension, CSV unless it is .jsonl or .json.
+
+    Returns:
+      A generator of (lineNumber, record) tuples, record being a dictionary
+      of the non-empty cells of a CSV row, the value of a JSONL line, or the
+      ValueError raised parsing an invalid JSONL line.
+  """
+  if format is None:
+    format = 'jsonl' if os.path.splitext(path)[1].lower() in ('.jsonl', '.json') else 'csv'
+  if path == '-':
+    f = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+  else:
+    f = open(path, newline='', encoding='utf-8')
+  with f:
+    if format == 'csv':
+      reader = csv.DictReader(f)
+      for record in reader:
+        # Cells of short rows are None, and extra cells are keyed by None.
+        yield reader.line_num, dict((key, value) for key, value in record.items()
+          if key is not None and value not in (None, ''))
+    else:
+      for lineNumber, line in enumerate(f, 1):
+        line = line.strip()
+        if line:
+          try:
+            yield lineNumber, json.loads(line)
+          except ValueError as e:
+            yield lineNumber, e
+
+def buildItems(records, config, stats, out=sys.stderr):
+  """
+    Convert records read by readRecords() into render items, skipping those
+    whose output already exists unless overwriting. Invalid records, and
+    records without an output or a workflow, are counted as failed and
+    reported, without stopping the run.
+
+    Returns:
+      A generator of (filepath, workflow, xml, renderParameters) tuples.
+  """
+  for lineNumber, record in records:
+    stats['records'] += 1
+    if isinstance(record, ValueError):
+      stats['failed'] += 1
+      print("Failed: line %d: invalid JSON: %s" % (lineNumber, record), file=out)
+      continue
+    if not isinstance(record, dict):
+      stats['failed'] += 1
+      print("Failed: line %d: not a JSON object" % lineNumber, file=out)
+      continue
+    output = record.get('output', None)
+    if not output:
+      stats['failed'] += 1
+      print("Failed: line %d: no output field" % lineNumber, file=out)
+      continue
+    filepath = os.path.join(config['outputDir'], output)
+    if not config['overwrite'] and os.path.exists(filepath):
+      stats['skipped'] += 1
+      continue
+    workflow = record.get('workflow', None) or config['workflow']
+    if not workflow:
+      stats['failed'] += 1
+      print("Failed: %s: no workflow, set a workflow field or --workflow" % output, file=out)
+      continue
+    xml = record.get('xml', None) or config['xml']
+    renderParameters = dict((key, value) for key, value in record.items() if key not in RESERVED_FIELDS)
+    yield (filepath, workflow, xml, renderParameters)
+
+def chunked(items, size):
+  """
+    Group an iterable into lists of at most size items.
+  """
+  chunk = []
+  for item in items:
+    chunk.append(item)
+    if len(chunk) >= size:
+      yield chunk
+      chunk = []
+  if chunk:
+    yield chunk
+
+def initWorker(config):
+  """
+    Set up the server manager of a worker process.
+  """
+  params = {
+    'appId': config['appId'],
+    'apiKey': config['apiKey'],
+    'httpPoolMaxSize': config['threads'],
+  }
+  if config['apiServer']:
+    params['apiServer'] = config['apiServer']
+  if config['renderServer']:
+    params['renderServer'] = config['renderServer']
+  if config['tokenDatabase']:
+    params['tokenStore'] = PijazSqliteTokenStore({'path': config['tokenDatabase']})
+  worker['serverManager'] = PijazServerManager(params)
+  worker['products'] = {}
+  worker['threads'] = config['threads']
+
+def renderChunk(chunk):
+  """
+    Render a chunk of items in a worker, with one product per workflow.
+
+    Returns:
+      A list of result dictionaries with output, success, error, duration and
+      bytes key/value pairs. Errors are converted to strings, so they can be
+      sent back from worker processes.
+  """
+  byProduct = {}
+  for filepath, workflow, xml, renderParameters in chunk:
+    directory = os.path.dirname(filepath)
+    if directory and not os.path.isdir(directory):
+      os.makedirs(directory, exist_ok=True)
+    byProduct.setdefault((workflow, xml), []).append((filepath, renderParameters))
+  results = []
+  for (workflow, xml), items in byProduct.items():
+    product = worker['products'].get((workflow, xml), None)
+    if product is None:
+      product = PijazProduct({
+        'serverManager': worker['serverManager'],
+        'workflowId': workflow,
+        'renderParameters': {'xml': xml} if xml else {},
+      })
+      worker['products'][(workflow, xml)] = product
+    for saved in product.saveToFiles(items, worker['threads']):
+      error = saved['error']
+      if error is None and not saved['success']:
+        error = "Render request failed"
+      results.append({
+        'output': saved['filepath'],
+        'success': error is None,
+        'error': str(error) if error is not None else None,
+        'duration': saved['duration'],
+        'bytes': os.path.getsize(saved['filepath']) if error is None else 0,
+      })
+  return results
+
+def runChunks(chunks, config, onResults):
+  """
+    Render chunks in the current process, or in a pool of worker processes,
+    keeping a bounded number of chunks in flight.
+  """
+  if config['processes'] <= 1:
+    initWorker(config)
+    for chunk in chunks:
+      onResults(renderChunk(chunk))
+    return
+  pending = set()
+  with concurrent.futures.ProcessPoolExecutor(max_workers=config['processes'],
+      initializer=initWorker, initargs=(config,)) as executor:
+    for chunk in chunks:
+      pending.add(executor.submit(renderChunk, chunk))
+      if len(pending) >= config['processes'] * CHUNKS_PER_WORKER:
+        done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+          onResults(future.result())
+    for future in concurrent.futures.as_completed(pending):
+      onResults(future.result())
+
+def percentile(values, fraction):
+  """
+    Get a percentile of a sorted list of values.
+  """
+  return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def printStats(stats, elapsed, out=sys.stdout):
+  """
+    Print throughput and latency statistics for a run.
+  """
+  rendered = stats['rendered']
+  print("Records:   %d" % stats['records'], file=out)
+  print("Skipped:   %d (output exists)" % stats['skipped'], file=out)
+  print("Rendered:  %d" % rendered, file=out)
+  print("Failed:    %d" % stats['failed'], file=out)
+  print("Elapsed:   %.2f s" % elapsed, file=out)
+  if elapsed > 0:
+    print("Rate:      %.2f files/s, %.2f MiB/s"
+      % (rendered / elapsed, stats['bytes'] / elapsed / (1024 * 1024)), file=out)
+  durations = sorted(stats['durations'])
+  if durations:
+    print("Latency:   mean %.1f ms, p50 %.1f ms, p90 %.1f ms, p99 %.1f ms, max %.1f ms" % (
+      sum(durations) / len(durations) * 1000,
+      percentile(durations, 0.5) * 1000,
+      percentile(durations, 0.9) * 1000,
+      percentile(durations, 0.99) * 1000,
+      durations[-1] * 1000,
+    ), file=out)
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog='pijaz-batch',
+    description='Render a CSV or JSONL file of render parameter sets to files.')
+  parser.add_argument('input', help="CSV or JSONL file of render records, or '-' for standard input.")
+  parser.add_argument('--output-dir', default='.', help='Directory the outputs are written to. Default: .')
+  parser.add_argument('--format', choices=('csv', 'jsonl'), help='Input format. Default: from the file extension.')
+  parser.add_argument('--app-id', default=os.environ.get('PIJAZ_APP_ID'), help='Client application ID.')
+  parser.add_argument('--api-key', default=os.environ.get('PIJAZ_API_KEY'), help='Client API key.')
+  parser.add_argument('--api-server', help='Base URL of the API server.')
+  parser.add_argument('--render-server', help='Base URL of the rendering server.')
+  parser.add_argument('--workflow', help='Workflow ID for records without a workflow field.')
+  parser.add_argument('--xml', help='Workflow XML URL for records without an xml field.')
+  parser.add_argument('--processes', type=int, default=DEFAULT_PROCESSES,
+    help='Number of worker processes. Default: %d' % DEFAULT_PROCESSES)
+  parser.add_argument('--threads', type=int, default=DEFAULT_THREADS,
+    help='Number of concurrent downloads per process. Default: %d' % DEFAULT_THREADS)
+  parser.add_argument('--overwrite', action='store_true', help='Render outputs that already exist.')
+  args = parser.parse_args(argv)
+  if not args.app_id or not args.api_key:
+    parser.error("--app-id and --api-key, or PIJAZ_APP_ID and PIJAZ_API_KEY, are required")
+
+  config = {
+    'appId': args.app_id,
+    'apiKey': args.api_key,
+    'apiServer': args.api_server,
+    'renderServer': args.render_server,
+    'outputDir': args.output_dir,
+    'workflow': args.workflow,
+    'xml': args.xml,
+    'processes': max(1, args.processes),
+    'threads': max(1, args.threads),
+    'overwrite': args.overwrite,
+    'tokenDatabase': None,
+  }
+  stats = {
+    'records': 0,
+    'skipped': 0,
+    'rendered': 0,
+    'failed': 0,
+    'bytes': 0,
+    'durations': [],
+  }
+
+  def onResults(results):
+    for result in results:
+      stats['durations'].append(result['duration'])
+      if result['success']:
+        stats['rendered'] += 1
+        stats['bytes'] += result['bytes']
+      else:
+        stats['failed'] += 1
+        print("Failed: %s: %s" % (result['output'], result['error']), file=sys.stderr)
+
+  interrupted = False
+  tokenDirectory = None
+  if config['processes'] > 1:
+    # Worker processes share rendering access tokens through a sqlite store.
+    tokenDirectory = tempfile.mkdtemp(prefix='pijaz-batch-')
+    config['tokenDatabase'] = os.path.join(tokenDirectory, 'tokens.db')
+  startTime = time.time()
+  try:
+    items = buildItems(readRecords(args.input, args.format), config, stats)
+    runChunks(chunked(items, config['threads'] * CHUNKS_PER_WORKER), config, onResults)
+  except KeyboardInterrupt:
+    print("Interrupted, run again to resume.", file=sys.stderr)
+    interrupted = True
+  finally:
+    if tokenDirectory is not None:
+      shutil.rmtree(tokenDirectory, ignore_errors=True)
+  printStats(stats, time.time() - startTime)
+  if interrupted:
+    return 130
+  return 1 if stats['failed'] else 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,258 @@
+"""
+
+  Requires the Pillow package, install with: pip install pijaz-sdk[derivatives]
+
+  Local derivative pipeline.
+
+  Renders a product once, typically at the size of its largest variant, and
+  produces resized and re-encoded variants of it locally, in a pool of worker
+  processes, instead of rendering every variant on the rendering server.
+
+  PUBLIC METHODS:
+
+  __init__(inParameters)
+  close()
+  getExecutor()
+  saveVariants(product, outputs, additionalParams)
+  saveVariantsAsync(product, outputs, additionalParams)
+
+  PRIVATE METHODS:
+
+  __buildResult(variant, filepath, startTime)
+  __sourcePath()
+  __submit(sourcePath, outputs)
+
+  encodeVariant(sourcePath, filepath, variant) is the module-level function
+  run by the worker processes.
+
+"""
+
+import asyncio
+import concurrent.futures
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from PIL import Image
+
+from pijaz.exceptions import PijazFileError
+
+# Pillow formats that cannot store an alpha channel.
+OPAQUE_FORMATS = ('JPEG', 'BMP')
+
+def encodeVariant(sourcePath, filepath, variant):
+  """
+    Resize and re-encode an image into a file, written to a temporary file
+    which is renamed into place once complete.
+
+    Args:
+      sourcePath: The path of the source image.
+      filepath: The path of the variant.
+      variant: A variant dictionary, see PijazDerivativePipeline.
+  """
+  size = (variant.get('width', None), variant.get('height', None))
+  tempPath = "%s.%s.part" % (filepath, uuid.uuid4().hex)
+  try:
+    with Image.open(sourcePath) as image:
+      if size != (None, None):
+        box = (size[0] or image.width, size[1] or image.height)
+        # Let JPEG sources be decoded at a reduced scale, much faster than
+        # decoding in full and resizing.
+        image.draft(image.mode, box)
+        image.thumbnail(box, Image.LANCZOS)
+      format = variant.get('format', None) or Image.registered_extensions().get(
+        os.path.splitext(filepath)[1].lower(), None)
+      if format is None:
+        raise ValueError("No image format for %s, set the variant format" % filepath)
+      format = format.upper()
+      if format in OPAQUE_FORMATS and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+      options = dict(variant.get('options', None) or {})
+      if 'quality' in variant:
+        options['quality'] = variant['quality']
+      with open(tempPath, 'wb') as f:
+        image.save(f, format, **options)
+    os.replace(tempPath, filepath)
+  except (IOError, OSError) as e:
+    raise PijazFileError("Failed writing file %s" % filepath) from e
+  finally:
+    if os.path.exists(tempPath):
+      os.remove(tempPath)
+
+class PijazDerivativePipeline(object):
+  """
+    Produces local variants of a rendered product in a process pool.
+
+    Encoding is CPU bound, so it is done in worker processes, off the threads
+    or event loop making render requests. Instances can be shared by threads,
+    and should be closed once no longer needed.
+  """
+
+  # PUBLIC METHODS.
+
+  def __init__(self, inParameters):
+    """
+      Inits a DerivativePipeline object.
+
+      Args:
+
+        inParameters: A dictionary with the following key/value pairs.
+          variants: Required. A dictionary of variant names to variant
+            dictionaries, with the following key/value pairs:
+              width: Optional. Maximum width in pixels. Default: the source
+                width
+              height: Optional. Maximum height in pixels. Default: the source
+                height
+              format: Optional. The Pillow format name, such as JPEG, PNG or
+                WEBP. Default: from the output file extension
+              quality: Optional. The encoding quality, for formats that
+                support it.
+              options: Optional. A dictionary of additional Pillow save
+                options.
+            Variants keep the aspect ratio of the source and are never
+            enlarged.
+          maxWorkers: Optional. Number of worker processes. Default: the
+            number of CPUs
+          executor: Optional. A concurrent.futures executor to encode variants
+            with instead, which is not shut down by close().
+          tempDirectory: Optional. Directory the source renders are saved to
+            while variants are produced. Default: the system temporary
+            directory
+    """
+    params = inParameters
+    self.variants = params['variants']
+    self.maxWorkers = params.get('maxWorkers', None)
+    self.executor = params.get('executor', None)
+    self.ownExecutor = self.executor is None
+    self.tempDirectory = params.get('tempDirectory', None)
+    self.lock = threading.Lock()
+
+  def close(self):
+    """
+      Shut down the worker processes, once pending variants are done.
+    """
+    with self.lock:
+      if self.ownExecutor and self.executor is not None:
+        self.executor.shutdown()
+        self.executor = None
+
+  def getExecutor(self):
+    """
+      Get the executor variants are encoded with, starting the worker
+      processes if needed.
+
+      Returns:
+        The concurrent.futures executor.
+    """
+    with self.lock:
+      if self.executor is None:
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.maxWorkers)
+      return self.executor
+
+  def saveVariants(self, product, outputs, additionalParams=None):
+    """
+      Render a product once and save variants of it to files.
+
+      Args:
+        product: Required. A PijazProduct instance.
+        outputs: Required. A dictionary of variant names to file paths.
+        additionalParams: Optional. A dictionary of additional render
+          parameters for the source render, typically the size of the largest
+          variant.
+
+      Returns:
+        A list of dictionaries with the following key/value pairs, in the
+        order of outputs:
+          variant: The variant name.
+          filepath: The file path.
+          success: True if the variant was saved, False otherwise.
+          error: The exception raised while producing the variant, or None.
+          duration: Seconds from the start of the render until the variant
+            was saved.
+    """
+    for variant in outputs:
+      if variant not in self.variants:
+        raise KeyError("Unknown variant: %s" % variant)
+    startTime = time.time()
+    sourcePath = self.__sourcePath()
+    try:
+      saved = product.saveToFile(sourcePath, additionalParams)
+      results = [self.__buildResult(variant, filepath, startTime) for variant, filepath in outputs.items()]
+      if not saved:
+        return results
+      futures = self.__submit(sourcePath, outputs)
+      for result, future in zip(results, futures):
+        try:
+          future.result()
+          result['success'] = True
+        except Exception as e:
+          result['error'] = e
+        result['duration'] = time.time() - startTime
+      return results
+    finally:
+      if os.path.exists(sourcePath):
+        os.remove(sourcePath)
+
+  async def saveVariantsAsync(self, product, outputs, additionalParams=None):
+    """
+      Render a product once and save variants of it to files, without
+      blocking the event loop.
+
+      See saveVariants() for the arguments and return value, product being an
+      AsyncPijazProduct instance.
+    """
+    for variant in outputs:
+      if variant not in self.variants:
+        raise KeyError("Unknown variant: %s" % variant)
+    startTime = time.time()
+    sourcePath = self.__sourcePath()
+    try:
+      saved = await product.saveToFile(sourcePath, additionalParams)
+      results = [self.__buildResult(variant, filepath, startTime) for variant, filepath in outputs.items()]
+      if not saved:
+        return results
+      futures = [asyncio.wrap_future(future) for future in self.__submit(sourcePath, outputs)]
+      for result, future in zip(results, futures):
+        try:
+          await future
+          result['success'] = True
+        except Exception as e:
+          result['error'] = e
+        result['duration'] = time.time() - startTime
+      return results
+    finally:
+      if os.path.exists(sourcePath):
+        os.remove(sourcePath)
+
+  # PRIVATE METHODS.
+
+  def __buildResult(self, variant, filepath, startTime):
+    """
+      Build the result of a variant, before it is produced.
+    """
+    return {
+      'variant': variant,
+      'filepath': filepath,
+      'success': False,
+      'error': None,
+      'duration': time.time() - startTime,
+    }
+
+  def __sourcePath(self):
+    """
+      Build a unique path for a source render.
+    """
+    return os.path.join(self.tempDirectory or tempfile.gettempdir(), "pijaz-%s.source" % uuid.uuid4().hex)
+
+  def __submit(self, sourcePath, outputs):
+    """
+      Submit the encoding of every output to the executor.
+
+      Returns:
+        A list of futures, in the order of outputs.
+    """
+    executor = self.getExecutor()
+    return [executor.submit(encodeVariant, sourcePath, filepath, self.variants[variant])
+      for variant, filepath in outputs.items()]
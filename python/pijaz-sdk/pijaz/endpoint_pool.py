@@ -0,0 +1,301 @@
+"""
+
+  PUBLIC METHODS:
+
+  __init__(inParameters)
+  choose()
+  choosePinned(key)
+  getEndpoints()
+  getGeneration()
+  getStats()
+  reroute(url)
+  track(url)
+
+  PRIVATE METHODS:
+
+  __available(now)
+  __endpointOf(url)
+  __finish(endpoint, startTime, success)
+  __refresh(now)
+
+"""
+
+import contextlib
+import hashlib
+import random
+import threading
+import time
+
+class _PijazEndpoint(object):
+  """
+    State of a single server in an endpoint pool.
+  """
+
+  def __init__(self, url):
+    self.url = url
+    self.outstanding = 0
+    self.latency = None
+    self.failures = 0
+    self.ejections = 0
+    self.ejectedUntil = None
+
+class _PijazTrackedRequest(object):
+  """
+    A request tracked by an endpoint pool. Set success to False if the
+    response shows the server is unhealthy.
+  """
+
+  def __init__(self):
+    self.success = True
+
+class PijazEndpointPool(object):
+  """
+    Thread-safe pool of interchangeable servers for one role, API or
+    rendering.
+
+    Requests go to the server with the lowest observed latency weighted by
+    its number of outstanding requests, servers not measured yet being tried
+    first. Requests identified by a key, such as render URLs for the same
+    render parameters, are pinned to the same server with rendezvous hashing,
+    so that only the keys of an unavailable server move.
+
+    A server is ejected after ejectAfterFailures consecutive failed requests,
+    a failure being a transport error or a 5xx response. Once its ejection
+    time has passed it is probed with live requests again: a success restores
+    it, a single failure ejects it again, for twice as long, up to
+    maxEjectSeconds. If every server is ejected, the pool falls back to all
+    of them rather than failing requests.
+  """
+
+  EJECT_AFTER_FAILURES = 3
+  EJECT_SECONDS = 30
+  MAX_EJECT_SECONDS = 300
+  LATENCY_DECAY = 0.3
+
+  # PUBLIC METHODS.
+
+  def __init__(self, inParameters):
+    """
+      Inits an EndpointPool object.
+
+      Args:
+
+        inParameters: A dictionary with the following key/value pairs.
+          endpoints: Required. A list of server base URLs, including the
+            trailing slash.
+          ejectAfterFailures: Optional. Number of consecutive failed requests
+            after which a server is ejected. Default: 3
+          ejectSeconds: Optional. Seconds a server is first ejected for.
+            Default: 30
+          maxEjectSeconds: Optional. Maximum number of seconds a server is
+            ejected for. Default: 300
+          latencyDecay: Optional. Weight of the latest request in the moving
+            average of a server's latency, between 0 and 1. Default: 0.3
+    """
+    params = inParameters
+    if not params['endpoints']:
+      raise ValueError("An endpoint pool needs at least one endpoint")
+    self.endpoints = [_PijazEndpoint(url) for url in params['endpoints']]
+    self.ejectAfterFailures = params.get('ejectAfterFailures', self.EJECT_AFTER_FAILURES)
+    self.ejectSeconds = params.get('ejectSeconds', self.EJECT_SECONDS)
+    self.maxEjectSeconds = params.get('maxEjectSeconds', self.MAX_EJECT_SECONDS)
+    self.latencyDecay = params.get('latencyDecay', self.LATENCY_DECAY)
+    self.generation = 0
+    self.nextExpiry = None
+    self.lock = threading.Lock()
+
+  def choose(self):
+    """
+      Choose the server for a request.
+
+      Returns:
+        The base URL of the available server with the lowest latency weighted
+        by its outstanding requests.
+    """
+    if len(self.endpoints) == 1:
+      return self.endpoints[0].url
+    with self.lock:
+      candidates = self.__available(time.time())
+      best = None
+      bestScore = None
+      # Shuffled so that ties, such as unmeasured servers, are spread out.
+      for endpoint in random.sample(candidates, len(candidates)):
+        score = (endpoint.latency or 0) * (endpoint.outstanding + 1)
+        if bestScore is None or score < bestScore:
+          best = endpoint
+          bestScore = score
+      return best.url
+
+  def choosePinned(self, key):
+    """
+      Choose the server for requests identified by a key. The same key maps to
+      the same server as long as it is available.
+
+      Args:
+        key: Required. A string identifying the request.
+
+      Returns:
+        The base URL of the server.
+    """
+    if len(self.endpoints) == 1:
+      return self.endpoints[0].url
+    with self.lock:
+      candidates = self.__available(time.time())
+    return max(candidates, key=lambda endpoint:
+      hashlib.md5((endpoint.url + key).encode('utf-8')).digest()).url
+
+  def getEndpoints(self):
+    """
+      Get the servers of the pool.
+
+      Returns:
+        A list of server base URLs.
+    """
+    return [endpoint.url for endpoint in self.endpoints]
+
+  def getGeneration(self):
+    """
+      Get a counter incremented each time a server is ejected or returns to
+      the pool, which can be used to invalidate memoized pinned choices.
+
+      Returns:
+        An integer.
+    """
+    if self.nextExpiry is not None and time.time() >= self.nextExpiry:
+      with self.lock:
+        self.__refresh(time.time())
+    return self.generation
+
+  def getStats(self):
+    """
+      Get the current state of each server.
+
+      Returns:
+        A list of dictionaries with the following key/value pairs:
+          endpoint: The server base URL.
+          available: False if the server is ejected.
+          outstanding: The number of requests in progress.
+          latency: The moving average of the request latency in seconds, or
+            None if not measured yet.
+          failures: The number of consecutive failed requests.
+    """
+    now = time.time()
+    with self.lock:
+      self.__refresh(now)
+      return [{
+        'endpoint': endpoint.url,
+        'available': endpoint.ejectedUntil is None,
+        'outstanding': endpoint.outstanding,
+        'latency': endpoint.latency,
+        'failures': endpoint.failures,
+      } for endpoint in self.endpoints]
+
+  def reroute(self, url):
+    """
+      Move a URL built for an ejected server to the server chosen by choose().
+
+      Args:
+        url: Required. A URL starting with the base URL of a server.
+
+      Returns:
+        The URL, on an available server.
+    """
+    endpoint = self.__endpointOf(url)
+    if endpoint is None or len(self.endpoints) == 1:
+      return url
+    with self.lock:
+      self.__refresh(time.time())
+      ejected = endpoint.ejectedUntil is not None
+    if not ejected:
+      return url
+    return self.choose() + url[len(endpoint.url):]
+
+  @contextlib.contextmanager
+  def track(self, url):
+    """
+      Context manager recording a request to a server, for the duration of
+      the block. The request fails if the block raises an exception, or sets
+      the success attribute of the yielded object to False.
+
+      Args:
+        url: Required. The request URL. Requests to URLs outside the pool are
+          not recorded.
+    """
+    request = _PijazTrackedRequest()
+    endpoint = self.__endpointOf(url)
+    if endpoint is None:
+      yield request
+      return
+    with self.lock:
+      endpoint.outstanding += 1
+    startTime = time.time()
+    try:
+      yield request
+    except BaseException:
+      request.success = False
+      raise
+    finally:
+      self.__finish(endpoint, startTime, request.success)
+
+  # PRIVATE METHODS.
+
+  def __available(self, now):
+    """
+      Get the servers that are not ejected, or all of them if every server
+      is ejected. Must be called with the lock held.
+    """
+    self.__refresh(now)
+    candidates = [endpoint for endpoint in self.endpoints if endpoint.ejectedUntil is None]
+    return candidates or self.endpoints
+
+  def __endpointOf(self, url):
+    """
+      Find the server a URL belongs to.
+    """
+    for endpoint in self.endpoints:
+      if url.startswith(endpoint.url):
+        return endpoint
+    return None
+
+  def __finish(self, endpoint, startTime, success):
+    """
+      Record the outcome of a request, ejecting or restoring its server.
+    """
+    now = time.time()
+    with self.lock:
+      endpoint.outstanding -= 1
+      if success:
+        duration = now - startTime
+        if endpoint.latency is None:
+          endpoint.latency = duration
+        else:
+          endpoint.latency += self.latencyDecay * (duration - endpoint.latency)
+        endpoint.failures = 0
+        endpoint.ejections = 0
+        return
+      endpoint.failures += 1
+      # Servers back from an ejection are ejected again on their first failure.
+      if endpoint.ejectedUntil is None and (endpoint.failures >= self.ejectAfterFailures or endpoint.ejections):
+        seconds = min(self.maxEjectSeconds, self.ejectSeconds * 2 ** endpoint.ejections)
+        endpoint.ejections += 1
+        endpoint.ejectedUntil = now + seconds
+        if self.nextExpiry is None or endpoint.ejectedUntil < self.nextExpiry:
+          self.nextExpiry = endpoint.ejectedUntil
+        self.generation += 1
+
+  def __refresh(self, now):
+    """
+      Return servers whose ejection time has passed to the pool. Must be
+      called with the lock held.
+    """
+    if self.nextExpiry is None or now < self.nextExpiry:
+      return
+    self.nextExpiry = None
+    for endpoint in self.endpoints:
+      if endpoint.ejectedUntil is None:
+        continue
+      if now >= endpoint.ejectedUntil:
+        endpoint.ejectedUntil = None
+        self.generation += 1
+      elif self.nextExpiry is None or endpoint.ejectedUntil < self.nextExpiry:
+        self.nextExpiry = endpoint.ejectedUntil
@@ -0,0 +1,62 @@
+"""
+
+  Exceptions raised by the Pijaz SDK.
+
+  All exceptions derive from PijazError, which derives from RuntimeError for
+  compatibility with code written against earlier releases.
+
+  PijazError
+    PijazApiError: An API command could not be completed.
+      PijazResponseError: The API server sent a malformed response.
+    PijazFileError: A product could not be written to a file.
+    PijazHttpError: An HTTP request failed at the transport level.
+      PijazCircuitOpenError: A request was refused because the circuit
+        breaker for its host is open.
+    PijazRenderError: A product could not be fetched from the rendering
+      server.
+
+"""
+
+class PijazError(RuntimeError):
+  """
+    Base class of all Pijaz SDK exceptions.
+  """
+  pass
+
+class PijazApiError(PijazError):
+  """
+    Raised when an API command could not be completed.
+  """
+  pass
+
+class PijazResponseError(PijazApiError):
+  """
+    Raised when the API server sends a response that cannot be parsed.
+  """
+  pass
+
+class PijazFileError(PijazError):
+  """
+    Raised when a product could not be written to a file.
+  """
+  pass
+
+class PijazHttpError(PijazError):
+  """
+    Raised when an HTTP request fails at the transport level, for example on
+    a connection error or a timeout.
+  """
+  pass
+
+class PijazCircuitOpenError(PijazHttpError):
+  """
+    Raised when a request is refused because the circuit breaker for its host
+    is open.
+  """
+  pass
+
+class PijazRenderError(PijazError):
+  """
+    Raised when a product could not be fetched from the rendering server.
+  """
+  pass
@@ -0,0 +1,220 @@
+"""
+
+  Instrumentation hooks for the server manager and products.
+
+  Pass an instance of one of these classes, or of a subclass, as the
+  'instrumentation' parameter of PijazServerManager. All durations are in
+  seconds.
+
+  PijazInstrumentation: No-op base class, and the default. Override the
+    hooks to forward events to a metrics or tracing system.
+  PijazCallbackInstrumentation: Forwards every event to a single callback.
+  PijazStatsInstrumentation: Aggregates counters and timings in memory.
+
+  PUBLIC METHODS:
+
+  onApiCommand(info)
+  onDownload(info)
+  onRenderCommand(info)
+  onTokenCache(info)
+
+  PijazStatsInstrumentation only:
+
+  getStats()
+  increment(name, value)
+  reset()
+  time(name, duration)
+
+"""
+
+import threading
+
+class PijazInstrumentation(object):
+  """
+    No-op instrumentation, all hooks do nothing.
+
+    Hooks are called synchronously on the thread, or event loop, that made
+    the request, so they should return quickly.
+  """
+
+  # PUBLIC METHODS.
+
+  def onApiCommand(self, info):
+    """
+      Called after each attempt to send a command to the API server.
+
+      Args:
+        info: A dictionary with the following key/value pairs:
+          command: The API command, for example get-token.
+          attempt: The attempt number, starting at 1.
+          duration: The time taken by the attempt.
+          statusCode: The HTTP status code, or None if the request failed.
+          error: The exception raised by the request, or None.
+    """
+    pass
+
+  def onDownload(self, info):
+    """
+      Called after a product is downloaded from the rendering server.
+
+      Args:
+        info: A dictionary with the following key/value pairs:
+          url: The render request URL.
+          statusCode: The HTTP status code.
+          timeToFirstByte: The time until the response headers were received.
+          duration: The total time taken by the download.
+          bytes: The number of body bytes received.
+    """
+    pass
+
+  def onRenderCommand(self, info):
+    """
+      Called after the query parameters or URL for a render request are built.
+
+      Args:
+        info: A dictionary with the following key/value pairs:
+          workflow: The workflow ID.
+          duration: The time taken, including any access token request.
+          success: True if a rendering access token was available.
+    """
+    pass
+
+  def onTokenCache(self, info):
+    """
+      Called when the token cache is consulted or refreshed.
+
+      Args:
+        info: A dictionary with the following key/value pairs:
+          event: One of 'hit', 'miss' or 'refresh'. A miss blocks on a
+            get-token request, a refresh starts one in the background.
+          workflow: The workflow ID.
+          xml: The workflow XML URL, or None.
+    """
+    pass
+
+class PijazCallbackInstrumentation(PijazInstrumentation):
+  """
+    Instrumentation that forwards every event to a callback, which is called
+    with the event name ('apiCommand', 'download', 'renderCommand' or
+    'tokenCache') and the info dictionary.
+  """
+
+  def __init__(self, callback):
+    """
+      Inits a CallbackInstrumentation object.
+
+      Args:
+        callback: A callable taking (eventName, info) arguments.
+    """
+    self.callback = callback
+
+  def onApiCommand(self, info):
+    self.callback('apiCommand', info)
+
+  def onDownload(self, info):
+    self.callback('download', info)
+
+  def onRenderCommand(self, info):
+    self.callback('renderCommand', info)
+
+  def onTokenCache(self, info):
+    self.callback('tokenCache', info)
+
+class PijazStatsInstrumentation(PijazInstrumentation):
+  """
+    Thread-safe instrumentation that keeps counters and timing aggregates in
+    memory.
+
+    Counters:
+      apiCommand.<command>.errors: Failed API command attempts.
+      apiCommand.<command>.retries: API command attempts after the first.
+      download.bytes: Total bytes downloaded.
+      tokenCache.hit, tokenCache.miss, tokenCache.refresh: Token cache events.
+
+    Timings:
+      apiCommand.<command>: API command attempt durations.
+      download: Download durations.
+      download.timeToFirstByte: Download times to first byte.
+      renderCommand: Render command build durations.
+  """
+
+  def __init__(self):
+    """
+      Inits a StatsInstrumentation object.
+    """
+    self.lock = threading.Lock()
+    self.counters = {}
+    self.timings = {}
+
+  def getStats(self):
+    """
+      Get a snapshot of the collected statistics.
+
+      Returns:
+        A dictionary with the following key/value pairs:
+          counters: A dictionary of counter name to value.
+          timings: A dictionary of timing name to a dictionary with count,
+            total, min, max and mean key/value pairs.
+    """
+    with self.lock:
+      timings = {}
+      for name, timing in self.timings.items():
+        timings[name] = dict(timing)
+        timings[name]['mean'] = timing['total'] / timing['count']
+      return {
+        'counters': dict(self.counters),
+        'timings': timings,
+      }
+
+  def increment(self, name, value=1):
+    """
+      Increment a counter.
+    """
+    with self.lock:
+      self.counters[name] = self.counters.get(name, 0) + value
+
+  def reset(self):
+    """
+      Clear all collected statistics.
+    """
+    with self.lock:
+      self.counters = {}
+      self.timings = {}
+
+  def time(self, name, duration):
+    """
+      Record a timing.
+    """
+    with self.lock:
+      timing = self.timings.get(name, None)
+      if timing is None:
+        self.timings[name] = {
+          'count': 1,
+          'total': duration,
+          'min': duration,
+          'max': duration,
+        }
+      else:
+        timing['count'] += 1
+        timing['total'] += duration
+        timing['min'] = min(timing['min'], duration)
+        timing['max'] = max(timing['max'], duration)
+
+  def onApiCommand(self, info):
+    name = 'apiCommand.' + info['command']
+    self.time(name, info['duration'])
+    if info['attempt'] > 1:
+      self.increment(name + '.retries')
+    if info['error'] is not None or info['statusCode'] != 200:
+      self.increment(name + '.errors')
+
+  def onDownload(self, info):
+    self.time('download', info['duration'])
+    self.time('download.timeToFirstByte', info['timeToFirstByte'])
+    self.increment('download.bytes', info['bytes'])
+
+  def onRenderCommand(self, info):
+    self.time('renderCommand', info['duration'])
+
+  def onTokenCache(self, info):
+    self.increment('tokenCache.' + info['event'])
@@ -0,0 +1,76 @@
+"""
+
+  PUBLIC METHODS:
+
+  __init__(maxSize)
+  clear()
+  get(key)
+  set(key, value)
+
+"""
+
+import threading
+from collections import OrderedDict
+
+class PijazLruCache(object):
+  """
+    Minimal thread-safe, size bounded, least recently used cache.
+  """
+
+  # PUBLIC METHODS.
+
+  def __init__(self, maxSize):
+    """
+      Inits an LruCache object.
+
+      Args:
+        maxSize: Maximum number of entries to keep. A size of 0 disables the
+          cache.
+    """
+    self.maxSize = maxSize
+    self.entries = OrderedDict()
+    self.lock = threading.Lock()
+
+  def __len__(self):
+    with self.lock:
+      return len(self.entries)
+
+  def clear(self):
+    """
+      Remove all entries from the cache.
+    """
+    with self.lock:
+      self.entries.clear()
+
+  def get(self, key):
+    """
+      Retrieve an entry.
+
+      Args:
+        key: The entry key.
+
+      Returns:
+        The cached value, or None if the key is not cached.
+    """
+    with self.lock:
+      value = self.entries.get(key, None)
+      if value is not None:
+        self.entries.move_to_end(key)
+      return value
+
+  def set(self, key, value):
+    """
+      Store an entry, evicting the least recently used entries if the cache is
+      full.
+
+      Args:
+        key: The entry key.
+        value: The value to store.
+    """
+    if self.maxSize <= 0:
+      return
+    with self.lock:
+      self.entries[key] = value
+      self.entries.move_to_end(key)
+      while len(self.entries) > self.maxSize:
+        self.entries.popitem(last=False)
@@ -4,31 +4,85 @@
  
   __init__(inParameters)
   clearRenderParameters()
+  fetchBytes(additionalParams)
   generateUrl(additionalParams)
+  generateUrls(additionalParamsList)
   getAccessInfo()
   getRenderParameter(key)
   getWorkflowId()
+  iterContent(additionalParams, chunkSize)
   saveToFile(filepath,additionalParams)
+  saveToFileObject(fileobj, additionalParams)
+  saveToFiles(items, maxWorkers)
   serve(additionalParams)
   setAccessInfo(accessInfo)
   setRenderParameter(key, newValue)
   setWorkflowId(newWorkflowId)
  
+  PROTECTED METHODS:
+ 
+  _conditionalHeaders(validators)
+  _copyFile(source, filepath)
+  _downloadKey(kind, additionalParams)
+  _getPropertyDefaults()
+  _normalizeParams(additionalParams)
+  _openRenderStream(additionalParams, headers)
+  _responseValidators(headers)
+  _setFinalParams(additionalParams)
+  _tempFilePath(filepath)
+ 
   PRIVATE METHODS:
  
-  __setFinalParams(additionalParams)
+  __download(additionalParams)
+  __downloadToCache(renderCache, key, additionalParams)
+  __downloadToFile(filepath, additionalParams)
+  __fetchToCache(renderCache, key, additionalParams)
+  __isDefault(defaults, key, value)
+  __iterChunks(response, download, chunkSize)
+  __normalizedRenderParameters(defaults)
+  __openCached(renderCache, additionalParams)
+  __saveBatchItem(result, additionalParams)
+  __writableRenderParameters()
+  __writeChunks(response, download, fileobj)
 
 """
 
-import copy
+import concurrent.futures
+import contextlib
+import os
 import requests
+import shutil
+import time
+import uuid
+from collections import ChainMap
+
+from pijaz.exceptions import PijazFileError, PijazHttpError, PijazRenderError
+from pijaz.render_cache import PijazRenderCache
+
+# Shared by products without parameters of their own, never written to.
+_NO_PARAMETERS = {}
 
 class PijazProduct(object):
 
   """ 
     Manages a renderable product.
+
+    Products are lightweight: they have no instance dictionary, share their
+    parameters with the product they were created from until they are
+    modified, and read their access info from the server manager.
   """
 
+  __slots__ = (
+    'serverManager',
+    'workflowId',
+    'renderParameters',
+    'productPropertyDefaults',
+    'sharedParameters',
+  )
+
+  BATCH_MAX_WORKERS = 8
+  DOWNLOAD_CHUNK_SIZE = 65536
+
   # PUBLIC METHODS.
 
   def __init__(self, inParameters):
@@ -47,13 +101,35 @@ class PijazProduct(object):
               halign: Horizontal justification (left, center, right, full).
               valign: Vertical justification (top, middle, bottom, full, even).
               quality: Image quality to produce (0-100).
+          productPropertyDefaults: Optional. A dictionary of the default values
+            of the workflow's render parameters. Parameters equal to their
+            default are left out of render requests. Default: the defaults
+            declared by the workflow, if the server manager has a
+            PijazWorkflowDefaults loader, none otherwise
+          template: Optional. Another product, whose serverManager, workflowId,
+            renderParameters and productPropertyDefaults are used for any of
+            these not supplied. Render parameters are shared with the template
+            until either product modifies them.
     """
     params = inParameters
-    self.accessInfo = None
-    self.serverManager = params['serverManager']
-    self.workflowId = params['workflowId']
-    self.renderParameters = params.get('renderParameters', {})
-    self.productPropertyDefaults = params.get('productPropertyDefaults', {})
+    template = params.get('template', None)
+    if template is None:
+      self.serverManager = params['serverManager']
+      self.workflowId = params['workflowId']
+      self.renderParameters = params.get('renderParameters', _NO_PARAMETERS)
+      self.productPropertyDefaults = params.get('productPropertyDefaults', None)
+      self.sharedParameters = self.renderParameters is _NO_PARAMETERS
+    else:
+      self.serverManager = params.get('serverManager', template.serverManager)
+      self.workflowId = params.get('workflowId', template.workflowId)
+      self.productPropertyDefaults = params.get('productPropertyDefaults', template.productPropertyDefaults)
+      if 'renderParameters' in params:
+        self.renderParameters = params['renderParameters']
+        self.sharedParameters = False
+      else:
+        self.renderParameters = template.renderParameters
+        self.sharedParameters = True
+        template.sharedParameters = True
     
   def clearRenderParameters(self):
     """ 
@@ -62,9 +138,35 @@ class PijazProduct(object):
       Any parameters currently stored with the product, including those passed
       when the product was instantiated, are cleared.
     """
-    self.renderParameters = {}
+    self.renderParameters = _NO_PARAMETERS
+    self.sharedParameters = True
   
 
+  def fetchBytes(self, additionalParams=None):
+    """ 
+      Fetch a rendered product into memory.
+     
+      If the server manager has a render cache, the product is served from it
+      when possible, and stored in it otherwise. Concurrent fetches of the
+      same product share a single download.
+     
+      Args:
+        additionalParams: Optional. A dictionary of additional render parameters
+        to be used for this request only.
+     
+      Returns:
+        The product as a byte string, or None if the render request failed.
+    """
+    renderCache = self.serverManager.getRenderCache()
+    if renderCache is not None:
+      cachedFile = self.__openCached(renderCache, additionalParams)
+      if cachedFile is None:
+        return None
+      with cachedFile:
+        return cachedFile.read()
+    return self.serverManager.coalesceDownload(self._downloadKey('bytes', additionalParams),
+      lambda: self.__download(additionalParams))
+
   def generateUrl(self, additionalParams=None):
     """ 
       Build a fully formed URL which can be used to make a request for the
@@ -78,26 +180,50 @@ class PijazProduct(object):
         A fully formed URL that can be used in a render server HTTP request.
     """
     additionalParams = additionalParams or {}
-    finalParams = self.__setFinalParams(additionalParams)
+    finalParams = self._setFinalParams(additionalParams)
     options = {
       'product': self,
       'renderParameters': finalParams,
     }
-    params = self.serverManager.buildRenderCommand(options)
-    url = self.serverManager.buildRenderServerUrlRequest(params)
-    return url
+    return self.serverManager.buildRenderUrl(options)
+
+  def generateUrls(self, additionalParamsList):
+    """ 
+      Lazily build render request URLs for many variants of the product, for
+      example a catalog.
+     
+      The rendering access token is checked once for the whole batch, and the
+      parameters shared by every URL are encoded once. Each URL is identical to
+      the one generateUrl() returns for the same parameters.
+     
+      Args:
+        additionalParamsList: An iterable of dictionaries of additional render
+          parameters, one per URL. It is consumed lazily.
+     
+      Returns:
+        A generator of fully formed URLs, in order. A URL is None if no
+        rendering access token could be obtained.
+    """
+    options = {
+      'product': self,
+      'renderParameters': self._setFinalParams(),
+    }
+    return self.serverManager.buildRenderUrls(options,
+      (self._normalizeParams(additionalParams) for additionalParams in additionalParamsList))
 
   def getAccessInfo(self):
     """ 
       Get the access info for a product.
      
-      This method is required for products passed to the PijazServerManager
-      class.
+      Access info is not stored on the product, it is looked up in the token
+      cache of the server manager.
      
       Returns:
-        The access info for the product.
+        The access info for the product, or None if no valid access info is
+        cached for its workflow.
     """
-    return self.accessInfo
+    tokenCache = self.serverManager.getTokenCache()
+    return tokenCache.get(tokenCache.buildKey(self.workflowId, self.renderParameters.get('xml', None)))
   
   def getRenderParameter(self, key):
     """ 
@@ -109,7 +235,7 @@ class PijazProduct(object):
       Returns:
         The render parameter, or the default render parameter if none is set.
     """
-    value = self.renderParameters.get(key, self.productPropertyDefaults.get(key, None))
+    value = self.renderParameters.get(key, self._getPropertyDefaults().get(key, None))
     return value
   
 
@@ -122,12 +248,38 @@ class PijazProduct(object):
     """
     return self.workflowId
   
+  def iterContent(self, additionalParams=None, chunkSize=None):
+    """ 
+      Stream a product from the rendering server as chunks of bytes.
+     
+      Args:
+        additionalParams: Optional. A dictionary of additional render parameters to be
+        used for this request only.
+        chunkSize: Optional. Maximum size of each chunk in bytes.
+          Default: 65536
+     
+      Returns:
+        A generator of byte strings.
+    """
+    with self._openRenderStream(additionalParams) as (r, download):
+      if r.status_code != 200:
+        raise PijazRenderError("Failed fetching image from %s, status: %s" % (r.url, r.status_code))
+      for chunk in self.__iterChunks(r, download, chunkSize):
+        yield chunk
+
   def saveToFile(self, filepath, additionalParams=None):
     """ 
       Convenience method for saving a product directly to a file.
      
       This takes care of generating the render URL, making the request to the
-      render server for the product, and saving to a file.
+      render server for the product, and saving to a file. The product is
+      streamed to a temporary file in fixed-size chunks, which is renamed into
+      place once complete. If the server manager has a render cache, the
+      product is served from it when possible, and stored in it otherwise.
+     
+      Concurrent saves of the same product share a single download, which is
+      saved to the file of the first caller, and copied from it to the files
+      of the others.
      
       Args:
         filepath: Required. The full file path.
@@ -137,33 +289,94 @@ class PijazProduct(object):
       Returns:
         True on successful save of the file, False otherwise.
     """
-    url = self.generateUrl(additionalParams)
-    r = None
-    try:
-      r = requests.get(url)
-    except:
-      raise "Failed fetching image from %s" % url
-    if r.status_code == 200:
-      try:
-        with open(filepath, 'wb') as f:
-          f.write(r.content)
-          f.close()
-          return True
-      except:
-        raise "Failed writing file %s" % filepath
+    renderCache = self.serverManager.getRenderCache()
+    if renderCache is not None:
+      cachedFile = self.__openCached(renderCache, additionalParams)
+      if cachedFile is None:
+        return False
+      with cachedFile:
+        self._copyFile(cachedFile, filepath)
+      return True
+    savedPath = self.serverManager.coalesceDownload(self._downloadKey('file', additionalParams),
+      lambda: self.__downloadToFile(filepath, additionalParams))
+    if savedPath is None:
+      return False
+    if savedPath != filepath:
+      self._copyFile(savedPath, filepath)
+    return True
+
+  def saveToFileObject(self, fileobj, additionalParams=None):
+    """ 
+      Stream a product into a file-like object.
+     
+      Args:
+        fileobj: Required. A writable file-like object or buffer, such as an
+          open file, io.BytesIO, or an upload stream.
+        additionalParams: Optional. A dictionary of additional render parameters to be
+        used for this request only.
+     
+      Returns:
+        True if the product was written, False otherwise.
+    """
+    with self._openRenderStream(additionalParams) as (r, download):
+      if r.status_code == 200:
+        self.__writeChunks(r, download, fileobj)
+        return True
     return False
+
+  def saveToFiles(self, items, maxWorkers=None):
+    """ 
+      Save many variants of the product to files concurrently.
+     
+      Rendering access tokens are shared through the server manager, so only
+      one token is requested per workflow for the whole batch. A failed item
+      does not abort the batch, its error is reported in the results instead.
+     
+      Args:
+        items: Required. An iterable of (filepath, additionalParams) pairs, one
+          per file to save.
+        maxWorkers: Optional. Maximum number of concurrent downloads. For best
+          results, keep this at or below the server manager's
+          httpPoolMaxSize. Default: 8
+     
+      Returns:
+        A list with one dictionary per item, in input order, with the following
+        key/value pairs:
+          filepath: The file path of the item.
+          success: True if the file was saved, False otherwise.
+          error: The exception raised while saving the item, or None.
+          duration: The time taken to save the item, in seconds.
+    """
+    maxWorkers = maxWorkers or self.BATCH_MAX_WORKERS
+    results = []
+    pending = set()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+      for filepath, additionalParams in items:
+        result = {
+          'filepath': filepath,
+          'success': False,
+          'error': None,
+          'duration': None,
+        }
+        results.append(result)
+        pending.add(executor.submit(self.__saveBatchItem, result, additionalParams))
+        # Bound the number of queued items, so large batches can be consumed
+        # lazily from a generator.
+        if len(pending) >= maxWorkers * 2:
+          done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+    return results
   
   def setAccessInfo(self, accessInfo=None):
     """ 
       Set the access info for the product.
      
-      This method is required for products passed to the PijazServerManager
-      class.
+      Kept for backward compatibility, access info is held by the token cache
+      of the server manager, so this does nothing.
      
       Args:
-        accessInfo: An accessInfo dictionary to store on the product.
+        accessInfo: An accessInfo dictionary.
     """
-    self.accessInfo = accessInfo
+    pass
 
   def setRenderParameter(self, key, newValue=None):
     """ 
@@ -181,36 +394,342 @@ class PijazProduct(object):
         self.setRenderParameter(k, key[k])
     else:
       param = self.renderParameters.get(key, None)
-      default = self.productPropertyDefaults.get(key, None)
       if param != newValue: 
-        if newValue == None or newValue == default:
-          del self.renderParameters[key]
+        if newValue == None or self.__isDefault(self._getPropertyDefaults(), key, newValue):
+          if key in self.renderParameters:
+            del self.__writableRenderParameters()[key]
         else:
-          self.renderParameters[key] = newValue
+          self.__writableRenderParameters()[key] = newValue
 
   def setWorkflowId(self, newWorkflowId):
     """ 
       Set the workflow ID.
     """
-    if self.workflowId != newWorkflowId:
-      self.accessInfo = None
-      self.workflowId = newWorkflowId
+    self.workflowId = newWorkflowId
 
-  # PRIVATE METHODS.
+  # PROTECTED METHODS.
+
+  def _conditionalHeaders(self, validators):
+    """ 
+      Build the request headers revalidating a cached product.
+    """
+    headers = {}
+    if validators:
+      if validators.get('etag', None):
+        headers['If-None-Match'] = validators['etag']
+      if validators.get('lastModified', None):
+        headers['If-Modified-Since'] = validators['lastModified']
+    return headers or None
+
+  def _copyFile(self, source, filepath):
+    """ 
+      Atomically copy a file into place. The source is a file path, or a file
+      object open for reading in binary mode.
+    """
+    tempPath = self._tempFilePath(filepath)
+    try:
+      if hasattr(source, 'read'):
+        with open(tempPath, 'wb') as f:
+          shutil.copyfileobj(source, f)
+      else:
+        shutil.copyfile(source, tempPath)
+      os.replace(tempPath, filepath)
+    except (IOError, OSError) as e:
+      raise PijazFileError("Failed writing file %s" % filepath) from e
+    finally:
+      if os.path.exists(tempPath):
+        os.remove(tempPath)
+
+  def _downloadKey(self, kind, additionalParams=None):
+    """ 
+      Build the key identifying identical downloads of the product, from the
+      canonical final render parameters.
+     
+      Args:
+        kind: A string identifying what the download is saved to, downloads
+          are only shared by callers saving them the same way.
+        additionalParams: A dictionary of additional render parameters.
+     
+      Returns:
+        A hashable key.
+    """
+    return (kind, PijazRenderCache.buildKey(self._setFinalParams(additionalParams)))
+
+  def _getPropertyDefaults(self):
+    """ 
+      Get the default values of the workflow's render parameters, from the
+      server manager's workflow defaults loader unless the product was given
+      its own.
+     
+      Returns:
+        A dictionary of parameter names to default values.
+    """
+    if self.productPropertyDefaults is not None:
+      return self.productPropertyDefaults
+    workflowDefaults = self.serverManager.getWorkflowDefaults()
+    if workflowDefaults is None:
+      return _NO_PARAMETERS
+    return workflowDefaults.get(self.workflowId, self.renderParameters.get('xml', None))
+
+  def _normalizeParams(self, additionalParams=None):
+    """ 
+      Leave out additional render parameters equal to their default, unless
+      they override a render parameter of the product.
+     
+      Args:
+        additionalParams: A dictionary of additional render parameters.
+     
+      Returns:
+        The additional parameters, copied only if any were left out.
+    """
+    if not additionalParams:
+      return additionalParams
+    defaults = self._getPropertyDefaults()
+    if not defaults:
+      return additionalParams
+    renderParameters = self.__normalizedRenderParameters(defaults)
+    normalized = None
+    for key, value in additionalParams.items():
+      if key not in renderParameters and self.__isDefault(defaults, key, value):
+        if normalized is None:
+          normalized = dict(additionalParams)
+        del normalized[key]
+    return additionalParams if normalized is None else normalized
 
-  def __setFinalParams(self, additionalParams=None):
+  @contextlib.contextmanager
+  def _openRenderStream(self, additionalParams=None, headers=None):
+    """ 
+      Request a product from the rendering server, without reading the body.
+      Yields the response and the download info, the response is closed and
+      the download reported to the instrumentation on exit. The render
+      limiter of the server manager is respected.
+    """
+    url = self.generateUrl(additionalParams)
+    if url is None:
+      raise PijazRenderError("Failed building a render URL for workflow %s, no valid rendering access token" % self.workflowId)
+    # Hold a render slot until the body is read, not just for the request.
+    with self.serverManager.getRenderLimiter().limit():
+      startTime = time.time()
+      try:
+        r = self.serverManager.sendRenderRequest(url, headers=headers, stream=True)
+      except PijazHttpError as e:
+        raise PijazRenderError("Failed fetching image from %s" % url) from e
+      download = {
+        'url': url,
+        'statusCode': r.status_code,
+        'timeToFirstByte': time.time() - startTime,
+        'bytes': 0,
+      }
+      try:
+        yield r, download
+      finally:
+        r.close()
+        download['duration'] = time.time() - startTime
+        self.serverManager.getInstrumentation().onDownload(download)
+
+  def _responseValidators(self, headers):
+    """ 
+      Extract the validators of a rendered product from its response headers.
+     
+      Returns:
+        A dictionary with etag and lastModified key/value pairs, or None if
+        the response has neither.
+    """
+    etag = headers.get('ETag', None)
+    lastModified = headers.get('Last-Modified', None)
+    if etag is None and lastModified is None:
+      return None
+    return {
+      'etag': etag,
+      'lastModified': lastModified,
+    }
+
+  def _setFinalParams(self, additionalParams=None):
     """ 
       Set the final render parameters for the product.
      
+      The parameters are layered without copying: the workflow ID overrides
+      the additional parameters, which override the product's render
+      parameters. The layers are only merged when the request is encoded.
+      Parameters equal to their default are left out.
+     
       Args:
         additionalParams: A dictionary of additional render parameters.
+     
+      Returns:
+        A read-only mapping of the final render parameters.
     """
-    finalParams = copy.deepcopy(self.renderParameters)
-    if additionalParams is not None:
-      for key in additionalParams:
-        finalParams[key] = additionalParams[key]
-      
-    
-    finalParams['workflow'] = self.workflowId
-    return finalParams
+    layers = [{'workflow': self.workflowId}]
+    additionalParams = self._normalizeParams(additionalParams)
+    if additionalParams:
+      layers.append(additionalParams)
+    layers.append(self.__normalizedRenderParameters(self._getPropertyDefaults()))
+    return ChainMap(*layers)
+
+  def _tempFilePath(self, filepath):
+    """ 
+      Build a unique temporary path next to a file, for atomic writes.
+    """
+    return "%s.%s.part" % (filepath, uuid.uuid4().hex)
+
+  # PRIVATE METHODS.
+
+  def __download(self, additionalParams=None):
+    """ 
+      Download a product into memory.
+     
+      Returns:
+        The product as a byte string, or None if the render request failed.
+    """
+    with self._openRenderStream(additionalParams) as (r, download):
+      if r.status_code == 200:
+        return b''.join(self.__iterChunks(r, download))
+    return None
+
+  def __downloadToCache(self, renderCache, key, additionalParams=None):
+    """ 
+      Download a product into the render cache. Expired products with
+      validators are revalidated with a conditional request.
+     
+      Returns:
+        The path of the cached file, or None if the render request failed.
+    """
+    headers = self._conditionalHeaders(renderCache.getValidators(key))
+    cachedPath = None
+    notModified = False
+    with self._openRenderStream(additionalParams, headers) as (r, download):
+      if r.status_code == 304 and headers is not None:
+        notModified = True
+        cachedPath = renderCache.revalidate(key)
+      elif r.status_code == 200:
+        cachedPath = renderCache.put(key, self.__iterChunks(r, download), self._responseValidators(r.headers),
+          r.headers.get('Content-Type', None))
+    if notModified and cachedPath is None:
+      # Evicted while revalidating, fetch the product in full.
+      return self.__downloadToCache(renderCache, key, additionalParams)
+    return cachedPath
+
+  def __downloadToFile(self, filepath, additionalParams=None):
+    """ 
+      Stream a product to a temporary file, renamed into place once complete.
+     
+      Returns:
+        The file path, or None if the render request failed.
+    """
+    with self._openRenderStream(additionalParams) as (r, download):
+      if r.status_code != 200:
+        return None
+      tempPath = self._tempFilePath(filepath)
+      try:
+        with open(tempPath, 'wb') as f:
+          self.__writeChunks(r, download, f)
+        os.replace(tempPath, filepath)
+        return filepath
+      except (IOError, OSError) as e:
+        raise PijazFileError("Failed writing file %s" % filepath) from e
+      finally:
+        if os.path.exists(tempPath):
+          os.remove(tempPath)
+
+  def __fetchToCache(self, renderCache, key, additionalParams=None):
+    """ 
+      Make sure a product is in the render cache, fetching it if needed.
+      Concurrent fetches of the same product share a single download.
+     
+      Returns:
+        The path of the cached file, or None if the render request failed.
+    """
+    cachedPath = renderCache.get(key)
+    if cachedPath is None:
+      cachedPath = self.serverManager.coalesceDownload(('cache', key),
+        lambda: self.__downloadToCache(renderCache, key, additionalParams))
+    return cachedPath
+
+  def __isDefault(self, defaults, key, value):
+    """ 
+      Check if a render parameter value is its default. Defaults read from
+      workflow definitions are strings, so values are also compared as
+      strings.
+    """
+    if key not in defaults:
+      return False
+    default = defaults[key]
+    return value == default or (isinstance(default, str) and str(value) == default)
+
+  def __iterChunks(self, response, download, chunkSize=None):
+    """ 
+      Read a streamed response body in chunks, counting the bytes received.
+    """
+    try:
+      for chunk in response.iter_content(chunkSize or self.DOWNLOAD_CHUNK_SIZE):
+        download['bytes'] += len(chunk)
+        yield chunk
+    except requests.RequestException as e:
+      raise PijazRenderError("Failed fetching image from %s" % download['url']) from e
+
+  def __normalizedRenderParameters(self, defaults):
+    """ 
+      Get the render parameters of the product, leaving out those equal to
+      their default, including parameters given at construction or by a
+      template. Copied only if any were left out.
+    """
+    if not defaults:
+      return self.renderParameters
+    normalized = None
+    for key, value in self.renderParameters.items():
+      if self.__isDefault(defaults, key, value):
+        if normalized is None:
+          normalized = dict(self.renderParameters)
+        del normalized[key]
+    return self.renderParameters if normalized is None else normalized
+
+  def __openCached(self, renderCache, additionalParams=None):
+    """ 
+      Open the cached file of a product, fetching the product into the render
+      cache if needed. A file evicted between the lookup and the open is
+      fetched again.
+     
+      Returns:
+        The file object, open for reading in binary mode, or None if the render
+        request failed.
+    """
+    key = renderCache.buildKey(self._setFinalParams(additionalParams))
+    for attempt in range(2):
+      cachedPath = self.__fetchToCache(renderCache, key, additionalParams)
+      if cachedPath is None:
+        return None
+      try:
+        return open(cachedPath, 'rb')
+      except FileNotFoundError:
+        # Evicted since the lookup, or removed by another process.
+        renderCache.remove(key)
+    raise PijazFileError("Failed opening cached file %s" % cachedPath)
+
+  def __saveBatchItem(self, result, additionalParams):
+    """ 
+      Save one item of a batch, recording the outcome in the result.
+    """
+    startTime = time.time()
+    try:
+      result['success'] = self.saveToFile(result['filepath'], additionalParams)
+    except Exception as e:
+      result['error'] = e
+    result['duration'] = time.time() - startTime
+
+  def __writableRenderParameters(self):
+    """ 
+      Get the render parameters for modification, copying them first if they
+      are shared with other products.
+    """
+    if self.sharedParameters:
+      self.renderParameters = dict(self.renderParameters)
+      self.sharedParameters = False
+    return self.renderParameters
+
+  def __writeChunks(self, response, download, fileobj):
+    """ 
+      Copy a streamed response body into a file-like object.
+    """
+    for chunk in self.__iterChunks(response, download):
+      fileobj.write(chunk)
 
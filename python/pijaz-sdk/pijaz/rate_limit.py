@@ -0,0 +1,219 @@
+"""
+
+  PUBLIC METHODS:
+
+  __init__(inParameters)
+  acquire()
+  acquireAsync()
+  getInFlight()
+  limit()
+  limitAsync()
+  release()
+
+  PRIVATE METHODS:
+
+  __dispatch()
+  __refill(now)
+  __wake(waiter)
+  __wakeHead(delay)
+
+"""
+
+import asyncio
+import collections
+import contextlib
+import math
+import threading
+import time
+
+class _PijazLimiterWaiter(object):
+  """
+    A caller queued on a rate limiter, either a thread or a coroutine.
+  """
+
+  def __init__(self, loop=None):
+    self.loop = loop
+    self.event = threading.Event() if loop is None else asyncio.Event()
+    self.granted = False
+
+class PijazRateLimiter(object):
+  """
+    Token bucket rate limiter combined with a cap on requests in flight,
+    shared by threads and coroutines.
+
+    Callers queue in arrival order instead of failing, and are let through as
+    soon as a token is available and the number of requests in flight is
+    below the cap. A limiter with neither a rate nor a cap lets every request
+    through immediately.
+  """
+
+  # PUBLIC METHODS.
+
+  def __init__(self, inParameters=None):
+    """
+      Inits a RateLimiter object.
+
+      Args:
+
+        inParameters: Optional. A dictionary with the following key/value pairs.
+          rate: Optional. Maximum sustained number of requests started per
+            second. Default: None (unlimited)
+          burst: Optional. Number of requests that may be started at once after
+            a quiet period. Default: the rate, rounded up, or 1
+          maxInFlight: Optional. Maximum number of requests in progress at any
+            time. Default: None (unlimited)
+    """
+    params = inParameters or {}
+    self.rate = params.get('rate', None)
+    self.burst = params.get('burst', None) or max(1, int(math.ceil(self.rate or 1)))
+    self.maxInFlight = params.get('maxInFlight', None)
+    self.unlimited = self.rate is None and self.maxInFlight is None
+    self.tokens = float(self.burst)
+    self.lastRefill = time.monotonic()
+    self.inFlight = 0
+    self.queue = collections.deque()
+    self.lock = threading.Lock()
+
+  def acquire(self):
+    """
+      Wait until a request may be started. Every call must be paired with a
+      call to release() once the request is complete.
+    """
+    if self.unlimited:
+      return
+    waiter = _PijazLimiterWaiter()
+    with self.lock:
+      self.queue.append(waiter)
+      delay = self.__dispatch()
+    while not waiter.granted:
+      waiter.event.wait(delay)
+      with self.lock:
+        waiter.event.clear()
+        delay = self.__dispatch()
+
+  async def acquireAsync(self):
+    """
+      Wait, without blocking the event loop, until a request may be started.
+      Every call must be paired with a call to release() once the request is
+      complete.
+    """
+    if self.unlimited:
+      return
+    waiter = _PijazLimiterWaiter(asyncio.get_event_loop())
+    with self.lock:
+      self.queue.append(waiter)
+      delay = self.__dispatch()
+    try:
+      while not waiter.granted:
+        try:
+          await asyncio.wait_for(waiter.event.wait(), delay)
+        except asyncio.TimeoutError:
+          pass
+        with self.lock:
+          waiter.event.clear()
+          delay = self.__dispatch()
+    except BaseException:
+      with self.lock:
+        if waiter.granted:
+          self.inFlight -= 1
+        else:
+          self.queue.remove(waiter)
+        self.__wakeHead(self.__dispatch())
+      raise
+
+  def getInFlight(self):
+    """
+      Get the number of requests in progress.
+
+      Returns:
+        The number of acquired and not yet released requests.
+    """
+    return self.inFlight
+
+  @contextlib.contextmanager
+  def limit(self):
+    """
+      Context manager holding a request slot for the duration of the block.
+    """
+    self.acquire()
+    try:
+      yield
+    finally:
+      self.release()
+
+  @contextlib.asynccontextmanager
+  async def limitAsync(self):
+    """
+      Asynchronous context manager holding a request slot for the duration of
+      the block.
+    """
+    await self.acquireAsync()
+    try:
+      yield
+    finally:
+      self.release()
+
+  def release(self):
+    """
+      Mark a request started with acquire() or acquireAsync() as complete.
+    """
+    if self.unlimited:
+      return
+    with self.lock:
+      self.inFlight -= 1
+      self.__wakeHead(self.__dispatch())
+
+  # PRIVATE METHODS.
+
+  def __dispatch(self):
+    """
+      Let queued callers through, in order, while tokens and request slots
+      are available. Must be called with the lock held.
+
+      Returns:
+        The number of seconds until the next token is available if callers
+        are still waiting for one, or None.
+    """
+    now = time.monotonic()
+    self.__refill(now)
+    while self.queue:
+      if self.maxInFlight is not None and self.inFlight >= self.maxInFlight:
+        return None
+      if self.rate is not None:
+        if self.tokens < 1:
+          return (1 - self.tokens) / self.rate
+        self.tokens -= 1
+      waiter = self.queue.popleft()
+      waiter.granted = True
+      self.inFlight += 1
+      self.__wake(waiter)
+    return None
+
+  def __refill(self, now):
+    """
+      Add the tokens accumulated since the last refill. Must be called with
+      the lock held.
+    """
+    if self.rate is not None:
+      self.tokens = min(self.burst, self.tokens + (now - self.lastRefill) * self.rate)
+    self.lastRefill = now
+
+  def __wake(self, waiter):
+    """
+      Wake a caller that has been let through.
+    """
+    if waiter.loop is None:
+      waiter.event.set()
+    else:
+      waiter.loop.call_soon_threadsafe(waiter.event.set)
+
+  def __wakeHead(self, delay):
+    """
+      Wake the first queued caller when it has to wait for a token, so that
+      it waits for the token delay. Callers queued while the cap on requests
+      in flight was reached wait without a timeout, and a slot freed while
+      the bucket is empty would otherwise never let them through. Must be
+      called with the lock held.
+    """
+    if delay is not None and self.queue:
+      self.__wake(self.queue[0])
@@ -0,0 +1,408 @@
+"""
+
+  PUBLIC METHODS:
+
+  __init__(inParameters)
+  buildKey(renderParameters)
+  clear()
+  get(key)
+  getContentType(key)
+  getSize()
+  getValidators(key)
+  openWriter(key, validators, contentType)
+  put(key, chunks, validators, contentType)
+  remove(key)
+  revalidate(key)
+
+  PROTECTED METHODS:
+
+  _store(key, tempPath, size, validators, contentType)
+
+  PRIVATE METHODS:
+
+  __evict()
+  __forget(key)
+  __loadIndex()
+  __metaPath(key)
+  __path(key)
+
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+class _PijazRenderCacheWriter(object):
+  """
+    A product being stored in a render cache chunk by chunk. It is written
+    to a temporary file, and only added to the cache once committed.
+  """
+
+  def __init__(self, cache, key, path, validators, contentType):
+    self.cache = cache
+    self.key = key
+    self.validators = validators
+    self.contentType = contentType
+    self.tempPath = "%s.%s.part" % (path, uuid.uuid4().hex)
+    self.size = 0
+    self.file = open(self.tempPath, 'wb')
+
+  def abort(self):
+    """
+      Discard the product. Does nothing once committed.
+    """
+    self.file.close()
+    if os.path.exists(self.tempPath):
+      os.remove(self.tempPath)
+
+  def commit(self):
+    """
+      Add the product to the cache.
+
+      Returns:
+        The path of the cached file.
+    """
+    try:
+      self.file.close()
+      return self.cache._store(self.key, self.tempPath, self.size, self.validators, self.contentType)
+    finally:
+      if os.path.exists(self.tempPath):
+        os.remove(self.tempPath)
+
+  def write(self, chunk):
+    """
+      Append a chunk of bytes to the product.
+    """
+    self.file.write(chunk)
+    self.size += len(chunk)
+
+class PijazRenderCache(object):
+  """
+    Content-addressed on-disk cache of rendered products.
+
+    Entries are keyed on a canonical hash of the final render parameters,
+    which include the workflow but never the rendering access parameters, so
+    a render is served from disk regardless of the token it was fetched with.
+    The cache is bounded in size with least recently used eviction, and each
+    entry expires after a fixed time to live.
+
+    The validators the rendering server sent with a product (ETag and
+    Last-Modified) and its Content-Type are kept in a '.meta' file next to
+    it. Expired products
+    with validators stay cached, so they can be revalidated with a
+    conditional request instead of being downloaded again.
+  """
+
+  DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+  DEFAULT_TTL = 86400
+  FILE_EXTENSION = '.render'
+  META_EXTENSION = '.meta'
+
+  # PUBLIC METHODS.
+
+  def __init__(self, inParameters):
+    """
+      Inits a RenderCache object.
+
+      Args:
+
+        inParameters: A dictionary with the following key/value pairs.
+          directory: Required. The directory to store rendered products in. It
+            is created if it does not exist.
+          maxBytes: Optional. Maximum total size of the cached products in
+            bytes. Default: 1073741824 (1 GiB)
+          ttl: Optional. Number of seconds a cached product is served for
+            before it is fetched again. Default: 86400
+    """
+    params = inParameters
+    self.directory = params['directory']
+    self.maxBytes = params.get('maxBytes', self.DEFAULT_MAX_BYTES)
+    self.ttl = params.get('ttl', self.DEFAULT_TTL)
+    self.lock = threading.Lock()
+    self.entries = OrderedDict()
+    self.size = 0
+    if not os.path.isdir(self.directory):
+      os.makedirs(self.directory)
+    self.__loadIndex()
+
+  @staticmethod
+  def buildKey(renderParameters):
+    """
+      Build the cache key for a set of final render parameters.
+
+      Args:
+        renderParameters: A mapping of render parameters, including the
+          workflow, as built by PijazProduct. Rendering access parameters
+          must not be included.
+
+      Returns:
+        A hex digest string.
+    """
+    canonical = json.dumps(dict(renderParameters), sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+  def clear(self):
+    """
+      Remove all products from the cache.
+    """
+    with self.lock:
+      for key in list(self.entries):
+        self.__forget(key)
+
+  def get(self, key):
+    """
+      Look up a cached product.
+
+      Args:
+        key: A key built with buildKey().
+
+      Returns:
+        The path of the cached file, or None if the product is not cached or
+        has expired.
+    """
+    with self.lock:
+      entry = self.entries.get(key, None)
+      if entry is None:
+        return None
+      if time.time() > entry['timestamp'] + self.ttl:
+        if entry['validators'] is None:
+          self.__forget(key)
+        return None
+      self.entries.move_to_end(key)
+      return self.__path(key)
+
+  def getContentType(self, key):
+    """
+      Get the content type of a cached product, fresh or expired.
+
+      Args:
+        key: A key built with buildKey().
+
+      Returns:
+        The Content-Type the rendering server sent with the product, or None
+        if the product is not cached or was stored without one.
+    """
+    with self.lock:
+      entry = self.entries.get(key, None)
+      if entry is None:
+        return None
+      return entry['contentType']
+
+  def getSize(self):
+    """
+      Get the total size of the cached products.
+
+      Returns:
+        The size in bytes.
+    """
+    return self.size
+
+  def getValidators(self, key):
+    """
+      Get the validators of a cached product, fresh or expired.
+
+      Args:
+        key: A key built with buildKey().
+
+      Returns:
+        A dictionary with etag and lastModified key/value pairs, either of
+        which may be None, or None if the product is not cached or has no
+        validators.
+    """
+    with self.lock:
+      entry = self.entries.get(key, None)
+      if entry is None:
+        return None
+      return entry['validators']
+
+  def openWriter(self, key, validators=None, contentType=None):
+    """
+      Start storing a product chunk by chunk, for example while it is also
+      streamed to a client.
+
+      Args:
+        key: A key built with buildKey().
+        validators: Optional. A dictionary with etag and lastModified
+          key/value pairs, as sent by the rendering server. Default: None
+        contentType: Optional. The Content-Type sent by the rendering server.
+          Default: None
+
+      Returns:
+        A writer with write(chunk), commit() and abort() methods. commit()
+        adds the product to the cache and returns the path of the cached
+        file, abort() discards it. Readers never see a partially written
+        product.
+    """
+    return _PijazRenderCacheWriter(self, key, self.__path(key), validators, contentType)
+
+  def put(self, key, chunks, validators=None, contentType=None):
+    """
+      Store a product in the cache.
+
+      The product is written to a temporary file, which is renamed into place
+      once complete, so readers never see a partially written product.
+
+      Args:
+        key: A key built with buildKey().
+        chunks: An iterable of byte strings making up the product.
+        validators: Optional. A dictionary with etag and lastModified
+          key/value pairs, as sent by the rendering server. Default: None
+        contentType: Optional. The Content-Type sent by the rendering server.
+          Default: None
+
+      Returns:
+        The path of the cached file.
+    """
+    writer = self.openWriter(key, validators, contentType)
+    try:
+      for chunk in chunks:
+        writer.write(chunk)
+    except BaseException:
+      writer.abort()
+      raise
+    return writer.commit()
+
+  def remove(self, key):
+    """
+      Remove a product from the cache, if present.
+
+      Args:
+        key: A key built with buildKey().
+    """
+    with self.lock:
+      if key in self.entries:
+        self.__forget(key)
+
+  def revalidate(self, key):
+    """
+      Mark a cached product as fresh again, after the rendering server
+      confirmed that it has not changed.
+
+      Args:
+        key: A key built with buildKey().
+
+      Returns:
+        The path of the cached file, or None if the product is no longer
+        cached.
+    """
+    with self.lock:
+      entry = self.entries.get(key, None)
+      if entry is None:
+        return None
+      entry['timestamp'] = time.time()
+      self.entries.move_to_end(key)
+      path = self.__path(key)
+      # The modification time is the timestamp of products indexed on startup.
+      try:
+        os.utime(path, (entry['timestamp'], entry['timestamp']))
+      except OSError:
+        pass
+      return path
+
+  # PROTECTED METHODS.
+
+  def _store(self, key, tempPath, size, validators=None, contentType=None):
+    """
+      Move a completely written temporary file into place as a cached
+      product, and index it.
+
+      Returns:
+        The path of the cached file.
+    """
+    path = self.__path(key)
+    os.replace(tempPath, path)
+    metaPath = self.__metaPath(key)
+    if validators or contentType:
+      meta = dict(validators or {})
+      if contentType:
+        meta['contentType'] = contentType
+      metaTempPath = "%s.%s.part" % (metaPath, uuid.uuid4().hex)
+      try:
+        with open(metaTempPath, 'w') as f:
+          json.dump(meta, f)
+        os.replace(metaTempPath, metaPath)
+      finally:
+        if os.path.exists(metaTempPath):
+          os.remove(metaTempPath)
+    elif os.path.exists(metaPath):
+      os.remove(metaPath)
+    with self.lock:
+      previous = self.entries.pop(key, None)
+      if previous is not None:
+        self.size -= previous['size']
+      self.entries[key] = {
+        'size': size,
+        'timestamp': time.time(),
+        'validators': validators or None,
+        'contentType': contentType or None,
+      }
+      self.size += size
+      self.__evict()
+    return path
+
+  # PRIVATE METHODS.
+
+  def __evict(self):
+    """
+      Remove least recently used products until the cache fits its size
+      bound. Must be called with the lock held.
+    """
+    while self.size > self.maxBytes and self.entries:
+      key = next(iter(self.entries))
+      self.__forget(key)
+
+  def __forget(self, key):
+    """
+      Drop a product from the index and the disk. Must be called with the
+      lock held.
+    """
+    entry = self.entries.pop(key)
+    self.size -= entry['size']
+    for path in (self.__path(key), self.__metaPath(key)):
+      try:
+        os.remove(path)
+      except OSError:
+        pass
+
+  def __loadIndex(self):
+    """
+      Index products left on disk by a previous run, oldest first.
+    """
+    found = []
+    for name in os.listdir(self.directory):
+      if name.endswith(self.FILE_EXTENSION):
+        stat = os.stat(os.path.join(self.directory, name))
+        found.append((stat.st_mtime, name[:-len(self.FILE_EXTENSION)], stat.st_size))
+    for timestamp, key, size in sorted(found):
+      meta = {}
+      try:
+        with open(self.__metaPath(key)) as f:
+          meta = json.load(f)
+      except (OSError, ValueError):
+        pass
+      contentType = meta.pop('contentType', None)
+      self.entries[key] = {
+        'size': size,
+        'timestamp': timestamp,
+        'validators': meta or None,
+        'contentType': contentType,
+      }
+      self.size += size
+    self.__evict()
+
+  def __metaPath(self, key):
+    """
+      Build the file path of the validators and content type of a cached
+      product.
+    """
+    return os.path.join(self.directory, key + self.META_EXTENSION)
+
+  def __path(self, key):
+    """
+      Build the file path of a cached product.
+    """
+    return os.path.join(self.directory, key + self.FILE_EXTENSION)
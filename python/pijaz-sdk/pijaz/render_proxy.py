@@ -0,0 +1,414 @@
+"""
+
+  Render proxy, serving products to HTTP clients from a WSGI or ASGI
+  application server.
+
+  PUBLIC METHODS:
+
+  __init__(inParameters)
+  handleAsgi(scope, receive, send)
+  handleWsgi(environ, startResponse)
+
+  PRIVATE METHODS:
+
+  __cachedHeaders(renderCache, key, f, ifNoneMatch)
+  __contentType(head)
+  __mappedBlocks(f)
+  __notModified(validators, ifNoneMatch)
+  __openFile(path)
+  __queryParams(query)
+  __resolve(path, query)
+  __responseHeaders(r)
+  __wsgiStatus(status)
+
+"""
+
+import contextlib
+import inspect
+import mmap
+import os
+
+from http import HTTPStatus
+from urllib.parse import parse_qsl
+
+from pijaz.exceptions import PijazError
+
+class _PijazResponseBody(object):
+  """
+    A WSGI response body, with a close() method that releases its resources
+    even if the body was never iterated.
+  """
+
+  def __init__(self, chunks, onClose):
+    self.chunks = chunks
+    self.onClose = onClose
+
+  def __iter__(self):
+    return iter(self.chunks)
+
+  def close(self):
+    if hasattr(self.chunks, 'close'):
+      self.chunks.close()
+    self.onClose()
+
+class PijazRenderProxy(object):
+  """
+    Serves rendered products over HTTP, as a WSGI or ASGI application.
+
+    Each request is resolved to a product and render parameters. Products in
+    the render cache of the server manager are served straight from their
+    cached file, with wsgi.file_wrapper, which application servers usually
+    implement with sendfile(), or the ASGI zero-copy send extension when
+    available, and memory-mapped reads otherwise. Other products are streamed
+    from the rendering server to the client as they arrive, while being
+    written to the render cache, which they are added to once complete.
+
+    Only GET requests are served. Concurrent requests for a product missing
+    from the render cache are each streamed from the rendering server.
+  """
+
+  BLOCK_SIZE = 65536
+  DEFAULT_CONTENT_TYPE = 'application/octet-stream'
+  # Render parameters selecting what is rendered, and which access token is
+  # requested, never taken from a query string.
+  RESERVED_PARAMETERS = ('workflow', 'xml')
+  # Leading bytes of the image formats rendered by the platform, for products
+  # cached without a Content-Type.
+  MAGIC_TYPES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+  )
+
+  # PUBLIC METHODS.
+
+  def __init__(self, inParameters):
+    """
+      Inits a RenderProxy object.
+
+      Args:
+
+        inParameters: A dictionary with the following key/value pairs.
+          product: Optional. The product served for every request, the query
+            string parameters listed in parameters being its additional
+            render parameters. A PijazProduct for handleWsgi(), an
+            AsyncPijazProduct for handleAsgi().
+          parameters: Optional. A list of the query string parameters passed
+            to the product or to resolve, others are ignored. The workflow
+            and xml parameters are never passed. Required if product is set.
+            Default: all of them
+          resolve: Optional. A callable taking the request path and a
+            dictionary of query string parameters, and returning a (product,
+            additionalParams) tuple, or None to respond with a 404. May return
+            an awaitable for handleAsgi(). Required if product is not set.
+          contentType: Optional. The Content-Type of responses. Default:
+            detected from the product
+          cacheControl: Optional. The Cache-Control header of successful
+            responses, such as 'public, max-age=86400'. Default: None
+          blockSize: Optional. Size in bytes of the blocks read from files and
+            from the rendering server. Default: 65536
+    """
+    params = inParameters
+    self.product = params.get('product', None)
+    self.parameters = params.get('parameters', None)
+    self.resolve = params.get('resolve', None)
+    if self.product is None and self.resolve is None:
+      raise ValueError("A render proxy needs a product or a resolve callable")
+    if self.product is not None and self.parameters is None:
+      raise ValueError("A render proxy serving a product needs a list of parameters")
+    self.contentType = params.get('contentType', None)
+    self.cacheControl = params.get('cacheControl', None)
+    self.blockSize = params.get('blockSize', self.BLOCK_SIZE)
+
+  async def handleAsgi(self, scope, receive, send):
+    """
+      ASGI application serving rendered products.
+
+      Args:
+        scope: Required. The ASGI connection scope.
+        receive: Required. The ASGI receive coroutine function.
+        send: Required. The ASGI send coroutine function.
+    """
+    if scope['type'] != 'http':
+      return
+
+    async def start(status, headers):
+      await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+      })
+
+    async def respond(status, headers):
+      await start(status, headers)
+      await send({'type': 'http.response.body', 'body': b''})
+
+    if scope['method'] != 'GET':
+      await respond(405, [('Allow', 'GET')])
+      return
+    resolved = self.__resolve(scope['path'], scope.get('query_string', b'').decode('latin-1'))
+    if inspect.isawaitable(resolved):
+      resolved = await resolved
+    if resolved is None:
+      await respond(404, [])
+      return
+    product, additionalParams = resolved
+    await product._loadPropertyDefaults()
+    renderCache = product.serverManager.getRenderCache()
+    key = None
+    conditionalHeaders = None
+    f = None
+    if renderCache is not None:
+      key = renderCache.buildKey(product._setFinalParams(additionalParams))
+      f = self.__openFile(renderCache.get(key))
+      conditionalHeaders = product._conditionalHeaders(renderCache.getValidators(key))
+
+    while f is None:
+      async with contextlib.AsyncExitStack() as stack:
+        try:
+          r, download = await stack.enter_async_context(product._openRenderStream(additionalParams, conditionalHeaders))
+        except PijazError:
+          await respond(502, [])
+          return
+        if r.status == 304 and conditionalHeaders is not None:
+          # Fetch the product in full if evicted while revalidating.
+          f = self.__openFile(renderCache.revalidate(key))
+          conditionalHeaders = None
+          continue
+        if r.status != 200:
+          await respond(502, [])
+          return
+        writer = None
+        if renderCache is not None:
+          try:
+            writer = renderCache.openWriter(key, product._responseValidators(r.headers),
+              r.headers.get('Content-Type', None))
+            stack.callback(writer.abort)
+          except (IOError, OSError):
+            pass
+        await start(200, self.__responseHeaders(r))
+        async for chunk in r.content.iter_chunked(self.blockSize):
+          download['bytes'] += len(chunk)
+          if writer is not None:
+            try:
+              writer.write(chunk)
+            except (IOError, OSError):
+              # Keep serving the client when the render cache fails.
+              writer.abort()
+              writer = None
+          await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+        if writer is not None:
+          writer.commit()
+        return
+
+    with f:
+      ifNoneMatch = None
+      for name, value in scope.get('headers', []):
+        if name.lower() == b'if-none-match':
+          ifNoneMatch = value.decode('latin-1')
+      status, headers = self.__cachedHeaders(renderCache, key, f, ifNoneMatch)
+      if status == 304:
+        await respond(304, headers)
+        return
+      await start(200, headers)
+      if 'http.response.zerocopysend' in (scope.get('extensions', None) or {}):
+        await send({'type': 'http.response.zerocopysend', 'file': f})
+        return
+      for block in self.__mappedBlocks(f):
+        await send({'type': 'http.response.body', 'body': block, 'more_body': True})
+      await send({'type': 'http.response.body', 'body': b''})
+
+  def handleWsgi(self, environ, startResponse):
+    """
+      WSGI application serving rendered products.
+
+      Args:
+        environ: Required. The WSGI environment.
+        startResponse: Required. The WSGI start_response callable.
+
+      Returns:
+        An iterable of byte strings.
+    """
+    if environ['REQUEST_METHOD'] != 'GET':
+      startResponse(self.__wsgiStatus(405), [('Allow', 'GET')])
+      return []
+    resolved = self.__resolve(environ.get('PATH_INFO', ''), environ.get('QUERY_STRING', ''))
+    if resolved is None:
+      startResponse(self.__wsgiStatus(404), [])
+      return []
+    product, additionalParams = resolved
+    renderCache = product.serverManager.getRenderCache()
+    key = None
+    conditionalHeaders = None
+    f = None
+    if renderCache is not None:
+      key = renderCache.buildKey(product._setFinalParams(additionalParams))
+      f = self.__openFile(renderCache.get(key))
+      conditionalHeaders = product._conditionalHeaders(renderCache.getValidators(key))
+
+    while f is None:
+      stack = contextlib.ExitStack()
+      try:
+        r, download = stack.enter_context(product._openRenderStream(additionalParams, conditionalHeaders))
+      except PijazError:
+        startResponse(self.__wsgiStatus(502), [])
+        return []
+      if r.status_code == 304 and conditionalHeaders is not None:
+        stack.close()
+        # Fetch the product in full if evicted while revalidating.
+        f = self.__openFile(renderCache.revalidate(key))
+        conditionalHeaders = None
+        continue
+      if r.status_code != 200:
+        stack.close()
+        startResponse(self.__wsgiStatus(502), [])
+        return []
+      writer = None
+      if renderCache is not None:
+        try:
+          writer = renderCache.openWriter(key, product._responseValidators(r.headers),
+            r.headers.get('Content-Type', None))
+          stack.callback(writer.abort)
+        except (IOError, OSError):
+          pass
+      try:
+        startResponse(self.__wsgiStatus(200), self.__responseHeaders(r))
+      except BaseException:
+        stack.close()
+        raise
+
+      def tee(r, download, writer):
+        for chunk in r.iter_content(self.blockSize):
+          download['bytes'] += len(chunk)
+          if writer is not None:
+            try:
+              writer.write(chunk)
+            except (IOError, OSError):
+              # Keep serving the client when the render cache fails.
+              writer.abort()
+              writer = None
+          yield chunk
+        if writer is not None:
+          writer.commit()
+
+      return _PijazResponseBody(tee(r, download, writer), stack.close)
+
+    with contextlib.ExitStack() as stack:
+      stack.enter_context(f)
+      status, headers = self.__cachedHeaders(renderCache, key, f, environ.get('HTTP_IF_NONE_MATCH', None))
+      startResponse(self.__wsgiStatus(status), headers)
+      if status == 304:
+        return []
+      stack.pop_all()
+    fileWrapper = environ.get('wsgi.file_wrapper', None)
+    if fileWrapper is not None:
+      return fileWrapper(f, self.blockSize)
+    return _PijazResponseBody(self.__mappedBlocks(f), f.close)
+
+  # PRIVATE METHODS.
+
+  def __cachedHeaders(self, renderCache, key, f, ifNoneMatch=None):
+    """
+      Build the response status and headers of a product served from the
+      render cache.
+    """
+    validators = renderCache.getValidators(key) or {}
+    headers = []
+    if validators.get('etag', None):
+      headers.append(('ETag', validators['etag']))
+    if validators.get('lastModified', None):
+      headers.append(('Last-Modified', validators['lastModified']))
+    if self.cacheControl:
+      headers.append(('Cache-Control', self.cacheControl))
+    if self.__notModified(validators, ifNoneMatch):
+      return 304, headers
+    contentType = self.contentType or renderCache.getContentType(key)
+    if contentType is None:
+      # Stored without a Content-Type, by an older version.
+      contentType = self.__contentType(f.read(16))
+      f.seek(0)
+    headers.append(('Content-Type', contentType))
+    headers.append(('Content-Length', str(os.fstat(f.fileno()).st_size)))
+    return 200, headers
+
+  def __contentType(self, head):
+    """
+      Detect the content type of a product from its leading bytes.
+    """
+    for magic, contentType in self.MAGIC_TYPES:
+      if head.startswith(magic):
+        return contentType
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+      return 'image/webp'
+    return self.DEFAULT_CONTENT_TYPE
+
+  def __mappedBlocks(self, f):
+    """
+      Read a file in blocks through a memory map.
+    """
+    size = os.fstat(f.fileno()).st_size
+    if not size:
+      return
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+      for offset in range(0, size, self.blockSize):
+        yield mapped[offset:offset + self.blockSize]
+
+  def __notModified(self, validators, ifNoneMatch):
+    """
+      Check if the If-None-Match header of a request matches the ETag of a
+      product.
+    """
+    etag = validators.get('etag', None)
+    if not etag or not ifNoneMatch:
+      return False
+    tags = [tag.strip() for tag in ifNoneMatch.split(',')]
+    return '*' in tags or etag in tags or etag in ['W/' + tag for tag in tags]
+
+  def __openFile(self, path):
+    """
+      Open the cached file of a product, or return None if it is not cached.
+    """
+    if path is None:
+      return None
+    try:
+      return open(path, 'rb')
+    except (IOError, OSError):
+      # Evicted since the lookup.
+      return None
+
+  def __queryParams(self, query):
+    """
+      Extract the render parameters passed in a query string.
+    """
+    return dict((key, value) for key, value in parse_qsl(query)
+      if key not in self.RESERVED_PARAMETERS and (self.parameters is None or key in self.parameters))
+
+  def __resolve(self, path, query):
+    """
+      Resolve a request to a (product, additionalParams) tuple, or None.
+    """
+    params = self.__queryParams(query)
+    if self.resolve is not None:
+      return self.resolve(path, params)
+    return self.product, params
+
+  def __responseHeaders(self, r):
+    """
+      Build the headers of a product streamed from the rendering server.
+    """
+    headers = [('Content-Type', self.contentType or r.headers.get('Content-Type', None) or self.DEFAULT_CONTENT_TYPE)]
+    for name in ('Content-Length', 'ETag', 'Last-Modified'):
+      value = r.headers.get(name, None)
+      if value is not None:
+        headers.append((name, value))
+    if self.cacheControl:
+      headers.append(('Cache-Control', self.cacheControl))
+    return headers
+
+  def __wsgiStatus(self, status):
+    """
+      Build a WSGI status line.
+    """
+    return "%d %s" % (status, HTTPStatus(status).phrase)
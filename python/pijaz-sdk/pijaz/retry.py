@@ -0,0 +1,313 @@
+"""
+
+  Retry policy and circuit breaker shared by API commands and render
+  downloads.
+
+  PijazRetryPolicy PUBLIC METHODS:
+
+  __init__(inParameters)
+  execute(url, attemptFunction, statusCodeOf, retryAfterOf, discard)
+  executeAsync(url, attemptFunction, statusCodeOf, retryAfterOf, discard)
+  getCircuitBreaker()
+  getDelay(attempt)
+
+  PijazRetryPolicy PRIVATE METHODS:
+
+  __afterAttempt(host, attempt, startTime, result, error, statusCodeOf, retryAfterOf)
+  __beforeAttempt(host)
+  __parseRetryAfter(value)
+
+  PijazCircuitBreaker PUBLIC METHODS:
+
+  __init__(inParameters)
+  allowRequest(host)
+  getState(host)
+  recordFailure(host)
+  recordSuccess(host)
+
+"""
+
+import asyncio
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+from pijaz.exceptions import PijazCircuitOpenError
+
+class PijazCircuitBreaker(object):
+  """
+    Thread-safe per-host circuit breaker.
+
+    After failureThreshold consecutive failures, a host's circuit opens and
+    requests to it fail fast. Once resetTimeout seconds have passed, a single
+    trial request is let through: success closes the circuit, failure opens it
+    again.
+  """
+
+  CLOSED = 'closed'
+  OPEN = 'open'
+  HALF_OPEN = 'half-open'
+
+  FAILURE_THRESHOLD = 5
+  RESET_TIMEOUT = 30
+
+  # PUBLIC METHODS.
+
+  def __init__(self, inParameters=None):
+    """
+      Inits a CircuitBreaker object.
+
+      Args:
+
+        inParameters: Optional. A dictionary with the following key/value pairs.
+          failureThreshold: Optional. Number of consecutive failures that open
+            a host's circuit. Default: 5
+          resetTimeout: Optional. Seconds an open circuit waits before letting
+            a trial request through. Default: 30
+    """
+    params = inParameters or {}
+    self.failureThreshold = params.get('failureThreshold', self.FAILURE_THRESHOLD)
+    self.resetTimeout = params.get('resetTimeout', self.RESET_TIMEOUT)
+    self.hosts = {}
+    self.lock = threading.Lock()
+
+  def allowRequest(self, host):
+    """
+      Check whether a request to a host may be sent.
+
+      Args:
+        host: The host name, with port if any.
+
+      Returns:
+        True if the request may be sent, False if the circuit is open.
+    """
+    with self.lock:
+      state = self.hosts.get(host, None)
+      if state is None or state['state'] == self.CLOSED:
+        return True
+      if state['state'] == self.OPEN and time.time() >= state['openedAt'] + self.resetTimeout:
+        state['state'] = self.HALF_OPEN
+        return True
+      return False
+
+  def getState(self, host):
+    """
+      Get the circuit state for a host.
+
+      Returns:
+        One of PijazCircuitBreaker.CLOSED, OPEN or HALF_OPEN.
+    """
+    with self.lock:
+      state = self.hosts.get(host, None)
+      return state['state'] if state is not None else self.CLOSED
+
+  def recordFailure(self, host):
+    """
+      Record a failed request to a host.
+    """
+    with self.lock:
+      state = self.hosts.setdefault(host, {
+        'state': self.CLOSED,
+        'failures': 0,
+        'openedAt': 0,
+      })
+      state['failures'] += 1
+      if state['state'] == self.HALF_OPEN or state['failures'] >= self.failureThreshold:
+        state['state'] = self.OPEN
+        state['openedAt'] = time.time()
+
+  def recordSuccess(self, host):
+    """
+      Record a successful request to a host, closing its circuit.
+    """
+    with self.lock:
+      self.hosts.pop(host, None)
+
+class PijazRetryPolicy(object):
+  """
+    Retry policy with exponential backoff and full jitter, retrying on
+    transport errors and on configurable HTTP status codes, within an overall
+    deadline. Requests to hosts whose circuit is open fail fast with
+    PijazCircuitOpenError.
+  """
+
+  MAX_ATTEMPTS = 2
+  BACKOFF_BASE = 0.1
+  BACKOFF_MAX = 5.0
+  RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+  # PUBLIC METHODS.
+
+  def __init__(self, inParameters=None):
+    """
+      Inits a RetryPolicy object.
+
+      Args:
+
+        inParameters: Optional. A dictionary with the following key/value pairs.
+          maxAttempts: Optional. Maximum number of attempts per request,
+            including the first. Default: 2
+          backoffBase: Optional. Seconds of backoff before the first retry,
+            doubled for each further retry. Default: 0.1
+          backoffMax: Optional. Maximum seconds of backoff between attempts.
+            Default: 5
+          jitter: Optional. If True, each backoff is a random time between 0
+            and the computed backoff. Default: True
+          retryStatusCodes: Optional. HTTP status codes that are retried.
+            Default: (429, 500, 502, 503, 504)
+          deadline: Optional. Maximum total seconds spent on a request,
+            including backoff. Default: None (no deadline)
+          circuitBreaker: Optional. A PijazCircuitBreaker instance, or False to
+            disable circuit breaking. Default: a new PijazCircuitBreaker
+    """
+    params = inParameters or {}
+    self.maxAttempts = params.get('maxAttempts', self.MAX_ATTEMPTS)
+    self.backoffBase = params.get('backoffBase', self.BACKOFF_BASE)
+    self.backoffMax = params.get('backoffMax', self.BACKOFF_MAX)
+    self.jitter = params.get('jitter', True)
+    self.retryStatusCodes = frozenset(params.get('retryStatusCodes', self.RETRY_STATUS_CODES))
+    self.deadline = params.get('deadline', None)
+    circuitBreaker = params.get('circuitBreaker', None)
+    if circuitBreaker is None:
+      circuitBreaker = PijazCircuitBreaker()
+    self.circuitBreaker = circuitBreaker or None
+
+  def execute(self, url, attemptFunction, statusCodeOf, retryAfterOf=None, discard=None):
+    """
+      Run a request, retrying it according to the policy.
+
+      Args:
+        url: Required. The request URL, used to identify the host.
+        attemptFunction: Required. A callable taking the attempt number,
+          starting at 1, which sends the request and returns its result.
+          Transport errors should be raised as exceptions.
+        statusCodeOf: Required. A callable returning the HTTP status code of a
+          result.
+        retryAfterOf: Optional. A callable returning the Retry-After header of
+          a result, or None.
+        discard: Optional. A callable releasing a result that is about to be
+          retried, for example closing a streamed response.
+
+      Returns:
+        The result of the last attempt. A result with a retryable status code
+        is returned once no attempts are left.
+    """
+    host = urlparse(url).netloc
+    startTime = time.time()
+    attempt = 0
+    while True:
+      attempt += 1
+      self.__beforeAttempt(host)
+      result = None
+      error = None
+      try:
+        result = attemptFunction(attempt)
+      except Exception as e:
+        error = e
+      delay = self.__afterAttempt(host, attempt, startTime, result, error, statusCodeOf, retryAfterOf)
+      if delay is None:
+        if error is not None:
+          raise error
+        return result
+      if result is not None and discard is not None:
+        discard(result)
+      time.sleep(delay)
+
+  async def executeAsync(self, url, attemptFunction, statusCodeOf, retryAfterOf=None, discard=None):
+    """
+      Run a request from a coroutine, retrying it according to the policy.
+
+      Takes the same arguments as execute(), except that attemptFunction
+      returns an awaitable.
+    """
+    host = urlparse(url).netloc
+    startTime = time.time()
+    attempt = 0
+    while True:
+      attempt += 1
+      self.__beforeAttempt(host)
+      result = None
+      error = None
+      try:
+        result = await attemptFunction(attempt)
+      except Exception as e:
+        error = e
+      delay = self.__afterAttempt(host, attempt, startTime, result, error, statusCodeOf, retryAfterOf)
+      if delay is None:
+        if error is not None:
+          raise error
+        return result
+      if result is not None and discard is not None:
+        discard(result)
+      await asyncio.sleep(delay)
+
+  def getCircuitBreaker(self):
+    """
+      Get the circuit breaker used by the policy.
+
+      Returns:
+        The PijazCircuitBreaker instance, or None if circuit breaking is
+        disabled.
+    """
+    return self.circuitBreaker
+
+  def getDelay(self, attempt):
+    """
+      Compute the backoff before the next attempt.
+
+      Args:
+        attempt: The number of the attempt that just failed, starting at 1.
+
+      Returns:
+        The delay in seconds.
+    """
+    delay = min(self.backoffMax, self.backoffBase * (2 ** (attempt - 1)))
+    if self.jitter:
+      delay = random.uniform(0, delay)
+    return delay
+
+  # PRIVATE METHODS.
+
+  def __afterAttempt(self, host, attempt, startTime, result, error, statusCodeOf, retryAfterOf):
+    """
+      Record the outcome of an attempt with the circuit breaker and decide
+      whether to retry.
+
+      Returns:
+        The delay in seconds before the next attempt, or None to stop.
+    """
+    statusCode = statusCodeOf(result) if error is None else None
+    retryable = error is not None or statusCode in self.retryStatusCodes
+    if self.circuitBreaker is not None:
+      # 429 means the host is up but throttling, it does not trip the breaker.
+      if error is not None or statusCode >= 500:
+        self.circuitBreaker.recordFailure(host)
+      else:
+        self.circuitBreaker.recordSuccess(host)
+    if not retryable or attempt >= self.maxAttempts:
+      return None
+    delay = self.getDelay(attempt)
+    if error is None and retryAfterOf is not None:
+      retryAfter = self.__parseRetryAfter(retryAfterOf(result))
+      if retryAfter is not None:
+        delay = max(delay, min(retryAfter, self.backoffMax))
+    if self.deadline is not None and time.time() + delay - startTime > self.deadline:
+      return None
+    return delay
+
+  def __beforeAttempt(self, host):
+    """
+      Fail fast if the circuit for a host is open.
+    """
+    if self.circuitBreaker is not None and not self.circuitBreaker.allowRequest(host):
+      raise PijazCircuitOpenError("Circuit open for host %s, request refused" % host)
+
+  def __parseRetryAfter(self, value):
+    """
+      Parse a Retry-After header given in seconds.
+    """
+    try:
+      return float(value)
+    except (TypeError, ValueError):
+      return None
@@ -4,31 +4,85 @@
  
   __init__(inParameters)
   buildRenderCommand(inParameters)
-  buildRenderServerUrlRequest(inParamaters)
+  buildRenderServerUrlRequest(inParamaters, renderParameters)
+  buildRenderUrl(inParameters)
+  buildRenderUrls(inParameters, additionalParamsList)
+  coalesceDownload(key, downloadFunction)
   getApiKey()
+  getApiLimiter()
+  getApiServerPool()
   getApiServerUrl()
   getApiVersion()
   getAppId()
+  getHttpSession()
+  getInstrumentation()
+  getRenderCache()
+  getRenderLimiter()
+  getRenderServerPool()
   getRenderServerUrl()
+  getRetryPolicy()
+  getTokenCache()
+  getWorkflowDefaults()
+  prewarmTokens(workflows, maxWorkers, pin)
   sendApiCommand(inParameters)
+  sendRenderRequest(url, headers, stream)
+  unpinTokens(workflows)
+
+  PROTECTED METHODS:
+
+  _buildAccessTokenCommand(workflow, xml)
+  _buildApiCommandRequest(params)
+  _buildMemoizedRenderUrl(params, accessInfo)
+  _buildRenderServerQueryParams(params, accessInfo)
+  _buildRenderUrlFromPairs(encodedPairs, additionalParams, renderParameters)
+  _encodeQueryPairs(queryParams)
+  _instrumentApiCommand(command, attempt, startTime, statusCode, error)
+  _instrumentRenderCommand(workflow, startTime, success)
+  _isRenderRequestAllowed(accessInfo)
+  _processAccessToken(data)
+  _processApiResponse(statusCode, data)
+  _renderServerFor(renderParameters)
+  _tokenTargets(workflows)
  
   PRIVATE METHODS:
  
-  __buildRenderServerQueryParams(params)
-  __extractInfo(data)
-  __extractResult(data)
-  __httpRequest(url, headers, method, data, retry)
-  __isRenderRequestAllowed(product)
-  __processAccessToken(params, data)
-  __sendApiCommand(params, retry)
+  __buildEndpointPool(servers)
+  __buildHttpSession(params)
+  __getAccessInfo(renderParameters)
+  __httpRequest(url, method, data)
+  __parseApiResponse(data)
+  __requestAccessInfo(workflow, xml)
+  __sendApiCommand(params)
+  __urlCacheKey(renderParameters)
 
 """
 
-import copy
 import json
 import requests
+import requests.adapters
 import time
-import urllib
+from collections import ChainMap
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+# orjson is used to parse API responses when installed, with
+# pip install pijaz-sdk[fast].
+try:
+  import orjson
+  jsonLoads = orjson.loads
+except ImportError:
+  jsonLoads = json.loads
+
+from pijaz.api_result import PijazApiResult
+from pijaz.endpoint_pool import PijazEndpointPool
+from pijaz.exceptions import PijazApiError, PijazHttpError, PijazResponseError
+from pijaz.instrumentation import PijazInstrumentation
+from pijaz.lru_cache import PijazLruCache
+from pijaz.rate_limit import PijazRateLimiter
+from pijaz.render_cache import PijazRenderCache
+from pijaz.retry import PijazRetryPolicy
+from pijaz.single_flight import PijazSingleFlight
+from pijaz.token_cache import PijazTokenCache
 
 class PijazServerManager(object):
   """ 
@@ -41,6 +95,13 @@ class PijazServerManager(object):
   PIJAZ_RENDER_SERVER = "http://render.pijaz.com/"
   SERVER_REQUEST_ATTEMPTS = 2
   REFRESH_FUZZ_SECONDS = 10
+  TOKEN_CACHE_SIZE = 256
+  URL_CACHE_SIZE = 1024
+  HTTP_POOL_CONNECTIONS = 10
+  HTTP_POOL_MAXSIZE = 10
+  HTTP_CONNECT_TIMEOUT = 5
+  HTTP_READ_TIMEOUT = 30
+  PREWARM_MAX_WORKERS = 8
 
   # PUBLIC METHODS.
 
@@ -56,22 +117,89 @@ class PijazServerManager(object):
             be kept confidential, and is used to allow the associated client to
             access the API server.
           renderServer: Optional. The base URL of the rendering service. Include
-            the trailing slash. Default: http://render.pijaz.com/
+            the trailing slash. A list of base URLs of interchangeable
+            rendering servers, or a PijazEndpointPool instance, can be given
+            instead, render URLs are then pinned to a server by their render
+            parameters. Default: http://render.pijaz.com/
           apiServer: Optional. The base URL of the API service. Include
-            the trailing slash. Default: http://api.pijaz.com/
+            the trailing slash. A list of base URLs of interchangeable API
+            servers, or a PijazEndpointPool instance, can be given instead,
+            each command then goes to the least loaded server.
+            Default: http://api.pijaz.com/
           refreshFuzzSeconds: Optional. Number of seconds to shave off the lifetime
-            of a rendering access token, this allows a smooth re-request for a new
-            set of access params. Default: 10
+            of a rendering access token, so that render URLs stay valid while
+            clients fetch them. A new set of access params is requested in the
+            background twice that many seconds before the end of the lifetime,
+            this allows a smooth re-request. Default: 10
           apiVersion: Optional. The API version to use. Currently, only version 1
             is supported. Default: 1
+          tokenCacheSize: Optional. Maximum number of workflow/xml rendering
+            access tokens shared between products. Default: 256
+          tokenStore: Optional. A PijazTokenStore instance, used to share
+            rendering access tokens with other processes. Default: None
+          httpSession: Optional. A requests.Session instance used for all
+            requests to the API and rendering servers. If not supplied, a
+            session with a keep-alive connection pool is created.
+          httpPoolConnections: Optional. Number of per-host connection pools to
+            keep in the created session. Default: 10
+          httpPoolMaxSize: Optional. Maximum number of connections to keep open
+            per host in the created session. Default: 10
+          httpConnectTimeout: Optional. Seconds to wait for a connection to a
+            server to be established. Default: 5
+          httpReadTimeout: Optional. Seconds to wait for a server to send data.
+            Default: 30
+          renderCache: Optional. A PijazRenderCache instance, used by products
+            to serve repeated renders from local disk. Default: None
+          urlCacheSize: Optional. Maximum number of render URLs memoized by
+            buildRenderUrl(), 0 disables memoization. Default: 1024
+          instrumentation: Optional. A PijazInstrumentation instance, notified
+            of API commands, token cache events, render commands and product
+            downloads. Default: no-op
+          retryPolicy: Optional. A PijazRetryPolicy instance, used for API
+            commands and render requests. Default: a policy making 2 attempts
+            with exponential backoff and a per-host circuit breaker
+          apiLimiter: Optional. A PijazRateLimiter instance, limiting the rate
+            and concurrency of requests to the API server. Default: unlimited
+          renderLimiter: Optional. A PijazRateLimiter instance, limiting the
+            rate and concurrency of product downloads from the rendering
+            server. Default: unlimited
+          coalesceDownloads: Optional. If True, identical product downloads in
+            flight at the same time are made once, and shared by every caller.
+            Default: True
+          workflowDefaults: Optional. A PijazWorkflowDefaults instance, used
+            by products without productPropertyDefaults to drop render
+            parameters equal to the defaults declared by their workflow.
+            Default: None
     """
     params = inParameters
     self.appId = params['appId']
     self.apiKey = params['apiKey']
-    self.apiServer = params.get('apiServer', self.PIJAZ_API_SERVER)
-    self.renderServer = params.get('renderServer', self.PIJAZ_RENDER_SERVER)
+    self.apiServers = self.__buildEndpointPool(params.get('apiServer', self.PIJAZ_API_SERVER))
+    self.renderServers = self.__buildEndpointPool(params.get('renderServer', self.PIJAZ_RENDER_SERVER))
+    self.pinRenderServers = len(self.renderServers.getEndpoints()) > 1
     self.refreshFuzzSeconds = params.get('refreshFuzzSeconds', self.REFRESH_FUZZ_SECONDS)
     self.apiVersion = params.get('apiVersion', self.PIJAZ_API_VERSION)
+    self.instrumentation = params.get('instrumentation', None) or PijazInstrumentation()
+    self.tokenCache = PijazTokenCache({
+      'maxSize': params.get('tokenCacheSize', self.TOKEN_CACHE_SIZE),
+      'refreshFuzzSeconds': self.refreshFuzzSeconds,
+      'instrumentation': self.instrumentation,
+      'store': params.get('tokenStore', None),
+    })
+    self.httpTimeout = (
+      params.get('httpConnectTimeout', self.HTTP_CONNECT_TIMEOUT),
+      params.get('httpReadTimeout', self.HTTP_READ_TIMEOUT),
+    )
+    self.httpSession = params.get('httpSession', None) or self.__buildHttpSession(params)
+    self.renderCache = params.get('renderCache', None)
+    self.urlCache = PijazLruCache(params.get('urlCacheSize', self.URL_CACHE_SIZE))
+    self.retryPolicy = params.get('retryPolicy', None) or PijazRetryPolicy({
+      'maxAttempts': self.SERVER_REQUEST_ATTEMPTS,
+    })
+    self.apiLimiter = params.get('apiLimiter', None) or PijazRateLimiter()
+    self.renderLimiter = params.get('renderLimiter', None) or PijazRateLimiter()
+    self.downloadFlight = PijazSingleFlight() if params.get('coalesceDownloads', True) else None
+    self.workflowDefaults = params.get('workflowDefaults', None)
 
   def buildRenderCommand(self, inParameters):
     """ 
@@ -83,41 +211,135 @@ class PijazServerManager(object):
           renderParameters: A dictionary of all params sent to the render request.
      
       Returns:
-        If successful, a dictionary of query parameters to pass to the rendering
+        If successful, a mapping of query parameters to pass to the rendering
         server. These can be converted into a full URL by calling
         buildRenderServerUrlRequest(params).
     """
     params = inParameters
-    if self.__isRenderRequestAllowed(params['product']):
-      return self.__buildRenderServerQueryParams(params)
-    else:
-      commandParameters = {
-        'workflow': params['renderParameters']['workflow'],
-      }
-      if 'xml' in params['renderParameters']:
-        commandParameters['xml'] = params['renderParameters']['xml']
-      
-      options = {
-        'command': 'get-token',
-        'commandParameters': commandParameters,
-      }
-      result = self.sendApiCommand(options)
-      if result['success']: 
-        return self.__processAccessToken(params, result['data'])
+    startTime = time.time()
+    accessInfo = self.__getAccessInfo(params['renderParameters'])
+    allowed = self._isRenderRequestAllowed(accessInfo)
+    queryParams = None
+    if allowed:
+      queryParams = self._buildRenderServerQueryParams(params, accessInfo)
+    self._instrumentRenderCommand(params['renderParameters']['workflow'], startTime, allowed)
+    return queryParams
 
-  def buildRenderServerUrlRequest(self, inParameters):
+  def buildRenderServerUrlRequest(self, inParameters, renderParameters=None):
     """ 
       Builds a fully qualified render request URL.
      
+      Query parameters are encoded in sorted order, so identical render
+      requests always produce identical URLs. With several rendering servers,
+      the URL is pinned to a server by its render parameters.
+     
       Args:
         inParameters: A dictionary of query parameters for the render request.
+        renderParameters: Optional. The render parameters the URL is pinned
+          by, without the rendering access parameters, so that the server does
+          not change with the access token. Default: inParameters
      
       Returns:
         The constructed URL.
     """
-    url = self.getRenderServerUrl() + "render-image?" + urllib.urlencode(inParameters)
+    if renderParameters is None:
+      renderParameters = inParameters
+    url = self._renderServerFor(renderParameters) + "render-image?" + urlencode(sorted(inParameters.items()))
+    return url
+
+  def buildRenderUrl(self, inParameters):
+    """ 
+      Build a fully qualified render request URL for a product.
+     
+      URLs are memoized on the final render parameters and the current access
+      token, so repeated requests for the same render reuse the same URL until
+      the token is refreshed.
+     
+      Args:
+        inParameters: A dictionary with the following key/value pairs:
+          product: An instance of the PijazProduct class.
+          renderParameters: A dictionary of all params sent to the render request.
+     
+      Returns:
+        The constructed URL, or None if no valid rendering access token could
+        be obtained.
+
+      Raises:
+        PijazApiError: The API server refused the rendering access token, the
+          error message includes its result text.
+    """
+    params = inParameters
+    startTime = time.time()
+    accessInfo = self.__getAccessInfo(params['renderParameters'])
+    allowed = self._isRenderRequestAllowed(accessInfo)
+    url = None
+    if allowed:
+      url = self._buildMemoizedRenderUrl(params, accessInfo)
+    self._instrumentRenderCommand(params['renderParameters']['workflow'], startTime, allowed)
     return url
 
+  def buildRenderUrls(self, inParameters, additionalParamsList):
+    """ 
+      Lazily build render request URLs for many variants of a product.
+     
+      The access token is checked once for the whole batch, and again only
+      once it enters its refresh window. The query parameters shared by all
+      URLs are encoded once, so each URL only costs the encoding of its own
+      parameters. URLs are identical to those built by buildRenderUrl(), but
+      are not memoized.
+     
+      Args:
+        inParameters: A dictionary with the following key/value pairs:
+          product: An instance of the PijazProduct class.
+          renderParameters: A mapping of the render parameters shared by all
+            URLs, including the workflow.
+        additionalParamsList: An iterable of dictionaries of render parameters,
+          one per URL, layered over the shared render parameters. The workflow
+          cannot be overridden.
+     
+      Returns:
+        A generator of URLs, yielding None for a URL if no rendering access
+        token could be obtained.
+    """
+    params = inParameters
+    workflow = params['renderParameters']['workflow']
+    encodedPairs = None
+    refreshAt = None
+    for additionalParams in additionalParamsList:
+      if refreshAt is None or time.time() > refreshAt:
+        startTime = time.time()
+        accessInfo = self.__getAccessInfo(params['renderParameters'])
+        allowed = self._isRenderRequestAllowed(accessInfo)
+        if allowed:
+          encodedPairs = self._encodeQueryPairs(self._buildRenderServerQueryParams(params, accessInfo))
+          refreshAt = self.tokenCache.refreshTimestamp(accessInfo)
+        else:
+          encodedPairs = None
+          refreshAt = None
+        self._instrumentRenderCommand(workflow, startTime, allowed)
+      if encodedPairs is None:
+        yield None
+      else:
+        yield self._buildRenderUrlFromPairs(encodedPairs, additionalParams, params['renderParameters'])
+
+  def coalesceDownload(self, key, downloadFunction):
+    """ 
+      Run a product download, unless an identical download is already in
+      flight, in which case wait for its result instead.
+     
+      Args:
+        key: Required. A hashable key identifying the download, built from the
+          final render parameters of the product.
+        downloadFunction: Required. A callable taking no arguments, which
+          downloads the product.
+     
+      Returns:
+        The return value of downloadFunction, shared by every caller.
+    """
+    if self.downloadFlight is None:
+      return downloadFunction()
+    return self.downloadFlight.do(key, downloadFunction)
+
   def getApiKey(self):
     """ 
       Get the API key of the client application.
@@ -127,14 +349,33 @@ class PijazServerManager(object):
     """
     return self.apiKey
 
+  def getApiLimiter(self):
+    """ 
+      Get the rate limiter for requests to the API server.
+     
+      Returns:
+        The PijazRateLimiter instance.
+    """
+    return self.apiLimiter
+
+  def getApiServerPool(self):
+    """ 
+      Get the pool of API servers.
+     
+      Returns:
+        The PijazEndpointPool instance.
+    """
+    return self.apiServers
+
   def getApiServerUrl(self):
     """ 
-      Get current API server URL.
+      Get current API server URL. With several API servers, this is the
+      server the next command should go to.
      
       Returns:
         The API server URL.
     """
-    return self.apiServer
+    return self.apiServers.choose()
 
   def getApiVersion(self):
     """ 
@@ -154,15 +395,142 @@ class PijazServerManager(object):
     """
     return self.appId
 
+  def getHttpSession(self):
+    """ 
+      Get the HTTP session used for requests to the API and rendering servers.
+     
+      Returns:
+        The requests.Session instance.
+    """
+    return self.httpSession
+
+  def getInstrumentation(self):
+    """ 
+      Get the instrumentation notified of server manager and product events.
+     
+      Returns:
+        The PijazInstrumentation instance.
+    """
+    return self.instrumentation
+
+  def getRenderCache(self):
+    """ 
+      Get the local cache of rendered products.
+     
+      Returns:
+        The PijazRenderCache instance, or None if renders are not cached.
+    """
+    return self.renderCache
+
+  def getRenderLimiter(self):
+    """ 
+      Get the rate limiter for product downloads from the rendering server.
+     
+      Returns:
+        The PijazRateLimiter instance.
+    """
+    return self.renderLimiter
+
+  def getRenderServerPool(self):
+    """ 
+      Get the pool of rendering servers.
+     
+      Returns:
+        The PijazEndpointPool instance.
+    """
+    return self.renderServers
+
   def getRenderServerUrl(self):
     """ 
-      Get current render server URL.
+      Get current render server URL. With several rendering servers, this is
+      the least loaded one, render URLs are built for the server their render
+      parameters are pinned to instead.
      
       Returns:
         The render server URL.
     """
-    return self.renderServer
-  
+    return self.renderServers.choose()
+
+  def getRetryPolicy(self):
+    """ 
+      Get the retry policy used for API commands and render requests.
+     
+      Returns:
+        The PijazRetryPolicy instance.
+    """
+    return self.retryPolicy
+
+  def getTokenCache(self):
+    """ 
+      Get the rendering access token cache shared by all products.
+     
+      Returns:
+        The PijazTokenCache instance.
+    """
+    return self.tokenCache
+
+  def getWorkflowDefaults(self):
+    """ 
+      Get the loader of the render parameter defaults declared by workflows.
+     
+      Returns:
+        The PijazWorkflowDefaults instance, or None.
+    """
+    return self.workflowDefaults
+
+  def prewarmTokens(self, workflows, maxWorkers=None, pin=True):
+    """ 
+      Fetch rendering access tokens for a set of workflows in parallel, so
+      that first render requests do not wait on the API server. Typically
+      called at application startup.
+     
+      Args:
+        workflows: Required. An iterable of workflow IDs, or of dictionaries
+          with the following key/value pairs:
+            workflow: Required. The workflow ID.
+            xml: Optional. The fully qualified URL to the workflow XML.
+        maxWorkers: Optional. Maximum number of concurrent token requests.
+          Default: 8
+        pin: Optional. If True, the tokens are never evicted from the token
+          cache, and are refreshed in the background before they expire.
+          Default: True
+     
+      Returns:
+        A list with one dictionary per workflow, in order, with the following
+        key/value pairs:
+          workflow: The workflow ID.
+          xml: The workflow XML URL, or None.
+          success: True if a token was obtained, False otherwise.
+          error: The exception raised by the token request, or None.
+    """
+    targets = self._tokenTargets(workflows)
+
+    def prewarm(target):
+      workflow, xml = target
+      key = self.tokenCache.buildKey(workflow, xml)
+      fetchFunction = lambda: self.__requestAccessInfo(workflow, xml)
+      result = {
+        'workflow': workflow,
+        'xml': xml,
+        'success': False,
+        'error': None,
+      }
+      if pin:
+        # Protect the key from eviction while the rest of the batch is fetched.
+        self.tokenCache.pin(key, None)
+      try:
+        result['success'] = self.tokenCache.getOrFetch(key, fetchFunction) is not None
+      except Exception as e:
+        result['error'] = e
+      if pin:
+        self.tokenCache.pin(key, fetchFunction)
+      return result
+
+    if not targets:
+      return []
+    with ThreadPoolExecutor(max_workers=min(maxWorkers or self.PREWARM_MAX_WORKERS, len(targets))) as executor:
+      return list(executor.map(prewarm, targets))
+
 
   """ 
     Send a command to the API server.
@@ -179,50 +547,279 @@ class PijazServerManager(object):
         method: Optional. The HTTP request type. Default: GET
    
     Returns:
-      A dictionary with the following key/value pairs
+      A PijazApiResult object with the following attributes, which can also
+      be read as dictionary keys:
         success: True if the request succeed, False otherwise.
         data: If the request was successful, a dictionary containing the
         response data, if not, a string containing the error message.
+        statusCode: The HTTP status code of the response.
+
+    Raises:
+      PijazApiError: The command could not be sent.
+      PijazResponseError: The server response could not be parsed.
     """
   def sendApiCommand(self, inParameters):
-    return self.__sendApiCommand(inParameters, self.SERVER_REQUEST_ATTEMPTS - 1)
+    return self.__sendApiCommand(inParameters)
 
-  # PRIVATE METHODS.
+  def sendRenderRequest(self, url, headers=None, stream=False):
+    """ 
+      Send a request to the rendering server over the pooled HTTP session.
+      Transport errors and retryable status codes are retried according to the
+      retry policy. A URL pinned to a rendering server that has since been
+      ejected is sent to another server.
+     
+      Args:
+        url: Required. A fully qualified render request URL, as returned by
+          buildRenderServerUrlRequest().
+        headers: Optional. A dictionary of additional request headers.
+        stream: Optional. If True, the response body is not read until it is
+          accessed. Default: False
+     
+      Returns:
+        The requests.Response object of the last attempt.
 
-  def __buildRenderServerQueryParams(self, params):
+      Raises:
+        PijazHttpError: The request failed at the transport level.
+    """
+    url = self.renderServers.reroute(url)
+
+    def sendAttempt(attempt):
+      try:
+        with self.renderServers.track(url) as request:
+          r = self.httpSession.get(url, headers=headers, stream=stream, timeout=self.httpTimeout)
+          request.success = r.status_code < 500
+          return r
+      except requests.RequestException as e:
+        raise PijazHttpError("HTTP request error, method: GET, url: %s" % url) from e
+
+    return self.retryPolicy.execute(url, sendAttempt,
+      lambda r: r.status_code,
+      lambda r: r.headers.get('Retry-After', None),
+      lambda r: r.close())
+
+  def unpinTokens(self, workflows):
     """ 
-      Construct a URL with all user supplied and constructed parameters
+      Stop keeping the tokens of workflows pinned by prewarmTokens() refreshed
+      in the background.
+     
+      Args:
+        workflows: Required. An iterable of workflow IDs or dictionaries, as
+          passed to prewarmTokens().
     """
-    accessInfo = params['product'].getAccessInfo()
-    queryParams = copy.deepcopy(accessInfo['renderAccessParameters'])
-    if 'renderParameters' in params: 
-      for key in params['renderParameters']:
-        queryParams[key] = params['renderParameters'][key]
-    return queryParams
-  
+    for workflow, xml in self._tokenTargets(workflows):
+      self.tokenCache.unpin(self.tokenCache.buildKey(workflow, xml))
+
+  # PROTECTED METHODS.
 
-  def __extractInfo(self, data):
+  def _buildAccessTokenCommand(self, workflow, xml=None):
     """ 
-      Extract the information from a server JSON response.
+      Build the get-token API command for a workflow.
     """
-    try:
-      jsonData = json.loads(data)
-      if jsonData['result']['result_num'] == 0: 
-        return jsonData['info']
-    except:
-      raise "Error parsing JSON response from server: %s" % data
-    return False
-  
-  def __extractResult(self, data):
+    commandParameters = {
+      'workflow': workflow,
+    }
+    if xml is not None:
+      commandParameters['xml'] = xml
+
+    return {
+      'command': 'get-token',
+      'commandParameters': commandParameters,
+    }
+
+  def _buildApiCommandRequest(self, params):
     """ 
-      Extract the result from a server JSON response.
+      Build the URL, HTTP method and request data for an API command. The
+      request data is the command parameters plus the client credentials, the
+      command parameters themselves are left unchanged.
     """
+    url = self.getApiServerUrl() + params['command']
+    method = 'GET'
     try:
-      jsonData = json.loads(data)
-      return jsonData['result']
-    except:
-      raise "Error parsing JSON response from server: %s" % data
-    return False
+      method = params['method'].upper()
+    except KeyError:
+      pass
+
+    data = dict(params.get('commandParameters', {}))
+    data['app_id'] = self.getAppId()
+    data['api_key'] = self.getApiKey()
+    data['api_version'] = self.getApiVersion()
+
+    return url, method, data
+
+  def _buildMemoizedRenderUrl(self, params, accessInfo):
+    """ 
+      Build a render URL, reusing the memoized URL if it was built with the
+      same access info.
+    """
+    key = self.__urlCacheKey(params['renderParameters'])
+    # Pinned servers change when a rendering server is ejected or restored.
+    generation = self.renderServers.getGeneration()
+    if key is not None:
+      entry = self.urlCache.get(key)
+      if entry is not None and entry[0] is accessInfo and entry[1] == generation:
+        return entry[2]
+    url = self.buildRenderServerUrlRequest(self._buildRenderServerQueryParams(params, accessInfo),
+      params['renderParameters'])
+    if key is not None:
+      self.urlCache.set(key, (accessInfo, generation, url))
+    return url
+
+  def _buildRenderServerQueryParams(self, params, accessInfo):
+    """ 
+      Construct a URL with all user supplied and constructed parameters.
+      User supplied parameters are layered over the access parameters, without
+      copying either.
+    """
+    if 'renderParameters' in params: 
+      return ChainMap(params['renderParameters'], accessInfo['renderAccessParameters'])
+    return ChainMap(accessInfo['renderAccessParameters'])
+
+  def _buildRenderUrlFromPairs(self, encodedPairs, additionalParams=None, renderParameters=None):
+    """ 
+      Build a render URL from pre-encoded query parameters, overridden by
+      additional render parameters, in the same sorted order and for the same
+      server as buildRenderServerUrlRequest(). The render parameters the
+      pre-encoded query parameters were built from are needed to pin the URL
+      to a server.
+    """
+    pairs = encodedPairs
+    if additionalParams:
+      pairs = dict(encodedPairs)
+      for key, value in additionalParams.items():
+        if key != 'workflow':
+          pairs[key] = urlencode(((key, value),))
+    finalParams = renderParameters
+    if self.pinRenderServers and additionalParams:
+      finalParams = ChainMap({'workflow': renderParameters['workflow']}, additionalParams, renderParameters)
+    return self._renderServerFor(finalParams) + "render-image?" + '&'.join([pairs[key] for key in sorted(pairs)])
+
+  def _encodeQueryPairs(self, queryParams):
+    """ 
+      Encode each query parameter as a key=value string, keyed on the
+      parameter name.
+    """
+    return dict((key, urlencode(((key, value),))) for key, value in queryParams.items())
+
+  def _instrumentApiCommand(self, command, attempt, startTime, statusCode, error):
+    """ 
+      Report an API command attempt.
+    """
+    self.instrumentation.onApiCommand({
+      'command': command,
+      'attempt': attempt,
+      'duration': time.time() - startTime,
+      'statusCode': statusCode,
+      'error': error,
+    })
+
+  def _instrumentRenderCommand(self, workflow, startTime, success):
+    """ 
+      Report the time taken to build a render command or URL.
+    """
+    self.instrumentation.onRenderCommand({
+      'workflow': workflow,
+      'duration': time.time() - startTime,
+      'success': success,
+    })
+
+  def _isRenderRequestAllowed(self, accessInfo):
+    """ 
+      Verifies that the access parameters are valid for a render request.
+    """
+    return self.tokenCache.isValid(accessInfo)
+
+  def _processAccessToken(self, data):
+    """ 
+      Handles setting up access info from a get-token response.
+    """
+    accessInfo = {}
+
+    # Store the time the access params were obtained -- used to count
+    # against the lifetime param to expire the dictionary.
+    accessInfo['timestamp'] = int(time.time())
+    # Extract the lifetime param, no need to pass this along to the
+    # rendering server.
+    accessInfo['lifetime'] = int(data['lifetime'])
+    del data['lifetime']
+
+    accessInfo['renderAccessParameters'] = data
+
+    return accessInfo
+
+  def _processApiResponse(self, statusCode, data):
+    """ 
+      Convert an API server response into a command result.
+
+      Returns:
+        A PijazApiResult object.
+
+      Raises:
+        PijazResponseError: The response of a successful request is not a
+          valid API response.
+    """
+    if statusCode != 200:
+      return PijazApiResult(False, data, statusCode)
+    result, info = self.__parseApiResponse(data)
+    if result['result_num'] == 0:
+      return PijazApiResult(True, info, statusCode)
+    return PijazApiResult(False, result['result_text'], statusCode)
+
+  def _renderServerFor(self, renderParameters):
+    """ 
+      Get the rendering server a render request is pinned to.
+    """
+    if not self.pinRenderServers:
+      return self.renderServers.choose()
+    return self.renderServers.choosePinned(PijazRenderCache.buildKey(renderParameters))
+
+  def _tokenTargets(self, workflows):
+    """ 
+      Normalize a list of workflow IDs or workflow dictionaries into a list of
+      (workflow, xml) tuples.
+    """
+    targets = []
+    for workflow in workflows:
+      if isinstance(workflow, dict):
+        targets.append((workflow['workflow'], workflow.get('xml', None)))
+      else:
+        targets.append((workflow, None))
+    return targets
+
+  # PRIVATE METHODS.
+
+  def __buildEndpointPool(self, servers):
+    """ 
+      Build the endpoint pool for a server URL, a list of server URLs, or
+      take a PijazEndpointPool instance as is.
+    """
+    if isinstance(servers, PijazEndpointPool):
+      return servers
+    if isinstance(servers, str):
+      servers = [servers]
+    return PijazEndpointPool({'endpoints': list(servers)})
+
+  def __buildHttpSession(self, params):
+    """ 
+      Create a requests session with a keep-alive connection pool.
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+      pool_connections=params.get('httpPoolConnections', self.HTTP_POOL_CONNECTIONS),
+      pool_maxsize=params.get('httpPoolMaxSize', self.HTTP_POOL_MAXSIZE),
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+  def __getAccessInfo(self, renderParameters):
+    """ 
+      Get the access info for a render request from the token cache,
+      requesting a new token from the API server if needed.
+    """
+    workflow = renderParameters['workflow']
+    xml = renderParameters.get('xml', None)
+    return self.tokenCache.getOrFetch(self.tokenCache.buildKey(workflow, xml),
+      lambda: self.__requestAccessInfo(workflow, xml))
 
   def __httpRequest(self, url, method='GET', data=None):
     """
@@ -239,95 +836,92 @@ class PijazServerManager(object):
       Returns:
         A dictionary with the following key/value pairs:
           statusCode: The response status code.
+          retryAfter: The Retry-After response header, or None.
           data: The response data.
     """
     method = method.upper()
     data = data or {}
+    if method not in ('GET', 'POST'):
+      raise ValueError("Unsupported HTTP method: %s" % method)
 
     response = {}
     try:
-      r = None
-      if method == 'GET':
-        r = requests.get(url, params=data)
-      elif method == 'POST':
-        r = requests.post(url, data=data)
+      with self.apiLimiter.limit():
+        if method == 'GET':
+          r = self.httpSession.get(url, params=data, timeout=self.httpTimeout)
+        else:
+          r = self.httpSession.post(url, data=data, timeout=self.httpTimeout)
       response['statusCode'] = r.status_code
+      response['retryAfter'] = r.headers.get('Retry-After', None)
       response['data'] = r.content
-    except:
-      raise "HTTP request error, method: %s, url: %s, data: %s" % (method, url, data)
+    except requests.RequestException as e:
+      raise PijazHttpError("HTTP request error, method: %s, url: %s, data: %s" % (method, url, data)) from e
     return response
 
-  def __isRenderRequestAllowed(self, product):
+  def __parseApiResponse(self, data):
     """ 
-      Verifies that valid access parameters are attached to the product.
-    """
-    accessInfo = product.getAccessInfo()
-    if accessInfo:
-      expire_timestamp = accessInfo['timestamp'] + accessInfo['lifetime'] - self.refreshFuzzSeconds
-      if time <= expire_timestamp:
-        return True
-    return False
+      Parse a server JSON response, once.
 
-  def __processAccessToken(self, params, data):
+      Returns:
+        A (result, info) tuple of the 'result' and 'info' members of the
+        response, info being None if the command failed.
+    """
+    try:
+      jsonData = jsonLoads(data)
+      result = jsonData['result']
+      info = jsonData['info'] if result['result_num'] == 0 else None
+    except (ValueError, KeyError, TypeError) as e:
+      raise PijazResponseError("Error parsing JSON response from server: %s" % data) from e
+    return result, info
+
+  def __requestAccessInfo(self, workflow, xml=None):
     """ 
-      Handles setting up product access info and building render params.
+      Requests a new rendering access token for a workflow from the API server.
     """
-    accessInfo = {}
-
-    # Store the time the access params were obtained -- used to count
-    # against the lifetime param to expire the dictionary.
-    accessInfo['timestamp'] = int(time.time())
-    # Extract the lifetime param, no need to pass this along to the
-    # rendering server.
-    accessInfo['lifetime'] = int(data['lifetime'])
-    del data['lifetime']
-
-    accessInfo['renderAccessParameters'] = data
-
-    params['product'].setAccessInfo(accessInfo)
-
-    return self.__buildRenderServerQueryParams(params)
-  
+    result = self.sendApiCommand(self._buildAccessTokenCommand(workflow, xml))
+    if not result.success:
+      raise PijazApiError("Failed getting a rendering access token for workflow %s: %s" % (workflow, result.data))
+    return self._processAccessToken(result.data)
 
-  def __sendApiCommand(self, params, retry):
+  def __sendApiCommand(self, params):
     """ 
-      Sends a command to the API server.
+      Sends a command to the API server, retrying according to the retry
+      policy.
     """
-    origParams = copy.deepcopy(params)
-    url = self.getApiServerUrl() + params['command']
-    method = 'GET'
-    try:
-      method = params['method'].upper()
-    except KeyError:
-      pass
-
-    params['commandParameters']['app_id'] = self.getAppId()
-    params['commandParameters']['api_key'] = self.getApiKey()
-    params['commandParameters']['api_version'] = self.getApiVersion()
+    url, method, data = self._buildApiCommandRequest(params)
 
     # DEBUG.
-    #print "uuid: " + params['commandParameters']['request_id'] + ", command: " + params['command']
+    #print "uuid: " + data['request_id'] + ", command: " + params['command']
+
+    def sendAttempt(attempt):
+      startTime = time.time()
+      try:
+        with self.apiServers.track(url) as request:
+          result = self.__httpRequest(url, method, data)
+          request.success = result['statusCode'] < 500
+      except PijazHttpError as e:
+        self._instrumentApiCommand(params['command'], attempt, startTime, None, e)
+        raise
+      self._instrumentApiCommand(params['command'], attempt, startTime, result['statusCode'], None)
+      return result
 
-    result = None
     try:
-      result = self.__httpRequest(url, method, params['commandParameters'])
-    except:
-      if retry > 0: 
-        retry = retry -1
-        return self.__sendApiCommand(origParams, retry)
-      else:
-        raise "Error sending API command, path: %s, params: %s" % (url, params['commandParameters'])
-    returnVal = {}
-    if result['statusCode'] == 200: 
-      jsonResult = self.__extractResult(result['data'])
-      if jsonResult['result_num'] == 0: 
-        returnVal['success'] = True
-        returnVal['data'] = self.__extractInfo(result['data'])
-      else:
-        returnVal['success'] = False
-        returnVal['data'] = jsonResult['result_text']
-    else:
-      returnVal['success'] = False
-      returnVal['data'] = result['data']
-    return returnVal
+      result = self.retryPolicy.execute(url, sendAttempt,
+        lambda result: result['statusCode'],
+        lambda result: result['retryAfter'])
+    except PijazHttpError as e:
+      raise PijazApiError("Error sending API command, path: %s, params: %s" % (url, data)) from e
+    return self._processApiResponse(result['statusCode'], result['data'])
+
+  def __urlCacheKey(self, renderParameters):
+    """ 
+      Build the URL memoization key for a set of render parameters, or None
+      if the parameters are not hashable.
+    """
+    key = tuple(sorted(renderParameters.items()))
+    try:
+      hash(key)
+    except TypeError:
+      return None
+    return key
 
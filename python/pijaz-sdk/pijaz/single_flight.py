@@ -0,0 +1,125 @@
+"""
+
+  PUBLIC METHODS:
+
+  __init__()
+  do(key, function)
+  doAsync(key, coroutineFunction)
+  getInFlight()
+
+  PRIVATE METHODS:
+
+  __finishTask(key, task)
+
+"""
+
+import asyncio
+import threading
+
+class _PijazCall(object):
+  """
+    A single in-flight call, shared by every caller waiting on the same key.
+  """
+
+  def __init__(self):
+    self.event = threading.Event()
+    self.result = None
+    self.error = None
+
+class PijazSingleFlight(object):
+  """
+    Coalesces identical concurrent calls, so that only one of them runs and
+    its result, or exception, is returned to every caller.
+
+    Calls are only coalesced while in flight, results are not kept once the
+    call completes. Threads share calls made with do(), and coroutines share
+    calls made with doAsync().
+  """
+
+  # PUBLIC METHODS.
+
+  def __init__(self):
+    """
+      Inits a SingleFlight object.
+    """
+    self.lock = threading.Lock()
+    self.calls = {}
+    self.tasks = {}
+
+  def do(self, key, function):
+    """
+      Run a function, unless a call with the same key is already in flight,
+      in which case wait for its result instead.
+
+      Args:
+        key: Required. A hashable key identifying the call.
+        function: Required. A callable taking no arguments.
+
+      Returns:
+        The return value of the function.
+    """
+    with self.lock:
+      call = self.calls.get(key, None)
+      leader = call is None
+      if leader:
+        call = _PijazCall()
+        self.calls[key] = call
+    if leader:
+      try:
+        call.result = function()
+      except Exception as e:
+        call.error = e
+      finally:
+        with self.lock:
+          del self.calls[key]
+        call.event.set()
+    else:
+      call.event.wait()
+    if call.error is not None:
+      raise call.error
+    return call.result
+
+  async def doAsync(self, key, coroutineFunction):
+    """
+      Await a coroutine, unless a call with the same key is already in
+      flight, in which case await its result instead.
+
+      The call runs as a task, so it completes even if the caller that
+      started it is cancelled, as long as other callers are waiting on it.
+
+      Args:
+        key: Required. A hashable key identifying the call.
+        coroutineFunction: Required. A coroutine function taking no arguments.
+
+      Returns:
+        The result of the coroutine.
+    """
+    task = self.tasks.get(key, None)
+    if task is None:
+      task = asyncio.ensure_future(coroutineFunction())
+      self.tasks[key] = task
+      task.add_done_callback(lambda t: self.__finishTask(key, t))
+    return await asyncio.shield(task)
+
+  def getInFlight(self):
+    """
+      Get the number of calls in flight.
+
+      Returns:
+        The number of calls started with do() or doAsync() and not yet
+        complete.
+    """
+    return len(self.calls) + len(self.tasks)
+
+  # PRIVATE METHODS.
+
+  def __finishTask(self, key, task):
+    """
+      Clean up after a call started with doAsync() completes.
+    """
+    if self.tasks.get(key, None) is task:
+      del self.tasks[key]
+    # Retrieve the exception of calls whose callers were all cancelled, to
+    # keep the event loop from logging it as unhandled.
+    if not task.cancelled():
+      task.exception()
@@ -0,0 +1,460 @@
+"""
+
+  PUBLIC METHODS:
+
+  __init__(inParameters)
+  buildKey(workflow, xml)
+  clear()
+  get(key)
+  getOrFetch(key, fetchFunction)
+  getShared(key)
+  getStore()
+  isValid(accessInfo)
+  needsRefresh(accessInfo, now)
+  pin(key, fetchFunction)
+  refreshTimestamp(accessInfo)
+  remove(key)
+  set(key, accessInfo)
+  unpin(key)
+
+  PRIVATE METHODS:
+
+  __expireTimestamp(accessInfo)
+  __duePinned(now)
+  __fetch(key, flight, fetchFunction)
+  __fetchShared(key, fetchFunction)
+  __notify(event, key)
+  __refreshFuzz(accessInfo)
+  __refreshInBackground(key, fetchFunction)
+  __refreshPinned()
+  __store(key, accessInfo)
+
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from pijaz.instrumentation import PijazInstrumentation
+
+class _PijazTokenFlight(object):
+  """
+    A single in-flight access token request, shared by every caller waiting
+    on the same cache key.
+  """
+
+  def __init__(self):
+    self.event = threading.Event()
+    self.result = None
+    self.error = None
+
+class PijazTokenCache(object):
+  """
+    Thread-safe LRU cache of rendering access info, shared by every product
+    rendering the same workflow/xml pair through a server manager.
+
+    Only one access token request is in flight per cache key at any time,
+    concurrent callers wait on its result. Access info is no longer served
+    refreshFuzzSeconds before the end of its lifetime, so that URLs built with
+    it stay valid while clients fetch them. A replacement is fetched in the
+    background refreshFuzzSeconds before that, while the current access info
+    is still served.
+
+    If a shared token store is configured, tokens are looked up in the store
+    before being requested, and requests are serialized through the store's
+    lock, so a token fetched by one process is used by all of them.
+
+    Pinned keys are never evicted, and are kept refreshed by a background
+    thread whether or not they are requested.
+  """
+
+  DEFAULT_MAX_SIZE = 256
+  REFRESH_FUZZ_SECONDS = 10
+  PIN_RETRY_SECONDS = 5
+
+  # PUBLIC METHODS.
+
+  def __init__(self, inParameters=None):
+    """
+      Inits a TokenCache object.
+
+      Args:
+
+        inParameters: Optional. A dictionary with the following key/value pairs.
+          maxSize: Optional. Maximum number of access tokens to keep, the least
+            recently used token is evicted once the limit is reached.
+            Default: 256
+          refreshFuzzSeconds: Optional. Number of seconds shaved off the
+            lifetime of a rendering access token, after which it is no longer
+            used. A replacement is requested in the background twice that
+            many seconds before the end of the lifetime. Capped at a quarter
+            of the lifetime of short-lived tokens. Default: 10
+          instrumentation: Optional. A PijazInstrumentation instance, notified
+            of cache hits, misses and refreshes. Default: no-op
+          store: Optional. A PijazTokenStore instance shared with other
+            processes. Default: None
+    """
+    params = inParameters or {}
+    self.maxSize = params.get('maxSize', self.DEFAULT_MAX_SIZE)
+    self.refreshFuzzSeconds = params.get('refreshFuzzSeconds', self.REFRESH_FUZZ_SECONDS)
+    self.instrumentation = params.get('instrumentation', None) or PijazInstrumentation()
+    self.store = params.get('store', None)
+    self.entries = OrderedDict()
+    self.inFlight = {}
+    self.pinned = {}
+    self.lock = threading.Lock()
+    self.condition = threading.Condition(self.lock)
+    self.refresher = None
+
+  def __len__(self):
+    with self.lock:
+      return len(self.entries)
+
+  @staticmethod
+  def buildKey(workflow, xml=None):
+    """
+      Build the cache key for a workflow/xml pair.
+
+      Args:
+        workflow: The workflow ID.
+        xml: Optional. The fully qualified URL to the workflow XML.
+
+      Returns:
+        A hashable cache key.
+    """
+    return (workflow, xml)
+
+  def clear(self):
+    """
+      Remove all access tokens from the cache. Tokens in the shared store, if
+      any, are left in place.
+    """
+    with self.lock:
+      self.entries.clear()
+
+  def get(self, key):
+    """
+      Retrieve valid access info from the cache.
+
+      Args:
+        key: A key built with buildKey().
+
+      Returns:
+        The access info dictionary, or None if no unexpired access info is
+        cached for the key.
+    """
+    with self.lock:
+      accessInfo = self.entries.get(key, None)
+      if accessInfo is None:
+        return None
+      if not self.isValid(accessInfo):
+        del self.entries[key]
+        return None
+      self.entries.move_to_end(key)
+      return accessInfo
+
+  def getOrFetch(self, key, fetchFunction):
+    """
+      Retrieve valid access info from the cache, fetching it if needed.
+
+      Args:
+        key: A key built with buildKey().
+        fetchFunction: A callable taking no arguments, which requests new
+          access info from the API server. It should return the access info
+          dictionary, or None if the request failed.
+
+      Returns:
+        The access info dictionary, or None if it could not be fetched.
+    """
+    with self.lock:
+      accessInfo = self.entries.get(key, None)
+      if accessInfo is not None:
+        now = time.time()
+        if now <= self.__expireTimestamp(accessInfo):
+          self.entries.move_to_end(key)
+          refresh = self.needsRefresh(accessInfo, now) and key not in self.inFlight
+          if refresh:
+            self.__refreshInBackground(key, fetchFunction)
+        else:
+          del self.entries[key]
+          accessInfo = None
+      if accessInfo is None:
+        flight = self.inFlight.get(key, None)
+        leader = flight is None
+        if leader:
+          flight = _PijazTokenFlight()
+          self.inFlight[key] = flight
+    if accessInfo is not None:
+      self.__notify('hit', key)
+      if refresh:
+        self.__notify('refresh', key)
+      return accessInfo
+    self.__notify('miss', key)
+    if leader:
+      self.__fetch(key, flight, fetchFunction)
+    else:
+      flight.event.wait()
+    if flight.error is not None:
+      raise flight.error
+    return flight.result
+
+  def getShared(self, key):
+    """
+      Retrieve access info from the shared store, and cache it locally. Only
+      access info outside the refresh window is returned.
+
+      Args:
+        key: A key built with buildKey().
+
+      Returns:
+        The access info dictionary, or None if there is no store or it holds
+        no usable access info for the key.
+    """
+    if self.store is None:
+      return None
+    accessInfo = self.store.get(key)
+    if accessInfo is None or self.needsRefresh(accessInfo):
+      return None
+    with self.lock:
+      self.__store(key, accessInfo)
+    return accessInfo
+
+  def getStore(self):
+    """
+      Get the shared token store.
+
+      Returns:
+        The PijazTokenStore instance, or None.
+    """
+    return self.store
+
+  def isValid(self, accessInfo):
+    """
+      Check whether access info is still within its usable lifetime.
+
+      Args:
+        accessInfo: An access info dictionary.
+
+      Returns:
+        True if the access info can still be used for render requests, False
+        otherwise.
+    """
+    if accessInfo:
+      return time.time() <= self.__expireTimestamp(accessInfo)
+    return False
+
+  def needsRefresh(self, accessInfo, now=None):
+    """
+      Check whether access info has entered the refresh window, and should be
+      replaced before it expires.
+
+      Args:
+        accessInfo: An access info dictionary.
+        now: Optional. The current timestamp. Default: time.time()
+
+      Returns:
+        True if a replacement should be requested, False otherwise.
+    """
+    if now is None:
+      now = time.time()
+    return now > self.refreshTimestamp(accessInfo)
+
+  def pin(self, key, fetchFunction):
+    """
+      Pin a key, so that its access info is never evicted and is refreshed in
+      the background before it expires, even if it is not requested.
+
+      Args:
+        key: A key built with buildKey().
+        fetchFunction: A callable taking no arguments, which requests new
+          access info from the API server, as for getOrFetch(). If None, the
+          key is only protected from eviction, and the caller is responsible
+          for refreshing it.
+    """
+    with self.condition:
+      self.pinned[key] = {
+        'fetchFunction': fetchFunction,
+        'retryAt': 0,
+      }
+      if self.refresher is None and fetchFunction is not None:
+        self.refresher = threading.Thread(target=self.__refreshPinned)
+        self.refresher.daemon = True
+        self.refresher.start()
+      self.condition.notify_all()
+
+  def refreshTimestamp(self, accessInfo):
+    """
+      Calculate the time after which access info should be replaced.
+
+      Args:
+        accessInfo: An access info dictionary.
+
+      Returns:
+        The timestamp at which the refresh window starts.
+    """
+    return self.__expireTimestamp(accessInfo) - self.__refreshFuzz(accessInfo)
+
+  def remove(self, key):
+    """
+      Remove the access info stored for a key, if any. The shared store, if
+      any, is left unchanged.
+
+      Args:
+        key: A key built with buildKey().
+    """
+    with self.lock:
+      self.entries.pop(key, None)
+
+  def set(self, key, accessInfo):
+    """
+      Store access info in the cache, and in the shared store if any.
+
+      Args:
+        key: A key built with buildKey().
+        accessInfo: The access info dictionary to store.
+    """
+    if self.store is not None:
+      self.store.set(key, accessInfo)
+    with self.lock:
+      self.__store(key, accessInfo)
+
+  def unpin(self, key):
+    """
+      Unpin a key, its access info becomes subject to eviction and is only
+      refreshed when requested.
+
+      Args:
+        key: A key built with buildKey().
+    """
+    with self.condition:
+      self.pinned.pop(key, None)
+      self.condition.notify_all()
+
+  # PRIVATE METHODS.
+
+  def __duePinned(self, now):
+    """
+      Find the pinned keys that need refreshing. Must be called with the lock
+      held.
+
+      Returns:
+        A tuple of the list of due keys, and the number of seconds until the
+        next key is due, or None if no pinned key is waiting.
+    """
+    due = []
+    nextAt = None
+    for key, pin in self.pinned.items():
+      if pin['fetchFunction'] is None or key in self.inFlight:
+        continue
+      accessInfo = self.entries.get(key, None)
+      refreshAt = self.refreshTimestamp(accessInfo) if accessInfo is not None else 0
+      at = max(refreshAt, pin['retryAt'])
+      if at <= now:
+        due.append(key)
+        # Checked again after a short delay, in case the refresh fails.
+        pin['retryAt'] = now + self.PIN_RETRY_SECONDS
+        at = pin['retryAt']
+      if nextAt is None or at < nextAt:
+        nextAt = at
+    return due, (nextAt - now if nextAt is not None else None)
+
+  def __expireTimestamp(self, accessInfo):
+    """
+      Calculate the time after which access info can no longer be used.
+    """
+    return accessInfo['timestamp'] + accessInfo['lifetime'] - self.__refreshFuzz(accessInfo)
+
+  def __fetch(self, key, flight, fetchFunction):
+    """
+      Run an access token request and publish the result to all waiters.
+    """
+    try:
+      flight.result = self.__fetchShared(key, fetchFunction)
+    except Exception as e:
+      flight.error = e
+    finally:
+      with self.condition:
+        if flight.result is not None:
+          self.__store(key, flight.result)
+          pin = self.pinned.get(key, None)
+          if pin is not None:
+            # Refreshed, schedule the next refresh from the new lifetime only.
+            pin['retryAt'] = 0
+        del self.inFlight[key]
+        # Let the pinned refresher schedule the key's next refresh.
+        self.condition.notify_all()
+      flight.event.set()
+
+  def __fetchShared(self, key, fetchFunction):
+    """
+      Get access info from the shared store, or request it while holding the
+      store's lock for the key and publish it to the store.
+    """
+    if self.store is None:
+      return fetchFunction()
+    accessInfo = self.getShared(key)
+    if accessInfo is not None:
+      return accessInfo
+    with self.store.lock(key):
+      # Another process may have fetched it while we waited for the lock.
+      accessInfo = self.getShared(key)
+      if accessInfo is None:
+        accessInfo = fetchFunction()
+        if accessInfo is not None:
+          self.store.set(key, accessInfo)
+    return accessInfo
+
+  def __notify(self, event, key):
+    """
+      Report a cache event to the instrumentation.
+    """
+    self.instrumentation.onTokenCache({
+      'event': event,
+      'workflow': key[0],
+      'xml': key[1],
+    })
+
+  def __refreshFuzz(self, accessInfo):
+    """
+      Get the number of seconds shaved off the lifetime of access info.
+    """
+    return min(self.refreshFuzzSeconds, accessInfo['lifetime'] / 4.0)
+
+  def __refreshInBackground(self, key, fetchFunction):
+    """
+      Start a background request for replacement access info. Must be called
+      with the lock held.
+    """
+    flight = _PijazTokenFlight()
+    self.inFlight[key] = flight
+    thread = threading.Thread(target=self.__fetch, args=(key, flight, fetchFunction))
+    thread.daemon = True
+    thread.start()
+
+  def __refreshPinned(self):
+    """
+      Background loop refreshing pinned access info before it expires.
+    """
+    while True:
+      with self.condition:
+        due, timeout = self.__duePinned(time.time())
+        for key in due:
+          self.__refreshInBackground(key, self.pinned[key]['fetchFunction'])
+        if not due:
+          self.condition.wait(timeout)
+      for key in due:
+        self.__notify('refresh', key)
+
+  def __store(self, key, accessInfo):
+    """
+      Store access info and evict the least recently used unpinned entries.
+      Must be called with the lock held.
+    """
+    self.entries[key] = accessInfo
+    self.entries.move_to_end(key)
+    if len(self.entries) > self.maxSize:
+      for evictKey in list(self.entries):
+        if len(self.entries) <= self.maxSize:
+          break
+        if evictKey not in self.pinned:
+          del self.entries[evictKey]
@@ -0,0 +1,336 @@
+"""
+
+  Shared rendering access token stores.
+
+  A token store lets several server managers, typically one per pre-forked
+  worker process, share rendering access tokens, so that a token fetched by
+  one worker is used by all of them. Pass an instance as the 'tokenStore'
+  parameter of PijazServerManager. Each manager keeps its own in-memory token
+  cache in front of the store.
+
+  PijazTokenStore: Interface for token stores. Subclass it to use other
+    backends.
+  PijazSqliteTokenStore: Local store in a sqlite file, shared by processes on
+    the same host.
+  PijazKeyValueTokenStore: Store in a Redis-style key/value server, shared by
+    processes on any host.
+
+  PUBLIC METHODS:
+
+  buildName(key)
+  clear()
+  get(key)
+  lock(key)
+  remove(key)
+  set(key, accessInfo)
+
+  PijazSqliteTokenStore PRIVATE METHODS:
+
+  __connection()
+  __lockFile(slot)
+
+  PijazKeyValueTokenStore PRIVATE METHODS:
+
+  __releaseLock(name, token)
+
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
+class PijazTokenStore(object):
+  """
+    Interface for shared token stores.
+
+    Keys are the token cache keys built with PijazTokenCache.buildKey(), and
+    values are access info dictionaries, which are JSON serializable. Stores
+    must only return access info that has not expired.
+  """
+
+  # PUBLIC METHODS.
+
+  @staticmethod
+  def buildName(key):
+    """
+      Convert a token cache key into a string, for backends that need one.
+
+      Args:
+        key: A key built with PijazTokenCache.buildKey().
+
+      Returns:
+        A string uniquely identifying the key.
+    """
+    return json.dumps(list(key), separators=(',', ':'))
+
+  def clear(self):
+    """
+      Remove all access tokens from the store.
+    """
+    raise NotImplementedError
+
+  def get(self, key):
+    """
+      Retrieve unexpired access info from the store.
+
+      Args:
+        key: A key built with PijazTokenCache.buildKey().
+
+      Returns:
+        The access info dictionary, or None.
+    """
+    raise NotImplementedError
+
+  @contextlib.contextmanager
+  def lock(self, key):
+    """
+      Acquire a lock shared by all users of the store, held while a token is
+      requested, so that only one of them requests a token for a key at a
+      time. The default implementation does not lock.
+
+      Args:
+        key: A key built with PijazTokenCache.buildKey().
+
+      Returns:
+        A context manager holding the lock.
+    """
+    yield
+
+  def remove(self, key):
+    """
+      Remove the access info stored for a key, if any.
+
+      Args:
+        key: A key built with PijazTokenCache.buildKey().
+    """
+    raise NotImplementedError
+
+  def set(self, key, accessInfo):
+    """
+      Store access info, until it expires.
+
+      Args:
+        key: A key built with PijazTokenCache.buildKey().
+        accessInfo: The access info dictionary to store.
+    """
+    raise NotImplementedError
+
+class PijazSqliteTokenStore(PijazTokenStore):
+  """
+    Token store in a local sqlite file, safe to share between threads and
+    processes, including processes forked after the store was created.
+
+    Token requests are serialized per key across processes with byte-range
+    locks on a '.lock' file next to the database, on platforms that support
+    them. Byte-range locks belong to the process and are dropped when any of
+    its descriptors of the file is closed, so each process keeps a single
+    descriptor open, and its threads are serialized per lock slot before
+    taking the byte-range lock.
+  """
+
+  DEFAULT_TIMEOUT = 5
+  LOCK_SLOTS = 4096
+
+  # PUBLIC METHODS.
+
+  def __init__(self, inParameters):
+    """
+      Inits a SqliteTokenStore object.
+
+      Args:
+
+        inParameters: A dictionary with the following key/value pairs.
+          path: Required. The path of the sqlite database file. It is created
+            if it does not exist.
+          timeout: Optional. Seconds to wait for another process to release
+            the database. Default: 5
+    """
+    params = inParameters
+    self.path = params['path']
+    self.timeout = params.get('timeout', self.DEFAULT_TIMEOUT)
+    self.lockPath = self.path + '.lock'
+    self.local = threading.local()
+    self.lockMutex = threading.Lock()
+    self.lockPid = None
+    self.lockFileObject = None
+    self.slotLocks = {}
+
+  def clear(self):
+    self.__connection().execute("DELETE FROM tokens")
+
+  def get(self, key):
+    row = self.__connection().execute("SELECT accessInfo FROM tokens WHERE name = ? AND expires >= ?",
+      (self.buildName(key), time.time())).fetchone()
+    if row is None:
+      return None
+    return json.loads(row[0])
+
+  @contextlib.contextmanager
+  def lock(self, key):
+    if fcntl is None:
+      yield
+      return
+    digest = hashlib.sha1(self.buildName(key).encode('utf-8')).digest()
+    offset = int.from_bytes(digest[:4], 'big') % self.LOCK_SLOTS
+    f, slotLock = self.__lockFile(offset)
+    with slotLock:
+      fcntl.lockf(f, fcntl.LOCK_EX, 1, offset)
+      try:
+        yield
+      finally:
+        fcntl.lockf(f, fcntl.LOCK_UN, 1, offset)
+
+  def remove(self, key):
+    self.__connection().execute("DELETE FROM tokens WHERE name = ?", (self.buildName(key),))
+
+  def set(self, key, accessInfo):
+    now = time.time()
+    connection = self.__connection()
+    connection.execute("DELETE FROM tokens WHERE expires < ?", (now,))
+    connection.execute("INSERT OR REPLACE INTO tokens (name, accessInfo, expires) VALUES (?, ?, ?)",
+      (self.buildName(key), json.dumps(accessInfo), accessInfo['timestamp'] + accessInfo['lifetime']))
+
+  # PRIVATE METHODS.
+
+  def __connection(self):
+    """
+      Get the database connection for the current thread and process,
+      creating the database if needed.
+    """
+    pid = os.getpid()
+    if getattr(self.local, 'pid', None) != pid:
+      connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+      connection.execute("PRAGMA journal_mode=WAL")
+      connection.execute("CREATE TABLE IF NOT EXISTS tokens "
+        "(name TEXT PRIMARY KEY, accessInfo TEXT NOT NULL, expires REAL NOT NULL)")
+      self.local.connection = connection
+      self.local.pid = pid
+    return self.local.connection
+
+  def __lockFile(self, slot):
+    """
+      Get the lock file of the current process, and the thread lock of a lock
+      slot. Both are created again in a forked process, which inherits
+      neither the byte-range locks nor the threads holding them.
+    """
+    pid = os.getpid()
+    with self.lockMutex:
+      if self.lockPid != pid:
+        if self.lockFileObject is not None:
+          # Only drops this process's locks, and it holds none yet.
+          self.lockFileObject.close()
+        self.lockFileObject = open(self.lockPath, 'a')
+        self.slotLocks = {}
+        self.lockPid = pid
+      slotLock = self.slotLocks.get(slot, None)
+      if slotLock is None:
+        slotLock = self.slotLocks[slot] = threading.Lock()
+      return self.lockFileObject, slotLock
+
+class PijazKeyValueTokenStore(PijazTokenStore):
+  """
+    Token store in a Redis-style key/value server.
+
+    The client must provide get(name), set(name, value, ex=None, nx=False) and
+    delete(name) methods, and optionally scan_iter(match=None) for clear() and
+    eval(script, numkeys, *keys_and_args), as redis.Redis does. Entries expire
+    on the server with the token, and token requests are serialized per key
+    with short-lived lock entries.
+
+    A lock entry holds a value unique to its holder, and is only deleted by
+    that holder, so a holder that ran past lockTimeout cannot release the lock
+    of the next one. With eval() the value is compared and the entry deleted
+    atomically on the server.
+  """
+
+  DEFAULT_PREFIX = 'pijaz:token:'
+  LOCK_TIMEOUT = 30
+  LOCK_POLL_SECONDS = 0.05
+  RELEASE_SCRIPT = (
+    "if redis.call('get', KEYS[1]) == ARGV[1] then "
+    "return redis.call('del', KEYS[1]) else return 0 end")
+
+  # PUBLIC METHODS.
+
+  def __init__(self, inParameters):
+    """
+      Inits a KeyValueTokenStore object.
+
+      Args:
+
+        inParameters: A dictionary with the following key/value pairs.
+          client: Required. The key/value server client, for example a
+            redis.Redis instance.
+          prefix: Optional. Prefix of the names of the entries.
+            Default: pijaz:token:
+          lockTimeout: Optional. Seconds after which a token request lock is
+            released, should its holder die, and after which waiters give up
+            and request a token themselves. Default: 30
+    """
+    params = inParameters
+    self.client = params['client']
+    self.prefix = params.get('prefix', self.DEFAULT_PREFIX)
+    self.lockTimeout = params.get('lockTimeout', self.LOCK_TIMEOUT)
+
+  def clear(self):
+    for name in self.client.scan_iter(match=self.prefix + '*'):
+      self.client.delete(name)
+
+  def get(self, key):
+    value = self.client.get(self.prefix + self.buildName(key))
+    if value is None:
+      return None
+    accessInfo = json.loads(value)
+    if time.time() > accessInfo['timestamp'] + accessInfo['lifetime']:
+      return None
+    return accessInfo
+
+  @contextlib.contextmanager
+  def lock(self, key):
+    name = self.prefix + 'lock:' + self.buildName(key)
+    token = uuid.uuid4().hex
+    acquired = False
+    deadline = time.time() + self.lockTimeout
+    while time.time() < deadline:
+      if self.client.set(name, token, ex=self.lockTimeout, nx=True):
+        acquired = True
+        break
+      time.sleep(self.LOCK_POLL_SECONDS)
+    try:
+      yield
+    finally:
+      if acquired:
+        self.__releaseLock(name, token)
+
+  def remove(self, key):
+    self.client.delete(self.prefix + self.buildName(key))
+
+  def set(self, key, accessInfo):
+    ttl = int(accessInfo['timestamp'] + accessInfo['lifetime'] - time.time())
+    if ttl > 0:
+      self.client.set(self.prefix + self.buildName(key), json.dumps(accessInfo), ex=ttl)
+
+  # PRIVATE METHODS.
+
+  def __releaseLock(self, name, token):
+    """
+      Delete a lock entry, unless it expired and was taken by another holder.
+    """
+    if hasattr(self.client, 'eval'):
+      self.client.eval(self.RELEASE_SCRIPT, 1, name, token)
+      return
+    value = self.client.get(name)
+    if isinstance(value, bytes):
+      value = value.decode('utf-8')
+    if value == token:
+      self.client.delete(name)
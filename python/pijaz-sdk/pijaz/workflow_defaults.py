@@ -0,0 +1,256 @@
+"""
+
+  Loader of the render parameters declared by workflow XML definitions.
+
+  Pass an instance as the 'workflowDefaults' parameter of PijazServerManager,
+  and products without explicit productPropertyDefaults drop render
+  parameters equal to the defaults declared by their workflow, so that
+  identical renders get identical, shorter URLs.
+
+  PUBLIC METHODS:
+
+  __init__(inParameters)
+  clear()
+  get(workflow, xml)
+  getAsync(workflow, xml)
+  getParameters(workflow, xml)
+  peek(workflow, xml)
+
+  PROTECTED METHODS:
+
+  _parseParameters(data)
+
+  PRIVATE METHODS:
+
+  __load(workflow, xml)
+  __readDefinition(workflow, xml)
+
+"""
+
+import asyncio
+import os
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+from urllib.parse import urlparse
+
+import requests
+
+from pijaz.single_flight import PijazSingleFlight
+
+class PijazWorkflowDefaults(object):
+  """
+    Thread-safe, memoized loader of the parameters and defaults declared by
+    workflow XML definitions.
+
+    A workflow's definition is read from the local file configured for it.
+    Its 'xml' render parameter, which comes from callers, is only fetched if
+    allowRemote is set, and only if it is an http or https URL, it is never
+    read as a local path.
+
+    The parameters are found heuristically, as elements named parameter,
+    param or property, with a name attribute, and a default, defaultValue or
+    default-value attribute or <default> child element. Override
+    _parseParameters() to match the actual schema of your definitions.
+
+    Definitions that cannot be read or parsed declare no defaults, and are
+    retried after errorTtl seconds, so render requests are never failed by
+    the loader.
+  """
+
+  PARAMETER_TAGS = ('parameter', 'param', 'property')
+  DEFAULT_ATTRIBUTES = ('default', 'defaultValue', 'default-value')
+  TTL = 3600
+  ERROR_TTL = 60
+  HTTP_TIMEOUT = (5, 30)
+
+  # PUBLIC METHODS.
+
+  def __init__(self, inParameters=None):
+    """
+      Inits a WorkflowDefaults object.
+
+      Args:
+
+        inParameters: Optional. A dictionary with the following key/value pairs.
+          files: Optional. A dictionary of workflow IDs to the paths of their
+            local XML definitions, used instead of the 'xml' render parameter.
+          directory: Optional. A directory of local XML definitions named
+            <workflow ID>.xml, used instead of the 'xml' render parameter.
+          ttl: Optional. Seconds a fetched definition is kept. Local files are
+            kept for errorTtl seconds at most. Default: 3600
+          errorTtl: Optional. Seconds after which a definition that could not
+            be read or parsed is tried again. Default: 60
+          allowRemote: Optional. If True, workflows without a local
+            definition are fetched from their 'xml' render parameter when it is
+            an http or https URL. Only enable it if render parameters are not
+            taken from untrusted callers, or the SDK can be made to request
+            any URL. Default: False
+          httpSession: Optional. A requests.Session used to fetch definitions.
+            Default: a new session
+    """
+    params = inParameters or {}
+    self.files = params.get('files', None) or {}
+    self.directory = params.get('directory', None)
+    self.ttl = params.get('ttl', self.TTL)
+    self.errorTtl = params.get('errorTtl', self.ERROR_TTL)
+    self.allowRemote = params.get('allowRemote', False)
+    self.httpSession = params.get('httpSession', None) or requests.Session()
+    self.entries = {}
+    self.flight = PijazSingleFlight()
+    self.lock = threading.Lock()
+
+  def clear(self):
+    """
+      Forget all loaded definitions.
+    """
+    with self.lock:
+      self.entries.clear()
+
+  def get(self, workflow, xml=None):
+    """
+      Get the render parameter defaults declared by a workflow, loading its
+      definition if needed.
+
+      Args:
+        workflow: Required. The workflow ID.
+        xml: Optional. The 'xml' render parameter of the product.
+
+      Returns:
+        A dictionary of parameter names to default values, which must not be
+        modified.
+    """
+    entry = self.__load(workflow, xml)
+    return entry['defaults']
+
+  async def getAsync(self, workflow, xml=None):
+    """
+      Get the render parameter defaults declared by a workflow, loading its
+      definition in a worker thread if needed.
+
+      See get() for the arguments and return value.
+    """
+    defaults = self.peek(workflow, xml)
+    if defaults is not None:
+      return defaults
+    loop = asyncio.get_event_loop()
+    return await self.flight.doAsync((workflow, xml), lambda: loop.run_in_executor(None, self.get, workflow, xml))
+
+  def getParameters(self, workflow, xml=None):
+    """
+      Get all the render parameters declared by a workflow, loading its
+      definition if needed.
+
+      See get() for the arguments.
+
+      Returns:
+        A dictionary of parameter names to default values, None for
+        parameters without a default.
+    """
+    entry = self.__load(workflow, xml)
+    return entry['parameters']
+
+  def peek(self, workflow, xml=None):
+    """
+      Get the render parameter defaults declared by a workflow, if its
+      definition is loaded, without loading it.
+
+      See get() for the arguments.
+
+      Returns:
+        A dictionary of parameter names to default values, or None if the
+        definition is not loaded.
+    """
+    entry = self.entries.get((workflow, xml), None)
+    if entry is None or time.time() > entry['expires']:
+      return None
+    return entry['defaults']
+
+  # PROTECTED METHODS.
+
+  def _parseParameters(self, data):
+    """
+      Extract the declared render parameters from a workflow XML definition.
+
+      Args:
+        data: The XML definition, as bytes.
+
+      Returns:
+        A dictionary of parameter names to default values, None for
+        parameters without a default.
+    """
+    parameters = {}
+    for element in ElementTree.fromstring(data).iter():
+      # Ignore XML namespaces.
+      tag = element.tag.rsplit('}', 1)[-1] if isinstance(element.tag, str) else None
+      name = element.get('name', None)
+      if tag not in self.PARAMETER_TAGS or not name:
+        continue
+      default = None
+      for attribute in self.DEFAULT_ATTRIBUTES:
+        if attribute in element.attrib:
+          default = element.attrib[attribute]
+          break
+      else:
+        for child in element:
+          if isinstance(child.tag, str) and child.tag.rsplit('}', 1)[-1] == 'default':
+            default = child.text or ''
+            break
+      if default is not None or name not in parameters:
+        parameters[name] = default
+    return parameters
+
+  # PRIVATE METHODS.
+
+  def __load(self, workflow, xml=None):
+    """
+      Get the memoized entry of a workflow definition, reading it if it is
+      missing or expired. Concurrent loads of a definition are coalesced.
+    """
+    key = (workflow, xml)
+    entry = self.entries.get(key, None)
+    if entry is not None and time.time() <= entry['expires']:
+      return entry
+
+    def load():
+      now = time.time()
+      try:
+        data, ttl = self.__readDefinition(workflow, xml)
+        parameters = self._parseParameters(data) if data is not None else {}
+      except (IOError, OSError, requests.RequestException, ElementTree.ParseError):
+        parameters = {}
+        ttl = self.errorTtl
+      loaded = {
+        'parameters': parameters,
+        'defaults': dict((name, value) for name, value in parameters.items() if value is not None),
+        'expires': now + ttl,
+      }
+      with self.lock:
+        self.entries[key] = loaded
+      return loaded
+
+    return self.flight.do(key, load)
+
+  def __readDefinition(self, workflow, xml=None):
+    """
+      Read a workflow XML definition.
+
+      Returns:
+        A (data, ttl) tuple, data being None if the workflow has no
+        definition.
+    """
+    path = self.files.get(workflow, None)
+    if path is None and self.directory is not None:
+      path = os.path.join(self.directory, "%s.xml" % workflow)
+      if not os.path.exists(path):
+        path = None
+    if path is None and xml and self.allowRemote and urlparse(xml).scheme in ('http', 'https'):
+      r = self.httpSession.get(xml, timeout=self.HTTP_TIMEOUT)
+      r.raise_for_status()
+      return r.content, self.ttl
+    if path is None:
+      return None, self.ttl
+    with open(path, 'rb') as f:
+      data = f.read()
+    # Local files are cheap to reread, so pick up edits quickly.
+    return data, min(self.ttl, self.errorTtl)
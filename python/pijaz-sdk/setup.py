@@ -14,6 +14,7 @@ setuptools.setup(name='pijaz-sdk',
   long_description=README,
   classifiers=[
     "Programming Language :: Python",
+    "Programming Language :: Python :: 3",
     "Intended Audience :: Developers",
     "License :: OSI Approved :: MIT License",
     "Topic :: Artistic Software",
@@ -27,8 +28,19 @@ setuptools.setup(name='pijaz-sdk',
   url='',
   keywords='pijaz graphics sdk synthesizer platform',
   packages=setuptools.find_packages(),
+  python_requires='>=3.7',
   include_package_data=True,
   zip_safe=False,
   install_requires=requires,
+  extras_require={
+    'async': ['aiohttp>=3.3'],
+    'fast': ['orjson>=3'],
+    'derivatives': ['Pillow'],
+  },
+  entry_points={
+    'console_scripts': [
+      'pijaz-batch = pijaz.batch:main',
+    ],
+  },
 )
 
@@ -0,0 +1,58 @@
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from pijaz.async_product import AsyncPijazProduct
+from pijaz.async_server_manager import AsyncPijazServerManager
+from stub_server import PijazStubServer
+
+class AsyncPijazProductTest(unittest.TestCase):
+
+  def setUp(self):
+    self.stub = PijazStubServer().start()
+    self.directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    self.stub.stop()
+    shutil.rmtree(self.directory)
+
+  def testSaveToFilesConsumesItemsLazily(self):
+    server = AsyncPijazServerManager({
+      'appId': 'test',
+      'apiKey': 'test',
+      'apiServer': self.stub.getUrl(),
+      'renderServer': self.stub.getUrl(),
+    })
+    product = AsyncPijazProduct({
+      'serverManager': server,
+      'workflowId': 'workflow',
+    })
+    started = []
+
+    def items():
+      for i in range(20):
+        # Never more items taken than workers, plus the one being taken.
+        self.assertLessEqual(len(started) - self.stub.getCounts()['render-image'], 3)
+        started.append(i)
+        yield os.path.join(self.directory, '%d.jpg' % i), {'size': 100 + i}
+
+    async def run():
+      try:
+        return await product.saveToFiles(items(), 3)
+      finally:
+        await server.close()
+
+    results = asyncio.run(run())
+    self.assertEqual([result['filepath'] for result in results],
+      [os.path.join(self.directory, '%d.jpg' % i) for i in range(20)])
+    self.assertTrue(all(result['success'] for result in results))
+    for i in range(20):
+      self.assertEqual(os.path.getsize(os.path.join(self.directory, '%d.jpg' % i)), 100 + i)
+
+if __name__ == '__main__':
+  unittest.main()
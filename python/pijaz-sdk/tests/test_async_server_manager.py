@@ -0,0 +1,46 @@
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from pijaz.async_server_manager import AsyncPijazServerManager
+from stub_server import PijazStubServer
+
+class AsyncPijazServerManagerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.stub = PijazStubServer().start()
+
+  def tearDown(self):
+    self.stub.stop()
+
+  def testTokensPinnedLaterAreRefreshedOnTime(self):
+    server = AsyncPijazServerManager({
+      'appId': 'test',
+      'apiKey': 'test',
+      'apiServer': self.stub.getUrl(),
+      'renderServer': self.stub.getUrl(),
+      'refreshFuzzSeconds': 1,
+    })
+    tokenCache = server.getTokenCache()
+    key = tokenCache.buildKey('short-lived')
+
+    async def run():
+      try:
+        await server.prewarmTokens(['long-lived'])
+        # The refresher is now waiting for the long-lived token.
+        await asyncio.sleep(0.1)
+        self.stub.tokenLifetime = 3
+        await server.prewarmTokens(['short-lived'])
+        token = tokenCache.get(key)['renderAccessParameters']['token']
+        await asyncio.sleep(3)
+        self.assertNotEqual(tokenCache.get(key)['renderAccessParameters']['token'], token)
+      finally:
+        await server.close()
+
+    asyncio.run(run())
+
+if __name__ == '__main__':
+  unittest.main()
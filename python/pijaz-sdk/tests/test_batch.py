@@ -0,0 +1,83 @@
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from pijaz import batch
+from stub_server import PijazStubServer
+
+class PijazBatchTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.outputDir = os.path.join(self.directory, 'out')
+    self.stats = {
+      'records': 0,
+      'skipped': 0,
+      'failed': 0,
+    }
+    self.config = {
+      'outputDir': self.outputDir,
+      'overwrite': False,
+      'workflow': 'workflow',
+      'xml': None,
+    }
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def writeInput(self, name, lines):
+    path = os.path.join(self.directory, name)
+    with open(path, 'w', encoding='utf-8') as f:
+      f.write('\n'.join(lines) + '\n')
+    return path
+
+  def testEmptyCsvCellsAreLeftOut(self):
+    path = self.writeInput('records.csv', ['output,message,color', 'a.jpg,hello,', 'b.jpg'])
+    items = list(batch.buildItems(batch.readRecords(path), self.config, self.stats))
+    self.assertEqual([item[3] for item in items], [{'message': 'hello'}, {}])
+
+  def testInvalidJsonlRecordsAreCountedAsFailed(self):
+    path = self.writeInput('records.jsonl', [
+      json.dumps({'output': 'a.jpg'}),
+      '{"output": ',
+      '',
+      '["b.jpg"]',
+      json.dumps({'message': 'no output'}),
+      json.dumps({'output': 'c.jpg'}),
+    ])
+    out = io.StringIO()
+    items = list(batch.buildItems(batch.readRecords(path), self.config, self.stats, out))
+    self.assertEqual([os.path.basename(item[0]) for item in items], ['a.jpg', 'c.jpg'])
+    self.assertEqual(self.stats['records'], 5)
+    self.assertEqual(self.stats['failed'], 3)
+    errors = out.getvalue()
+    self.assertIn('line 2: invalid JSON', errors)
+    self.assertIn('line 4: not a JSON object', errors)
+    self.assertIn('line 5: no output field', errors)
+
+  def testRendersRecordsWithTheStubServer(self):
+    stub = PijazStubServer().start()
+    try:
+      path = self.writeInput('records.jsonl', [json.dumps({'output': 'sub/%d.jpg' % i, 'size': 1000 + i})
+        for i in range(5)] + ['not json'])
+      argv = [path, '--output-dir', self.outputDir, '--workflow', 'workflow', '--app-id', 'test',
+        '--api-key', 'test', '--api-server', stub.getUrl(), '--render-server', stub.getUrl()]
+      self.assertEqual(batch.main(argv), 1)
+      for i in range(5):
+        self.assertEqual(os.path.getsize(os.path.join(self.outputDir, 'sub', '%d.jpg' % i)), 1000 + i)
+      self.assertEqual(stub.getCounts()['get-token'], 1)
+
+      # Existing outputs are skipped when the run is resumed.
+      self.assertEqual(batch.main(argv), 1)
+      self.assertEqual(stub.getCounts()['render-image'], 5)
+    finally:
+      stub.stop()
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from pijaz.endpoint_pool import PijazEndpointPool
+from pijaz.product import PijazProduct
+from pijaz.retry import PijazRetryPolicy
+from pijaz.server_manager import PijazServerManager
+from stub_server import PijazStubServer
+
+class PijazEndpointPoolTest(unittest.TestCase):
+
+  def testFasterServersAreChosen(self):
+    pool = PijazEndpointPool({'endpoints': ['http://a/', 'http://b/']})
+    with pool.track('http://a/render-image'):
+      time.sleep(0.05)
+    with pool.track('http://b/render-image'):
+      pass
+    self.assertEqual(set(pool.choose() for i in range(10)), {'http://b/'})
+
+  def testEjectedServersReturnAfterTheirEjection(self):
+    pool = PijazEndpointPool({'endpoints': ['http://a/', 'http://b/'], 'ejectAfterFailures': 2,
+      'ejectSeconds': 0.2})
+    for i in range(2):
+      with pool.track('http://a/render-image') as request:
+        request.success = False
+    self.assertEqual([stats['available'] for stats in pool.getStats()], [False, True])
+    self.assertEqual(pool.reroute('http://a/render-image?x=1'), 'http://b/render-image?x=1')
+    time.sleep(0.2)
+    self.assertEqual([stats['available'] for stats in pool.getStats()], [True, True])
+
+class PijazRenderServerPoolTest(unittest.TestCase):
+
+  def setUp(self):
+    self.stubs = [PijazStubServer().start() for i in range(2)]
+    self.pool = PijazEndpointPool({
+      'endpoints': [stub.getUrl() for stub in self.stubs],
+      'ejectAfterFailures': 1,
+      'ejectSeconds': 0.3,
+    })
+    server = PijazServerManager({
+      'appId': 'test',
+      'apiKey': 'test',
+      'apiServer': self.stubs[0].getUrl(),
+      'renderServer': self.pool,
+      'retryPolicy': PijazRetryPolicy({'maxAttempts': 1, 'circuitBreaker': False}),
+    })
+    self.product = PijazProduct({
+      'serverManager': server,
+      'workflowId': 'workflow',
+    })
+
+  def tearDown(self):
+    for stub in self.stubs:
+      stub.stop()
+
+  def stubOf(self, url):
+    return [stub for stub in self.stubs if url.startswith(stub.getUrl())][0]
+
+  def testRendersArePinnedAndSpread(self):
+    servers = set()
+    for i in range(20):
+      url = self.product.generateUrl({'message': str(i)})
+      self.assertEqual(self.product.generateUrl({'message': str(i)}), url)
+      servers.add(self.stubOf(url))
+    self.assertEqual(len(servers), 2)
+
+  def testRendersMoveOffAnEjectedServer(self):
+    params = {'message': 'hello'}
+    pinned = self.stubOf(self.product.generateUrl(params))
+    other = [stub for stub in self.stubs if stub is not pinned][0]
+    pinned.renderStatuses = [500]
+    self.assertIsNone(self.product.fetchBytes(params))
+    self.assertEqual(self.stubOf(self.product.generateUrl(params)), other)
+    self.assertIsNotNone(self.product.fetchBytes(params))
+    self.assertEqual(other.getCounts()['render-image'], 1)
+    time.sleep(0.3)
+    self.assertEqual(self.stubOf(self.product.generateUrl(params)), pinned)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,56 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from pijaz.rate_limit import PijazRateLimiter
+
+class PijazRateLimiterTest(unittest.TestCase):
+
+  def runThreads(self, limiter, count, timeout):
+    done = []
+
+    def request():
+      with limiter.limit():
+        time.sleep(0.001)
+      done.append(True)
+
+    threads = [threading.Thread(target=request, daemon=True) for i in range(count)]
+    for thread in threads:
+      thread.start()
+    deadline = time.time() + timeout
+    for thread in threads:
+      thread.join(max(0, deadline - time.time()))
+    return len(done)
+
+  def testRateAndCapSingleSlot(self):
+    limiter = PijazRateLimiter({'rate': 5, 'burst': 1, 'maxInFlight': 1})
+    self.assertEqual(self.runThreads(limiter, 5, 5), 5)
+    self.assertEqual(limiter.getInFlight(), 0)
+
+  def testRateAndCapBurst(self):
+    limiter = PijazRateLimiter({'rate': 200, 'burst': 20, 'maxInFlight': 4})
+    self.assertEqual(self.runThreads(limiter, 100, 5), 100)
+    self.assertEqual(limiter.getInFlight(), 0)
+
+  def testRateAndCapAsync(self):
+    limiter = PijazRateLimiter({'rate': 5, 'burst': 1, 'maxInFlight': 1})
+
+    async def request():
+      async with limiter.limitAsync():
+        await asyncio.sleep(0.001)
+
+    async def run():
+      await asyncio.wait_for(asyncio.gather(*[request() for i in range(5)]), 5)
+
+    asyncio.run(run())
+    self.assertEqual(limiter.getInFlight(), 0)
+
+  def testRate(self):
+    limiter = PijazRateLimiter({'rate': 20, 'burst': 1})
+    startTime = time.time()
+    self.assertEqual(self.runThreads(limiter, 5, 5), 5)
+    self.assertGreaterEqual(time.time() - startTime, 0.15)
+
+if __name__ == '__main__':
+  unittest.main()
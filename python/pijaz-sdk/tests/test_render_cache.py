@@ -0,0 +1,101 @@
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from pijaz.async_product import AsyncPijazProduct
+from pijaz.async_server_manager import AsyncPijazServerManager
+from pijaz.product import PijazProduct
+from pijaz.render_cache import PijazRenderCache
+from pijaz.server_manager import PijazServerManager
+from stub_server import PijazStubServer
+
+class PijazRenderCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.cacheDirectory = os.path.join(self.directory, 'cache')
+    self.stub = None
+
+  def tearDown(self):
+    if self.stub is not None:
+      self.stub.stop()
+    shutil.rmtree(self.directory)
+
+  def buildProduct(self, stubParameters=None, cacheParameters=None, managerClass=PijazServerManager,
+      productClass=PijazProduct):
+    self.stub = PijazStubServer(stubParameters).start()
+    self.renderCache = PijazRenderCache(dict({'directory': self.cacheDirectory}, **(cacheParameters or {})))
+    server = managerClass({
+      'appId': 'test',
+      'apiKey': 'test',
+      'apiServer': self.stub.getUrl(),
+      'renderServer': self.stub.getUrl(),
+      'renderCache': self.renderCache,
+    })
+    return productClass({
+      'serverManager': server,
+      'workflowId': 'workflow',
+    })
+
+  def evictBehindTheCache(self):
+    for name in os.listdir(self.cacheDirectory):
+      os.remove(os.path.join(self.cacheDirectory, name))
+
+  def testHitsAreServedFromTheCache(self):
+    product = self.buildProduct()
+    self.assertEqual(product.fetchBytes({'size': 1000}), self.stub.payload(1000))
+    self.assertEqual(product.fetchBytes({'size': 1000}), self.stub.payload(1000))
+    filepath = os.path.join(self.directory, 'image.jpg')
+    self.assertTrue(product.saveToFile(filepath, {'size': 1000}))
+    self.assertEqual(os.path.getsize(filepath), 1000)
+    self.assertEqual(self.stub.getCounts()['render-image'], 1)
+
+  def testEvictedHitIsRenderedAgain(self):
+    product = self.buildProduct()
+    product.fetchBytes({'size': 1000})
+    self.evictBehindTheCache()
+    self.assertEqual(product.fetchBytes({'size': 1000}), self.stub.payload(1000))
+    self.evictBehindTheCache()
+    filepath = os.path.join(self.directory, 'image.jpg')
+    self.assertTrue(product.saveToFile(filepath, {'size': 1000}))
+    self.assertEqual(os.path.getsize(filepath), 1000)
+    self.assertEqual(self.stub.getCounts()['render-image'], 3)
+
+  def testAsyncEvictedHitIsRenderedAgain(self):
+    product = self.buildProduct(managerClass=AsyncPijazServerManager, productClass=AsyncPijazProduct)
+
+    async def run():
+      try:
+        await product.fetchBytes({'size': 1000})
+        self.evictBehindTheCache()
+        return await product.fetchBytes({'size': 1000})
+      finally:
+        await product.serverManager.close()
+
+    self.assertEqual(asyncio.run(run()), self.stub.payload(1000))
+    self.assertEqual(self.stub.getCounts()['render-image'], 2)
+
+  def testExpiredProductsAreRevalidated(self):
+    product = self.buildProduct({'renderEtag': '"v1"'}, {'ttl': 0})
+    product.fetchBytes({'size': 1000})
+    self.assertEqual(product.fetchBytes({'size': 1000}), self.stub.payload(1000))
+    self.assertEqual(self.stub.getCounts()['not-modified'], 1)
+
+  def testLeastRecentlyUsedProductsAreEvicted(self):
+    product = self.buildProduct(cacheParameters={'maxBytes': 2500})
+    for size in (1000, 1001, 1000, 1002):
+      product.fetchBytes({'size': size})
+    self.assertLessEqual(self.renderCache.getSize(), 2500)
+    # 1001 was evicted, 1000 was used again and kept.
+    product.fetchBytes({'size': 1000})
+    self.assertEqual(self.stub.getCounts()['render-image'], 3)
+    product.fetchBytes({'size': 1001})
+    self.assertEqual(self.stub.getCounts()['render-image'], 4)
+
+if __name__ == '__main__':
+  unittest.main()
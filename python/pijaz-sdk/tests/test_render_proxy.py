@@ -0,0 +1,136 @@
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from wsgiref.util import setup_testing_defaults
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from pijaz.async_product import AsyncPijazProduct
+from pijaz.async_server_manager import AsyncPijazServerManager
+from pijaz.product import PijazProduct
+from pijaz.render_cache import PijazRenderCache
+from pijaz.render_proxy import PijazRenderProxy
+from pijaz.retry import PijazRetryPolicy
+from pijaz.server_manager import PijazServerManager
+from stub_server import PijazStubServer
+
+class PijazRenderProxyTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.stub = None
+
+  def tearDown(self):
+    if self.stub is not None:
+      self.stub.stop()
+    shutil.rmtree(self.directory)
+
+  def buildProduct(self, stubParameters=None, managerClass=PijazServerManager, productClass=PijazProduct):
+    self.stub = PijazStubServer(stubParameters).start()
+    self.renderCache = PijazRenderCache({'directory': self.directory})
+    server = managerClass({
+      'appId': 'test',
+      'apiKey': 'test',
+      'apiServer': self.stub.getUrl(),
+      'renderServer': self.stub.getUrl(),
+      'renderCache': self.renderCache,
+      'retryPolicy': PijazRetryPolicy({'maxAttempts': 1, 'circuitBreaker': False}),
+    })
+    return productClass({
+      'serverManager': server,
+      'workflowId': 'workflow',
+    })
+
+  def wsgiRequest(self, proxy, query, method='GET', headers=None):
+    environ = {
+      'REQUEST_METHOD': method,
+      'PATH_INFO': '/image.jpg',
+      'QUERY_STRING': query,
+    }
+    environ.update(headers or {})
+    setup_testing_defaults(environ)
+    response = {}
+
+    def startResponse(status, headers):
+      response['status'] = int(status.split(' ', 1)[0])
+      response['headers'] = dict(headers)
+
+    body = proxy.handleWsgi(environ, startResponse)
+    try:
+      response['body'] = b''.join(body)
+    finally:
+      if hasattr(body, 'close'):
+        body.close()
+    return response
+
+  def testWsgiServesMissesThenCachedProducts(self):
+    product = self.buildProduct()
+    proxy = PijazRenderProxy({'product': product, 'parameters': ['size']})
+    for i in range(2):
+      response = self.wsgiRequest(proxy, 'size=1000')
+      self.assertEqual(response['status'], 200)
+      self.assertEqual(response['body'], self.stub.payload(1000))
+      self.assertEqual(response['headers']['Content-Type'], 'image/jpeg')
+    self.assertEqual(self.stub.getCounts()['render-image'], 1)
+
+  def testQueryStringCannotChooseTheWorkflow(self):
+    product = self.buildProduct()
+    proxy = PijazRenderProxy({'product': product, 'parameters': ['size']})
+    self.wsgiRequest(proxy, 'size=100&workflow=other&xml=http://example.com/other.xml&message=hi')
+    self.assertIsNotNone(self.renderCache.get(self.renderCache.buildKey(product._setFinalParams({'size': '100'}))))
+    resolved = []
+    proxy = PijazRenderProxy({'resolve': lambda path, params: resolved.append(params)})
+    self.assertEqual(self.wsgiRequest(proxy, 'workflow=other&xml=x&size=100')['status'], 404)
+    self.assertEqual(resolved, [{'size': '100'}])
+
+  def testWsgiAnswersConditionalRequests(self):
+    product = self.buildProduct({'renderEtag': '"v1"'})
+    proxy = PijazRenderProxy({'product': product, 'parameters': ['size']})
+    self.assertEqual(self.wsgiRequest(proxy, 'size=100')['headers']['ETag'], '"v1"')
+    response = self.wsgiRequest(proxy, 'size=100', headers={'HTTP_IF_NONE_MATCH': '"v1"'})
+    self.assertEqual(response['status'], 304)
+    self.assertEqual(response['body'], b'')
+
+  def testWsgiErrors(self):
+    product = self.buildProduct({'renderStatuses': [500]})
+    proxy = PijazRenderProxy({'product': product, 'parameters': ['size']})
+    self.assertEqual(self.wsgiRequest(proxy, 'size=100', 'POST')['status'], 405)
+    self.assertEqual(self.wsgiRequest(proxy, 'size=100')['status'], 502)
+    self.assertEqual(self.wsgiRequest(proxy, 'size=100')['status'], 200)
+
+  def testAsgiServesMissesThenCachedProducts(self):
+    product = self.buildProduct(managerClass=AsyncPijazServerManager, productClass=AsyncPijazProduct)
+    proxy = PijazRenderProxy({'product': product, 'parameters': ['size']})
+
+    async def request():
+      messages = []
+
+      async def send(message):
+        messages.append(message)
+
+      await proxy.handleAsgi({
+        'type': 'http',
+        'method': 'GET',
+        'path': '/image.jpg',
+        'query_string': b'size=1000',
+        'headers': [],
+      }, None, send)
+      return messages
+
+    async def run():
+      try:
+        return [await request() for i in range(2)]
+      finally:
+        await product.serverManager.close()
+
+    for messages in asyncio.run(run()):
+      self.assertEqual(messages[0]['status'], 200)
+      self.assertIn((b'Content-Type', b'image/jpeg'), messages[0]['headers'])
+      self.assertEqual(b''.join(message['body'] for message in messages[1:]), self.stub.payload(1000))
+    self.assertEqual(self.stub.getCounts()['render-image'], 1)
+
+if __name__ == '__main__':
+  unittest.main()
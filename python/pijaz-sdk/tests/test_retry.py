@@ -0,0 +1,89 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from pijaz.exceptions import PijazCircuitOpenError, PijazRenderError
+from pijaz.product import PijazProduct
+from pijaz.retry import PijazCircuitBreaker, PijazRetryPolicy
+from pijaz.server_manager import PijazServerManager
+from stub_server import PijazStubServer
+
+class PijazRetryPolicyTest(unittest.TestCase):
+
+  def testBackoffDoublesUpToTheMaximum(self):
+    policy = PijazRetryPolicy({'backoffBase': 0.1, 'backoffMax': 0.3, 'jitter': False})
+    self.assertEqual([policy.getDelay(attempt) for attempt in (1, 2, 3, 4)], [0.1, 0.2, 0.3, 0.3])
+
+  def testTransportErrorsAreRetried(self):
+    policy = PijazRetryPolicy({'maxAttempts': 3, 'backoffBase': 0, 'circuitBreaker': False})
+    attempts = []
+
+    def attempt(number):
+      attempts.append(number)
+      if number < 3:
+        raise IOError("connection reset")
+      return 200
+
+    self.assertEqual(policy.execute('http://example.com/', attempt, lambda statusCode: statusCode), 200)
+    self.assertEqual(attempts, [1, 2, 3])
+
+  def testDeadlineStopsRetries(self):
+    policy = PijazRetryPolicy({'maxAttempts': 10, 'backoffBase': 1, 'jitter': False, 'deadline': 0.5,
+      'circuitBreaker': False})
+    self.assertEqual(policy.execute('http://example.com/', lambda number: 503, lambda statusCode: statusCode), 503)
+
+class PijazRenderRetryTest(unittest.TestCase):
+
+  def tearDown(self):
+    self.stub.stop()
+
+  def buildProduct(self, renderStatuses, retryParameters):
+    self.stub = PijazStubServer({'renderStatuses': renderStatuses}).start()
+    self.retryPolicy = PijazRetryPolicy(dict({'backoffBase': 0}, **retryParameters))
+    server = PijazServerManager({
+      'appId': 'test',
+      'apiKey': 'test',
+      'apiServer': self.stub.getUrl(),
+      'renderServer': self.stub.getUrl(),
+      'retryPolicy': self.retryPolicy,
+    })
+    return PijazProduct({
+      'serverManager': server,
+      'workflowId': 'workflow',
+    })
+
+  def testServerErrorsAreRetried(self):
+    product = self.buildProduct([503, 502], {'maxAttempts': 3})
+    self.assertEqual(product.fetchBytes({'size': 100}), self.stub.payload(100))
+    self.assertEqual(self.stub.getCounts()['render-image'], 3)
+
+  def testRetriesStopAfterMaxAttempts(self):
+    product = self.buildProduct([503, 503, 503], {'maxAttempts': 2})
+    self.assertIsNone(product.fetchBytes({'size': 100}))
+    self.assertEqual(self.stub.getCounts()['render-image'], 2)
+
+  def testClientErrorsAreNotRetried(self):
+    product = self.buildProduct([404], {'maxAttempts': 3})
+    self.assertIsNone(product.fetchBytes({'size': 100}))
+    self.assertEqual(self.stub.getCounts()['render-image'], 1)
+
+  def testCircuitOpensAndRecovers(self):
+    circuitBreaker = PijazCircuitBreaker({'failureThreshold': 2, 'resetTimeout': 0.3})
+    product = self.buildProduct([500, 500], {'maxAttempts': 1, 'circuitBreaker': circuitBreaker})
+    host = self.stub.getUrl().split('/')[2]
+    product.fetchBytes({'size': 100})
+    product.fetchBytes({'size': 100})
+    self.assertEqual(circuitBreaker.getState(host), PijazCircuitBreaker.OPEN)
+    with self.assertRaises(PijazRenderError) as context:
+      product.fetchBytes({'size': 100})
+    self.assertIsInstance(context.exception.__cause__, PijazCircuitOpenError)
+    self.assertEqual(self.stub.getCounts()['render-image'], 2)
+    time.sleep(0.3)
+    self.assertEqual(product.fetchBytes({'size': 100}), self.stub.payload(100))
+    self.assertEqual(circuitBreaker.getState(host), PijazCircuitBreaker.CLOSED)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,108 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from pijaz.product import PijazProduct
+from pijaz.server_manager import PijazServerManager
+from pijaz.token_cache import PijazTokenCache
+from stub_server import PijazStubServer
+
+class PijazTokenCacheTest(unittest.TestCase):
+
+  def testTokensAreRetiredBeforeTheyExpire(self):
+    cache = PijazTokenCache({'refreshFuzzSeconds': 10})
+    now = time.time()
+    accessInfo = {'token': 't', 'timestamp': now - 75, 'lifetime': 100}
+    self.assertTrue(cache.isValid(accessInfo))
+    self.assertFalse(cache.needsRefresh(accessInfo, now))
+    self.assertTrue(cache.needsRefresh(accessInfo, now + 6))
+    self.assertAlmostEqual(cache.refreshTimestamp(accessInfo), now + 5)
+    accessInfo['timestamp'] = now - 91
+    self.assertFalse(cache.isValid(accessInfo))
+
+  def testPinnedTokenStaysRefreshed(self):
+    cache = PijazTokenCache({'refreshFuzzSeconds': 1})
+    fetches = []
+
+    def fetch():
+      fetches.append(True)
+      return {'token': 't%d' % len(fetches), 'timestamp': time.time(), 'lifetime': 2}
+
+    key = cache.buildKey('workflow')
+    cache.pin(key, fetch)
+    for i in range(12):
+      time.sleep(0.5)
+      self.assertIsNotNone(cache.get(key))
+    self.assertGreaterEqual(len(fetches), 4)
+    cache.unpin(key)
+
+class PijazServerManagerTokenTest(unittest.TestCase):
+
+  def setUp(self):
+    self.stub = PijazStubServer({'tokenDelay': 0.2}).start()
+
+  def tearDown(self):
+    self.stub.stop()
+
+  def buildServer(self, inParameters=None):
+    return PijazServerManager(dict({
+      'appId': 'test',
+      'apiKey': 'test',
+      'apiServer': self.stub.getUrl(),
+      'renderServer': self.stub.getUrl(),
+    }, **(inParameters or {})))
+
+  def buildProduct(self, server, workflow='workflow', xml=None):
+    return PijazProduct({
+      'serverManager': server,
+      'workflowId': workflow,
+      'renderParameters': {'xml': xml} if xml else {},
+    })
+
+  def testConcurrentRequestsShareOneToken(self):
+    server = self.buildServer()
+    urls = []
+
+    def generate():
+      urls.append(self.buildProduct(server).generateUrl({'message': 'hello'}))
+
+    threads = [threading.Thread(target=generate) for i in range(16)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(len(set(urls)), 1)
+    self.assertEqual(self.stub.getCounts()['get-token'], 1)
+
+  def testTokensAreKeyedByWorkflowAndXml(self):
+    server = self.buildServer()
+    self.buildProduct(server).generateUrl()
+    self.buildProduct(server).generateUrl()
+    self.buildProduct(server, xml='http://example.com/a.xml').generateUrl()
+    self.buildProduct(server, 'other').generateUrl()
+    self.assertEqual(self.stub.getCounts()['get-token'], 3)
+
+  def testLeastRecentlyUsedTokensAreEvicted(self):
+    server = self.buildServer({'tokenCacheSize': 2})
+    for workflow in ('a', 'b', 'a', 'c', 'a', 'b'):
+      self.buildProduct(server, workflow).generateUrl()
+    # b was evicted by c, a was kept as the most recently used.
+    self.assertEqual(self.stub.getCounts()['get-token'], 4)
+    self.assertEqual(len(server.getTokenCache()), 2)
+
+  def testExpiredTokensAreReplaced(self):
+    self.stub.tokenLifetime = 2
+    self.stub.tokenDelay = 0
+    server = self.buildServer({'refreshFuzzSeconds': 0})
+    product = self.buildProduct(server)
+    url = product.generateUrl()
+    time.sleep(2.1)
+    self.assertNotEqual(product.generateUrl(), url)
+    self.assertEqual(self.stub.getCounts()['get-token'], 2)
+
+if __name__ == '__main__':
+  unittest.main()
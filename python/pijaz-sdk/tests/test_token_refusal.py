@@ -0,0 +1,71 @@
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from pijaz.async_product import AsyncPijazProduct
+from pijaz.async_server_manager import AsyncPijazServerManager
+from pijaz.exceptions import PijazApiError, PijazError
+from pijaz.product import PijazProduct
+from pijaz.server_manager import PijazServerManager
+from stub_server import PijazStubServer
+
+class PijazTokenRefusalTest(unittest.TestCase):
+
+  def setUp(self):
+    self.stub = PijazStubServer({
+      'tokenResultNum': 3,
+      'tokenResultText': 'Unknown workflow',
+    }).start()
+
+  def tearDown(self):
+    self.stub.stop()
+
+  def buildProduct(self, managerClass, productClass):
+    server = managerClass({
+      'appId': 'test',
+      'apiKey': 'test',
+      'apiServer': self.stub.getUrl(),
+      'renderServer': self.stub.getUrl(),
+    })
+    return productClass({
+      'serverManager': server,
+      'workflowId': 'refused-workflow',
+    })
+
+  def testGenerateUrlRaisesApiError(self):
+    product = self.buildProduct(PijazServerManager, PijazProduct)
+    with self.assertRaises(PijazApiError) as context:
+      product.generateUrl()
+    self.assertIn('Unknown workflow', str(context.exception))
+
+  def testDownloadsRaiseTypedErrors(self):
+    product = self.buildProduct(PijazServerManager, PijazProduct)
+    with self.assertRaises(PijazError):
+      product.fetchBytes()
+    with tempfile.TemporaryDirectory() as directory:
+      with self.assertRaises(PijazError):
+        product.saveToFile(os.path.join(directory, 'image.jpg'))
+    self.assertEqual(self.stub.getCounts()['render-image'], 0)
+
+  def testAsyncDownloadsRaiseTypedErrors(self):
+    product = self.buildProduct(AsyncPijazServerManager, AsyncPijazProduct)
+
+    async def run():
+      try:
+        with self.assertRaises(PijazApiError) as context:
+          await product.generateUrl()
+        self.assertIn('Unknown workflow', str(context.exception))
+        with self.assertRaises(PijazError):
+          await product.fetchBytes()
+      finally:
+        await product.serverManager.close()
+
+    asyncio.run(run())
+    self.assertEqual(self.stub.getCounts()['render-image'], 0)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,174 @@
+import fnmatch
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from pijaz.product import PijazProduct
+from pijaz.server_manager import PijazServerManager
+from pijaz.token_cache import PijazTokenCache
+from pijaz.token_store import PijazKeyValueTokenStore, PijazSqliteTokenStore, fcntl
+from stub_server import PijazStubServer
+
+class _MemoryClient(object):
+  """
+    Thread-safe in-memory stand-in for a redis.Redis client, without eval().
+  """
+
+  def __init__(self):
+    self.values = {}
+    self.lock = threading.Lock()
+
+  def delete(self, name):
+    with self.lock:
+      self.values.pop(name, None)
+
+  def get(self, name):
+    with self.lock:
+      return self.__get(name)
+
+  def scan_iter(self, match=None):
+    with self.lock:
+      names = list(self.values)
+    return [name for name in names if match is None or fnmatch.fnmatchcase(name, match)]
+
+  def set(self, name, value, ex=None, nx=False):
+    with self.lock:
+      if nx and self.__get(name) is not None:
+        return None
+      self.values[name] = (value, time.time() + ex if ex is not None else None)
+      return True
+
+  def __get(self, name):
+    value, expires = self.values.get(name, (None, None))
+    if expires is not None and time.time() >= expires:
+      del self.values[name]
+      return None
+    return value
+
+def holdLocks(store, markerPath, threads, iterations):
+  """
+    Take the store lock of one key repeatedly from several threads, and fail
+    if another holder is seen inside the lock.
+  """
+  key = PijazTokenCache.buildKey('workflow')
+  errors = []
+
+  def run():
+    for i in range(iterations):
+      with store.lock(key):
+        try:
+          os.close(os.open(markerPath, os.O_CREAT | os.O_EXCL))
+        except FileExistsError:
+          errors.append(True)
+          continue
+        time.sleep(0.005)
+        os.unlink(markerPath)
+
+  workers = [threading.Thread(target=run) for i in range(threads)]
+  for worker in workers:
+    worker.start()
+  for worker in workers:
+    worker.join()
+  return len(errors)
+
+def holdLocksInProcess(store, markerPath, threads, iterations):
+  os._exit(1 if holdLocks(store, markerPath, threads, iterations) else 0)
+
+@unittest.skipIf(fcntl is None, "byte-range locks are not supported")
+class PijazSqliteTokenStoreLockTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.store = PijazSqliteTokenStore({'path': os.path.join(self.directory, 'tokens.db')})
+    self.markerPath = os.path.join(self.directory, 'held')
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def testLockIsExclusiveAcrossThreadsAndProcesses(self):
+    # Taken once before forking, so the children inherit the lock file.
+    with self.store.lock(PijazTokenCache.buildKey('workflow')):
+      pass
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=holdLocksInProcess, args=(self.store, self.markerPath, 2, 20))
+      for i in range(2)]
+    for process in processes:
+      process.start()
+    errors = holdLocks(self.store, self.markerPath, 2, 20)
+    for process in processes:
+      process.join()
+      self.assertEqual(process.exitcode, 0)
+    self.assertEqual(errors, 0)
+
+class PijazTokenStoreTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.stub = PijazStubServer({'tokenDelay': 0.2}).start()
+
+  def tearDown(self):
+    self.stub.stop()
+    shutil.rmtree(self.directory)
+
+  def buildStores(self):
+    return [
+      PijazSqliteTokenStore({'path': os.path.join(self.directory, 'tokens.db')}),
+      PijazKeyValueTokenStore({'client': _MemoryClient()}),
+    ]
+
+  def testStoresKeepTokensUntilTheyExpire(self):
+    key = PijazTokenCache.buildKey('workflow', 'http://example.com/a.xml')
+    for store in self.buildStores():
+      accessInfo = {'timestamp': time.time(), 'lifetime': 60, 'renderAccessParameters': {'token': 't'}}
+      store.set(key, accessInfo)
+      self.assertEqual(store.get(key), accessInfo)
+      store.remove(key)
+      self.assertIsNone(store.get(key))
+      store.set(key, accessInfo)
+      store.clear()
+      self.assertIsNone(store.get(key))
+      store.set(key, dict(accessInfo, timestamp=time.time() - 61))
+      self.assertIsNone(store.get(key))
+
+  def testServerManagersShareTokensThroughTheStore(self):
+    for store in self.buildStores():
+      before = self.stub.getCounts()['get-token']
+      urls = []
+
+      def generate():
+        server = PijazServerManager({
+          'appId': 'test',
+          'apiKey': 'test',
+          'apiServer': self.stub.getUrl(),
+          'renderServer': self.stub.getUrl(),
+          'tokenStore': store,
+        })
+        urls.append(PijazProduct({'serverManager': server, 'workflowId': 'workflow'}).generateUrl())
+
+      threads = [threading.Thread(target=generate) for i in range(4)]
+      for thread in threads:
+        thread.start()
+      for thread in threads:
+        thread.join()
+      self.assertEqual(len(set(urls)), 1)
+      self.assertEqual(self.stub.getCounts()['get-token'] - before, 1)
+
+  def testKeyValueLocksAreOnlyReleasedByTheirHolder(self):
+    client = _MemoryClient()
+    store = PijazKeyValueTokenStore({'client': client, 'lockTimeout': 1})
+    key = PijazTokenCache.buildKey('workflow')
+    name = store.prefix + 'lock:' + store.buildName(key)
+    with store.lock(key):
+      # The holder ran past the lock timeout, and another process took over.
+      client.set(name, 'other', ex=30)
+    self.assertEqual(client.get(name), 'other')
+
+if __name__ == '__main__':
+  unittest.main()
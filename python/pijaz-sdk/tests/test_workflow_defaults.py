@@ -0,0 +1,52 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pijaz.workflow_defaults import PijazWorkflowDefaults
+
+DEFINITION = b'''<?xml version="1.0"?>
+<workflow>
+  <parameter name="message" default="hello"/>
+  <parameter name="color" default="black"/>
+</workflow>
+'''
+
+class _RecordingSession(object):
+
+  def __init__(self):
+    self.urls = []
+
+  def get(self, url, timeout=None):
+    self.urls.append(url)
+    raise IOError("not fetched in tests")
+
+class PijazWorkflowDefaultsTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.path = os.path.join(self.directory, 'workflow.xml')
+    with open(self.path, 'wb') as f:
+      f.write(DEFINITION)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def testReadsConfiguredDefinitions(self):
+    defaults = PijazWorkflowDefaults({'directory': self.directory})
+    self.assertEqual(defaults.get('workflow'), {'message': 'hello', 'color': 'black'})
+
+  def testNeverReadsXmlAsLocalPath(self):
+    defaults = PijazWorkflowDefaults({'allowRemote': True})
+    self.assertEqual(defaults.get('other', self.path), {})
+    self.assertEqual(defaults.get('other', 'file://' + self.path), {})
+
+  def testFetchesXmlUrlsOnlyWhenAllowed(self):
+    session = _RecordingSession()
+    PijazWorkflowDefaults({'httpSession': session}).get('other', 'http://example.com/workflow.xml')
+    self.assertEqual(session.urls, [])
+    PijazWorkflowDefaults({'httpSession': session, 'allowRemote': True}).get('other', 'http://example.com/workflow.xml')
+    self.assertEqual(session.urls, ['http://example.com/workflow.xml'])
+
+if __name__ == '__main__':
+  unittest.main()